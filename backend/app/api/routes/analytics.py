@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Annotated, Optional
+from datetime import date, datetime, timezone
+from app.dependencies import get_current_user
+from app.models.analytics import RollingSpend, BurnRate, CategoryTrends, Anomalies
+from app.services import analytics
+
+router = APIRouter()
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+@router.get("/rolling/", response_model=RollingSpend)
+async def get_rolling_spend(
+    user: Annotated[dict, Depends(get_current_user)],
+    window: Annotated[int, Query(ge=1, le=365)] = 30,
+    days: Annotated[int, Query(ge=1, le=3660)] = 90,
+    end: Optional[date] = None,
+):
+    """Daily spending with its trailing `window`-day average"""
+    try:
+        columns = await analytics.load_columns(user["uid"])
+        return analytics.rolling_spend(columns, window, end or _today(), days)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error computing rolling spend: {str(e)}")
+
+@router.get("/burnRate/", response_model=BurnRate)
+async def get_burn_rate(
+    user: Annotated[dict, Depends(get_current_user)],
+    budget: Annotated[float, Query(gt=0)],
+):
+    """How fast this month's budget is being spent"""
+    try:
+        columns = await analytics.load_columns(user["uid"])
+        return analytics.burn_rate(columns, budget, _today())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error computing burn rate: {str(e)}")
+
+@router.get("/trends/", response_model=CategoryTrends)
+async def get_category_trends(
+    user: Annotated[dict, Depends(get_current_user)],
+    months: Annotated[int, Query(ge=1, le=120)] = 6,
+):
+    """Monthly spending per category with a linear trend"""
+    try:
+        columns = await analytics.load_columns(user["uid"])
+        return analytics.category_trends(columns, months, _today())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error computing category trends: {str(e)}")
+
+@router.get("/anomalies/", response_model=Anomalies)
+async def get_anomalies(
+    user: Annotated[dict, Depends(get_current_user)],
+    threshold: Annotated[float, Query(gt=0)] = 3.0,
+):
+    """Expenses unusually large for their category"""
+    try:
+        columns = await analytics.load_columns(user["uid"])
+        return analytics.anomalies(columns, threshold)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error finding anomalies: {str(e)}")
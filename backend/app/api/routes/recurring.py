@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Annotated, List
+import logging
+from app.dependencies import get_current_user
+from app.models.recurring import RecurringRuleCreate, RecurringRuleResponse
+from app.services.recurring import RuleNotFound, create_rule, delete_rule, get_rules, update_rule
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/", response_model=List[RecurringRuleResponse])
+async def list_rules(user: Annotated[dict, Depends(get_current_user)]):
+    """The authenticated user's recurring rules, the next to run first"""
+    try:
+        return await get_rules(user["uid"])
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching recurring rules: {str(e)}"
+        )
+
+@router.post("/", response_model=RecurringRuleResponse, status_code=status.HTTP_201_CREATED)
+async def add_rule(rule: RecurringRuleCreate, user: Annotated[dict, Depends(get_current_user)]):
+    """Create a recurring rule.
+
+    Occurrences from ``date`` through today are created straight away,
+    later ones on the day they fall due. Each has the id
+    ``rec_<rule id>_<YYYY-MM-DD>``.
+    """
+    try:
+        return await create_rule(user["uid"], rule.model_dump())
+    except Exception as e:
+        logger.exception("Error creating recurring rule")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error creating recurring rule: {str(e)}"
+        )
+
+@router.put("/{rule_id}/", response_model=RecurringRuleResponse)
+async def set_rule(rule_id: str, rule: RecurringRuleCreate, user: Annotated[dict, Depends(get_current_user)]):
+    """Replace a recurring rule; transactions it already created are kept"""
+    try:
+        return await update_rule(user["uid"], rule_id, rule.model_dump())
+    except RuleNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        logger.exception("Error updating recurring rule", extra={"rule_id": rule_id})
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error updating recurring rule: {str(e)}"
+        )
+
+@router.delete("/{rule_id}/", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_rule(rule_id: str, user: Annotated[dict, Depends(get_current_user)]):
+    """Stop a recurring rule; transactions it already created are kept"""
+    try:
+        await delete_rule(user["uid"], rule_id)
+    except RuleNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error deleting recurring rule: {str(e)}"
+        )
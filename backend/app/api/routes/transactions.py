@@ -1,34 +1,306 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Annotated, List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, UploadFile, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Annotated, Any, List, Literal, Optional, Union
+import hashlib
+import logging
+import os
+import orjson
+import time
+from datetime import datetime, timezone
+from app.config import get_settings
 from app.dependencies import get_current_user
-from app.models.transaction import TransactionResponse, TransactionCreate
-from app.services.firestore_service import get_user_transactions, get_updated_transactions, create_transaction, update_transaction, remove_transaction
+from app.services.change_feed import ListenerLimit, change_feed
+from app.models.transaction import TransactionResponse, TransactionCreate, TransactionPage, TransactionChanges, TransactionBatchRequest, TransactionBatchResponse, TransactionSummary, TransactionImport
+from app.services.importer import ImportBusy, ImportFileError, ImportTooLarge, get_import_job, start_import
+from app.services.storage import TransactionConflict, TransactionNotFound
+from app.services.firestore_service import get_user_transactions, stream_user_transactions, get_transactions_page, search_transactions, get_updated_transactions, get_transaction_changes, get_transactions_version, decode_sync_token, live_sync_token, create_transaction, update_transaction, remove_transaction, apply_transaction_batch, get_transaction_summary
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Transactions read back from storage already have the response shape, so the
+# read endpoints return them in an ORJSONResponse: FastAPI then skips
+# validating and re-encoding every row against the response_model, which
+# stays on the route for the OpenAPI schema.
+
+async def _collection_etag(uid: str, *variant) -> str:
+    """An ETag for the user's transactions as of now.
+
+    ``variant`` holds the query parameters that shape the response, so
+    different pages of the same version get different tags.
+    """
+    version = await get_transactions_version(uid)
+    if variant:
+        digest = hashlib.sha256(repr(variant).encode()).hexdigest()[:16]
+        # Weak: the same version can be sent gzipped or not
+        return f'W/"{version}-{digest}"'
+    return f'W/"{version}"'
+
+def _not_modified(if_none_match: Optional[str], etag: str) -> Optional[Response]:
+    """A 304 if the client already holds ``etag``"""
+    if if_none_match is None:
+        return None
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return None
+
 @router.get("/", response_model=List[TransactionResponse])
 async def get_transactions(
-    user: Annotated[dict, Depends(get_current_user)]
+    user: Annotated[dict, Depends(get_current_user)],
+    format: Literal["json", "ndjson"] = "json",
+    if_none_match: Annotated[Optional[str], Header()] = None,
 ):
-    """Get all transactions for the authenticated user"""
+    """Get all transactions for the authenticated user.
+
+    With ``format=ndjson`` the response is streamed one transaction per line
+    as Firestore yields them, so memory use does not grow with history size.
+
+    Responses carry an ETag that changes with every write to the user's
+    transactions; send it back as If-None-Match to get a 304 instead.
+    """
+    etag = await _collection_etag(user["uid"], format)
+    not_modified = _not_modified(if_none_match, etag)
+    if not_modified:
+        return not_modified
+
+    if format == "ndjson":
+        return StreamingResponse(
+            _ndjson_lines(user["uid"]),
+            media_type="application/x-ndjson",
+            headers={"ETag": etag},
+        )
     try:
         transactions = await get_user_transactions(user["uid"])
-        return transactions
+        return ORJSONResponse(transactions, headers={"ETag": etag})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching transactions: {str(e)}")
+
+async def _ndjson_lines(uid: str):
+    async for transaction in stream_user_transactions(uid):
+        yield orjson.dumps(transaction) + b"\n"
+
+@router.get("/page/", response_model=TransactionPage)
+async def get_transactions_page_endpoint(
+    user: Annotated[dict, Depends(get_current_user)],
+    limit: Annotated[int, Query(ge=1, le=500)] = 50,
+    after: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+):
+    """Get one page of transactions, newest first, using an opaque cursor"""
+    etag = await _collection_etag(user["uid"], limit, after)
+    not_modified = _not_modified(if_none_match, etag)
+    if not_modified:
+        return not_modified
+    try:
+        items, next_cursor = await get_transactions_page(user["uid"], limit, after)
+        return ORJSONResponse({"items": items, "next_cursor": next_cursor}, headers={"ETag": etag})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching transactions: {str(e)}")
 
-@router.get("/updated/")
+_DATE = r"^\d{4}-\d{2}-\d{2}$"
+
+@router.get("/search/", response_model=TransactionPage)
+async def search_transactions_endpoint(
+    user: Annotated[dict, Depends(get_current_user)],
+    q: Annotated[Optional[str], Query(max_length=200)] = None,
+    type: Optional[Literal["expense", "income"]] = None,
+    category: Optional[str] = None,
+    date_from: Annotated[Optional[str], Query(pattern=_DATE)] = None,
+    date_to: Annotated[Optional[str], Query(pattern=_DATE)] = None,
+    min_amount: Annotated[Optional[float], Query(ge=0, allow_inf_nan=False)] = None,
+    max_amount: Annotated[Optional[float], Query(ge=0, allow_inf_nan=False)] = None,
+    limit: Annotated[int, Query(ge=1, le=500)] = 50,
+    after: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+):
+    """Search the authenticated user's transactions, newest first, using an opaque cursor.
+
+    Every word of ``q`` must start a word of the description, so
+    ``q=gro mar`` finds "Groceries at the market". ``date_from`` and
+    ``date_to`` (YYYY-MM-DD) and the amounts, in major units, are
+    inclusive. Deleted transactions are never returned.
+
+    A page may come back with fewer than ``limit`` items and a
+    ``next_cursor`` when a search without ``q`` had to read many
+    transactions to find them; keep following the cursor until it is null.
+    """
+    etag = await _collection_etag(user["uid"], q, type, category, date_from, date_to, min_amount, max_amount, limit, after)
+    not_modified = _not_modified(if_none_match, etag)
+    if not_modified:
+        return not_modified
+    try:
+        items, next_cursor = await search_transactions(
+            user["uid"], limit, after,
+            text=q,
+            filters={"type": type, "category": category, "date_from": date_from, "date_to": date_to},
+            min_amount=min_amount,
+            max_amount=max_amount,
+        )
+        return ORJSONResponse({"items": items, "next_cursor": next_cursor}, headers={"ETag": etag})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error searching transactions")
+        raise HTTPException(status_code=500, detail=f"Error searching transactions: {str(e)}")
+
+@router.get("/summary/", response_model=TransactionSummary)
+async def get_summary(
+    user: Annotated[dict, Depends(get_current_user)],
+    start: Annotated[Optional[str], Query(pattern=r"^\d{4}-(0[1-9]|1[0-2])$")] = None,
+    end: Annotated[Optional[str], Query(pattern=r"^\d{4}-(0[1-9]|1[0-2])$")] = None,
+):
+    """Income/expense totals per month and category, from precomputed monthly rollups.
+
+    ``start`` and ``end`` are inclusive YYYY-MM months; by default the
+    twelve months ending with the current one.
+    """
+    if end is None:
+        end = datetime.now(timezone.utc).strftime("%Y-%m")
+    if start is None:
+        year, month = map(int, end.split("-"))
+        first = year * 12 + month - 1 - 11
+        start = f"{first // 12:04d}-{first % 12 + 1:02d}"
+    try:
+        return await get_transaction_summary(user["uid"], start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching summary: {str(e)}")
+
+@router.get("/updated/", response_model=Union[TransactionChanges, List[TransactionResponse]])
 async def get_updated_transactions_endpoint(
     user: Annotated[dict, Depends(get_current_user)],
-    last_sync: int = 0,
+    sync_token: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 500,
+    last_sync: Optional[int] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
 ):
-    """Get transactions updated after last_sync timestamp"""
+    """Get the transactions changed since the last sync, a page at a time.
+
+    Send back the ``sync_token`` from the previous response, or none to
+    start from scratch, and keep calling while ``has_more`` is true.
+    Deletions arrive as transactions with ``deleted_at`` set.
+
+    The deprecated ``last_sync`` (client milliseconds) returns a plain,
+    unpaged list of everything updated after it.
+
+    The last page (``has_more`` false) carries an ETag. Polling with its
+    sync_token and If-None-Match set to that ETag gets a 304, without
+    querying transactions, while nothing has changed.
+    """
     try:
-        transactions = await get_updated_transactions(user["uid"], last_sync)
-        return transactions
+        if last_sync is not None and sync_token is None:
+            etag = await _collection_etag(user["uid"], last_sync)
+            not_modified = _not_modified(if_none_match, etag)
+            if not_modified:
+                return not_modified
+            return ORJSONResponse(await get_updated_transactions(user["uid"], last_sync), headers={"ETag": etag})
+
+        # Tokens move with every response, so the tag is the version alone;
+        # a sync from scratch always gets data
+        etag = await _collection_etag(user["uid"])
+        if sync_token:
+            not_modified = _not_modified(if_none_match, etag)
+            if not_modified:
+                return not_modified
+        changes = await get_transaction_changes(user["uid"], limit, sync_token)
+        headers = {} if changes["has_more"] else {"ETag": etag}
+        return ORJSONResponse(changes, headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+# Changes read per event while a stream catches up from its sync token
+STREAM_CATCH_UP_PAGE = 500
+
+# How long an EventSource waits before reconnecting after a stream ends
+STREAM_RETRY_MS = 3000
+
+def _event(name: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    """One Server-Sent Event"""
+    head = f"id: {event_id}\nevent: {name}\n" if event_id else f"event: {name}\n"
+    return head.encode() + b"data: " + orjson.dumps(data) + b"\n\n"
+
+async def _change_events(uid: str, sync_token: Optional[str]):
+    settings = get_settings()
+    yield f"retry: {STREAM_RETRY_MS}\n\n".encode()
+    try:
+        subscription = change_feed.subscribe(uid)
+    except ListenerLimit:
+        # Lost the race for the last feed since the endpoint checked; try again later
+        yield f"retry: {int(settings.stream_heartbeat_seconds * 1000)}\n\n".encode()
+        return
+    try:
+        # Catch up first. The subscription already queues live changes, so
+        # nothing written meanwhile is missed; some may arrive twice
+        while True:
+            changes = await get_transaction_changes(uid, STREAM_CATCH_UP_PAGE, sync_token)
+            if changes["full_resync_required"]:
+                yield _event("resync", {})
+                return
+            sync_token = changes["sync_token"]
+            yield _event("changes", changes["items"], sync_token)
+            if not changes["has_more"]:
+                break
+
+        deadline = time.monotonic() + settings.stream_max_seconds
+        while time.monotonic() < deadline:
+            transactions = await subscription.get(settings.stream_heartbeat_seconds)
+            if subscription.overflowed:
+                # Changes were dropped; the client resumes from its last event id
+                return
+            if transactions is None:
+                yield b": heartbeat\n\n"
+            else:
+                yield _event("changes", transactions, live_sync_token())
+    finally:
+        change_feed.unsubscribe(uid, subscription)
+
+@router.get("/stream/")
+async def stream_changes(
+    user: Annotated[dict, Depends(get_current_user)],
+    sync_token: Optional[str] = None,
+    last_event_id: Annotated[Optional[str], Header()] = None,
+):
+    """Push changes to the user's transactions as Server-Sent Events.
+
+    The stream starts from ``sync_token`` (as from ``/updated/``), or from
+    the Last-Event-ID an EventSource sends when it reconnects, or from
+    scratch. Changes already made arrive first, a page per event, then
+    new ones as they are written; each ``changes`` event holds a list of
+    transactions (deletions have ``deleted_at`` set) and has the sync
+    token to resume from as its id. Transactions may arrive more than
+    once. A ``resync`` event means the token is too old: drop the local
+    copy and connect again without one.
+
+    Comments are sent as heartbeats while nothing changes. The server
+    ends every stream after a while, and earlier if the client falls
+    behind; reconnect with the last event id.
+    """
+    sync_token = last_event_id or sync_token
+    if sync_token:
+        try:
+            decode_sync_token(sync_token)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not change_feed.has_room(user["uid"]):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many streams open; poll /updated/ or retry later",
+            headers={"Retry-After": "30"},
+        )
+    return StreamingResponse(
+        _change_events(user["uid"], sync_token),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
 async def add_transaction(
     transaction: TransactionCreate,
@@ -42,22 +314,115 @@ async def add_transaction(
         )
         return created_transaction
         
+    except TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating transaction: {str(e)}"
         )
+@router.post("/batch/", response_model=TransactionBatchResponse)
+async def batch_transactions(
+    batch: TransactionBatchRequest,
+    user: Annotated[dict, Depends(get_current_user)]
+):
+    """Apply many queued create/update/delete operations in one request.
+
+    Operations are committed in Firestore write batches, in order, and the
+    response carries one result per operation.
+    """
+    try:
+        operations = [
+            {
+                "op": operation.op,
+                "id": operation.id,
+                "transaction": operation.transaction.model_dump() if operation.transaction else None,
+            }
+            for operation in batch.operations
+        ]
+        results = await apply_transaction_batch(uid=user["uid"], operations=operations)
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error applying transaction batch: {str(e)}"
+        )
+
+_IMPORT_FORMATS = {".csv": "csv", ".ofx": "ofx", ".qfx": "ofx"}
+
+@router.post("/import/", response_model=TransactionImport, status_code=status.HTTP_202_ACCEPTED)
+async def import_transactions(
+    file: UploadFile,
+    user: Annotated[dict, Depends(get_current_user)],
+    format: Optional[Literal["csv", "ofx"]] = None,
+):
+    """Import a CSV or OFX bank export in the background.
+
+    ``format`` defaults to the file's extension. CSV files need a header
+    row with ``date`` (YYYY-MM-DD) and ``amount`` columns, and may have
+    ``type``, ``category``, ``description`` and ``currency``; negative
+    amounts without a type are expenses. Rows already imported are
+    skipped, so a file can safely be uploaded again.
+
+    Returns the job at once; poll ``/import/{job_id}/`` for progress.
+    """
+    if format is None:
+        format = _IMPORT_FORMATS.get(os.path.splitext(file.filename or "")[1].lower())
+        if format is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pass format=csv or format=ofx")
+    try:
+        job = await start_import(user["uid"], format, file.file)
+    except ImportBusy as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e), headers={"Retry-After": "30"})
+    except ImportTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except ImportFileError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return job.to_dict()
+
+@router.get("/import/{job_id}/", response_model=TransactionImport)
+async def get_import(job_id: str, user: Annotated[dict, Depends(get_current_user)]):
+    """Progress of an import started by the authenticated user"""
+    job = get_import_job(user["uid"], job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import not found")
+    return job.to_dict()
+
+def _expected_updated_at(if_match: Optional[str]) -> Optional[int]:
+    """The updated_at a client sent in If-Match, quoted or bare"""
+    if if_match is None:
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="If-Match must be the transaction's updated_at")
+
 @router.put("/{transaction_id}/", status_code=status.HTTP_200_OK) 
-async def set_transaction(transaction: TransactionCreate,
-    user: Annotated[dict, Depends(get_current_user)]):
+async def set_transaction(transaction_id: str,
+    transaction: TransactionCreate,
+    user: Annotated[dict, Depends(get_current_user)],
+    if_match: Annotated[Optional[str], Header()] = None):
+    """Update a transaction of the authenticated user.
+
+    Send the transaction's ``updated_at`` as If-Match to have the update
+    rejected with 409 when someone else changed it first.
+    """
+    if transaction.id != transaction_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Transaction id in the body doesn't match the URL")
+    expected_updated_at = _expected_updated_at(if_match)
     try:
         updated_transaction = await update_transaction(
             uid=user["uid"],
-            transaction_data=transaction.model_dump()
+            transaction_data=transaction.model_dump(),
+            expected_updated_at=expected_updated_at,
         )
         return updated_transaction
+    except TransactionNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except Exception as e:
-        print(f"Error updating transaction: {str(e)}")
+        logger.exception("Error updating transaction", extra={"transaction_id": transaction.id})
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error updating transaction: {str(e)}"
@@ -66,13 +431,19 @@ async def set_transaction(transaction: TransactionCreate,
 @router.delete("/{transaction_id}/", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_transaction( 
     transaction_id: str,
-    user: Annotated[dict, Depends(get_current_user)]
+    user: Annotated[dict, Depends(get_current_user)],
+    if_match: Annotated[Optional[str], Header()] = None,
 ):
     """Delete a transaction for the authenticated user"""
+    expected_updated_at = _expected_updated_at(if_match)
     try:
-        await remove_transaction(transaction_id=transaction_id, uid=user["uid"])
+        await remove_transaction(transaction_id=transaction_id, uid=user["uid"], expected_updated_at=expected_updated_at)
+    except TransactionNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except TransactionConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error deleting transaction: {str(e)}"
-        )
\ No newline at end of file
+        )
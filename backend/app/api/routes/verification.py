@@ -1,31 +1,82 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import Annotated
+import logging
 from app.dependencies import get_current_user, get_reset_user, generate_reset_token
+from app.log import bind_uid
+from app.services.hashing import hashing_pool, HashingPoolBusy
+from app.services.outbox import OutboxFull, mail_outbox
+from app.services.rate_limit import RateLimited, code_email_limiter, code_uid_limiter
 from app.services.firestore_service import store_code, get_code_data, mark_email_verified, store_user_pin, get_user_pin_hash, send_email, delete_code_field, get_user_by_email, set_new_password
-import bcrypt
 import random
 from datetime import datetime, timezone
 # from app.services.email_service import send_email  # if you separate email logic
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+def _hashing_busy() -> HTTPException:
+    """503 returned when the bcrypt pool is saturated, instead of queueing the request"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please try again shortly.",
+        headers={"Retry-After": "1"},
+    )
+
+def _outbox_full() -> HTTPException:
+    """503 returned when the mail outbox is backed up"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please try again shortly.",
+        headers={"Retry-After": "5"},
+    )
+
+def _limit_code_requests(email: str | None = None, uid: str | None = None) -> None:
+    """Take a token from the email's and the uid's buckets, or fail with 429.
+
+    Runs before the code is hashed or anything is read or written, so a
+    client hammering these endpoints costs no bcrypt work and no I/O.
+    """
+    try:
+        if email:
+            code_email_limiter.acquire(email.strip().lower())
+        if uid:
+            code_uid_limiter.acquire(uid)
+    except RateLimited as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many codes requested, please try again later.",
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+
 @router.get("/sendVerificationCode/")
 async def send_verification_code(
     user: Annotated[dict, Depends(get_current_user)]
 ):
     """Generate a code, store it hashed in Firestore, and send it via email."""
     try:
-        # 1. Generate code
-        code = str(random.randint(100000, 999999))
+        # Hold a place for the mail first: a full outbox must not replace the
+        # code the user was last sent, nor spend their rate limit
+        with mail_outbox.reserve():
+            _limit_code_requests(email=user.get("email"), uid=user["uid"])
 
-        # 2. Store hashed code + expiry
-        await store_code(user["uid"], code, mode='verification')
+            # 1. Generate code
+            code = str(random.randint(100000, 999999))
 
-        # 3. Send email (replace with real service)
-        print(f"Sending verification code {code} to {user['email']}")  
-        await send_email(user["email"], code)
+            # 2. Store hashed code + expiry
+            await store_code(user["uid"], code, mode='verification')
+
+            # 3. Queue the email
+            logger.info("Sending verification code")
+            send_email(user["email"], code, reserved=True)
 
         return {"success": True, "message": "Verification code sent."}
+    except HTTPException:
+        raise
+    except HashingPoolBusy:
+        raise _hashing_busy()
+    except OutboxFull:
+        raise _outbox_full()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error sending verification code: {str(e)}")
 
@@ -37,7 +88,7 @@ async def verify_code(
 ):
     """Check the entered code against the hashed one in Firestore."""
     try:
-        stored = get_code_data(user["uid"], mode='verification')
+        stored = await get_code_data(user["uid"], mode='verification')
         if not stored:
             raise HTTPException(status_code=400, detail="No verification data found.")
 
@@ -46,7 +97,7 @@ async def verify_code(
             raise HTTPException(status_code=400, detail="Verification code expired.")
 
         # Match check
-        if not bcrypt.checkpw(code_data["code"].encode(), stored["code"].encode()):
+        if not await hashing_pool.check(code_data["code"], stored["code"]):
             raise HTTPException(status_code=400, detail="Invalid verification code.")
 
         # Mark verified
@@ -56,6 +107,8 @@ async def verify_code(
         return {"success": True, "message": "Email verified successfully."}
     except HTTPException:
         raise
+    except HashingPoolBusy:
+        raise _hashing_busy()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error verifying code: {str(e)}")
     
@@ -66,23 +119,34 @@ async def send_reset_code(request: dict):
         email = request.get("email")
         if not email:
             raise HTTPException(status_code=400, detail="Email is required")
-        
-        # 1. Generate code
-        code = str(random.randint(100000, 999999))
-        
-        # 2. Store hashed code + expiry
-        uid = get_user_by_email(email)
-        if uid is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        await store_code(uid, code, 'resetPassword')
-        
-        # 3. Send email (replace with real service)
-        print(f"Sending reset password code {code} to {email}")
-        await send_email(email, code)
+        # As in send_verification_code, hold the mail's place before anything else
+        with mail_outbox.reserve():
+            _limit_code_requests(email=email)
+
+            # 1. Generate code
+            code = str(random.randint(100000, 999999))
+
+            # 2. Store hashed code + expiry
+            uid = await get_user_by_email(email)
+            if uid is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            _limit_code_requests(uid=uid)
+
+            await store_code(uid, code, 'resetPassword')
+
+            # 3. Queue the email
+            bind_uid(uid)
+            logger.info("Sending reset password code")
+            send_email(email, code, reserved=True)
         
         return {"success": True, "message": "Reset password code sent."}
     
+    except HTTPException:
+        raise
+    except HashingPoolBusy:
+        raise _hashing_busy()
+    except OutboxFull:
+        raise _outbox_full()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error sending reset password code: {str(e)}")
 
@@ -96,11 +160,11 @@ async def verify_reset_code(request: dict):
         if not email or not code:
             raise HTTPException(status_code=400, detail="Email and code are required")
         
-        uid = get_user_by_email(email)
+        uid = await get_user_by_email(email)
         if uid is None:
             raise HTTPException(status_code=404, detail="User not found")
             
-        stored = get_code_data(uid, mode='resetPassword')
+        stored = await get_code_data(uid, mode='resetPassword')
         if not stored:
             raise HTTPException(status_code=400, detail="No reset password data found.")
             
@@ -109,7 +173,7 @@ async def verify_reset_code(request: dict):
             raise HTTPException(status_code=400, detail="Reset password code expired.")
             
         # Match check
-        if not bcrypt.checkpw(code.encode(), stored["code"].encode()):
+        if not await hashing_pool.check(code, stored["code"]):
             raise HTTPException(status_code=400, detail="Invalid reset password code.")
             
         # Generate reset token - THIS IS THE KEY PART
@@ -126,6 +190,8 @@ async def verify_reset_code(request: dict):
         
     except HTTPException:
         raise
+    except HashingPoolBusy:
+        raise _hashing_busy()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error verifying reset password code: {str(e)}")
 
@@ -162,6 +228,8 @@ async def set_pin(
     try:
         await store_user_pin(user["uid"], pin_data["pin"])
         return {"success": True, "message": "PIN set successfully."}
+    except HashingPoolBusy:
+        raise _hashing_busy()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error setting PIN: {str(e)}")
 
@@ -172,15 +240,17 @@ async def verify_pin(
 ):
     """Verify provided PIN matches stored hash."""
     try:
-        stored_hash = get_user_pin_hash(user["uid"])
+        stored_hash = await get_user_pin_hash(user["uid"])
         if not stored_hash:
             raise HTTPException(status_code=400, detail="PIN not set.")
 
-        if not bcrypt.checkpw(pin_data["pin"].encode(), stored_hash.encode()):
+        if not await hashing_pool.check(pin_data["pin"], stored_hash):
             raise HTTPException(status_code=400, detail="Invalid PIN.")
 
         return {"success": True, "message": "PIN verified."}
     except HTTPException:
         raise
+    except HashingPoolBusy:
+        raise _hashing_busy()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error verifying PIN: {str(e)}")
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
 import pathlib
 from functools import lru_cache
+from typing import Dict, Literal, Optional
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 
@@ -12,6 +13,127 @@ class Settings(BaseSettings):
     env: str = os.getenv("ENV", "development")
     frontend_url: str = "http://localhost:8081"
 
+    # "firestore" in production; "sqlite" runs everything on one box with no outside services
+    storage_backend: Literal["firestore", "sqlite"] = "firestore"
+    sqlite_path: str = str(basedir / "fiscus.db")
+
+    # Signs password reset tokens; required, checked when the app starts
+    jwt_secret_key: Optional[str] = None
+
+    # Before serving, open storage channels and fetch the token signing certs so the
+    # first requests don't pay for them; startup waits at most warm_up_timeout_seconds
+    warm_up: bool = False
+    warm_up_timeout_seconds: float = 10.0
+
+    # serve.py runs web_workers uvicorn processes (0: one per CPU core). With
+    # shared_cache_path set, caches and rate limits are kept in that SQLite file,
+    # best on tmpfs, so every worker on the host sees the same entries. A worker
+    # waits at most shared_cache_busy_timeout_ms for another's write lock before
+    # going without the shared entry
+    web_workers: int = 0
+    shared_cache_path: Optional[str] = None
+    shared_cache_busy_timeout_ms: float = 20.0
+
+    # Verified Firebase ID tokens are cached until their own exp, capped here
+    token_cache_size: int = 10_000
+    token_cache_max_ttl_seconds: int = 3600
+    # How often Google's token signing certs are re-fetched in the background
+    signing_certs_refresh_seconds: int = 1800
+
+    # Each user's transactions version (their ETag) is cached this long, so an
+    # unchanged poll costs no read; writes from other processes show up after it
+    transactions_version_cache_size: int = 10_000
+    transactions_version_cache_ttl_seconds: float = 2.0
+
+    # users/{uid} documents are cached for the verification and PIN flows;
+    # writes from other processes are seen once an entry's TTL runs out
+    user_doc_cache_size: int = 10_000
+    user_doc_cache_ttl_seconds: float = 30.0
+    user_doc_cache_max_bytes: int = 16 * 1024 * 1024
+
+    # Password reset looks users up by email in Firebase Auth; answers are cached,
+    # "no such user" for a shorter time
+    email_lookup_cache_size: int = 10_000
+    email_lookup_ttl_seconds: float = 300.0
+    email_lookup_negative_ttl_seconds: float = 60.0
+
+    # Text search holds an index of each searching user's transactions in process,
+    # for up to search_index_cache_size users, until search_index_ttl_seconds
+    # after their last search. A search without text reads at most
+    # search_max_scan transactions per page before returning what it found
+    search_index_cache_size: int = 1000
+    search_index_ttl_seconds: float = 900.0
+    search_max_scan: int = 5000
+
+    # /api/transactions/stream/ pushes changes as Server-Sent Events. A process
+    # holds a feed for at most stream_max_listeners users (a Firestore listener
+    # each, or a version poll every stream_poll_interval_seconds where storage
+    # can't push); more get a 503. Idle streams get a heartbeat every
+    # stream_heartbeat_seconds, a connection stream_queue_size batches behind is
+    # dropped, and streams end after stream_max_seconds for clients to reconnect
+    stream_max_listeners: int = 1000
+    stream_poll_interval_seconds: float = 2.0
+    stream_heartbeat_seconds: float = 15.0
+    stream_queue_size: int = 100
+    stream_max_seconds: float = 900.0
+
+    # Logs are JSON lines on stdout; levels listed in log_sample_rates keep only
+    # that fraction of records, e.g. LOG_SAMPLE_RATES='{"INFO": 0.1}'
+    log_level: str = "INFO"
+    log_sample_rates: Dict[str, float] = {}
+
+    # Responses at least this many bytes are gzipped for clients that accept it
+    gzip_minimum_size: int = 1024
+    gzip_compresslevel: int = 1  # ~2x the throughput of 6 for ~25% more bytes on transaction JSON
+
+    # Requests sent with "X-Profile: <profile_token>" are stack-sampled and the
+    # folded profile written to profile_dir; unset disables profiling
+    profile_token: Optional[str] = None
+    profile_interval_ms: float = 2.0
+    profile_dir: str = str(basedir / "profiles")
+
+    # Currency of every transaction and of summaries and analytics. Totals aren't
+    # kept per currency, so transactions in any other currency are rejected
+    default_currency: str = "USD"
+
+    # CSV/OFX imports: uploads up to import_max_bytes, written import_chunk_rows
+    # rows per batch; each user runs one import at a time, each process
+    # import_max_running, and finished jobs can be polled for import_job_ttl_seconds
+    import_max_bytes: int = 50 * 1024 * 1024
+    import_chunk_rows: int = 500
+    import_max_running: int = 4
+    import_job_ttl_seconds: float = 3600.0
+
+    # Recurring rules are turned into transactions by a background pass every
+    # recurring_interval_seconds (0 turns it off in this process), which reads due
+    # rules recurring_page_size at a time and creates at most
+    # recurring_max_catch_up occurrences per rule each pass
+    recurring_interval_seconds: float = 300.0
+    recurring_page_size: int = 500
+    recurring_max_catch_up: int = 1000
+
+    # Tombstones (soft-deleted transactions) are hard-deleted after this many days;
+    # sync tokens older than that get a full resync instead of a delta
+    tombstone_retention_days: int = 30
+
+    # Each email address and each uid may request code_rate_burst verification or
+    # reset codes at once, then code_rate_per_hour more; beyond that a 429
+    code_rate_burst: int = 3
+    code_rate_per_hour: float = 6.0
+    code_rate_max_keys: int = 100_000
+
+    # Mail is queued in process and written by a background task, up to
+    # mail_batch_size documents per write; a full queue gets a 503
+    mail_queue_size: int = 10_000
+    mail_batch_size: int = 100
+    mail_flush_interval_ms: float = 50.0
+
+    # bcrypt work runs on its own pool; jobs beyond workers + max_queue get a 503
+    bcrypt_rounds: int = 12
+    bcrypt_workers: int = max(1, (os.cpu_count() or 1) - 1)
+    bcrypt_max_queue: int = 32
+    bcrypt_executor: Literal["thread", "process"] = "thread"
+
 @lru_cache
 def get_settings() -> Settings:
     return Settings()
\ No newline at end of file
@@ -1,52 +1,78 @@
 # dependencies.py - Authentication and other dependencies
-import os
+import hashlib
+import time
 import jwt
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from firebase_admin import auth
 import logging
+from app.config import get_settings
+from app.log import bind_uid
+from app.services.firebase import firebase_auth
+from app.services.shared_cache import make_cache
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any
 
 logger = logging.getLogger(__name__)
 
-SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-
-if not SECRET_KEY:
-    raise ValueError("JWT_SECRET_KEY environment variable is required")
 RESET_TOKEN_EXPIRY_MINUTES = 15
 
 # Security scheme for Bearer token
 security = HTTPBearer()
 
+# Verified ID tokens keyed by SHA-256 of the raw token, so repeat requests
+# with the same token skip RSA verification entirely
+token_cache = make_cache("firebase_tokens", maxsize=get_settings().token_cache_size, local=True)
+
+def reset_token_key() -> str:
+    """Secret that signs password reset tokens; the lifespan checks it at startup"""
+    key = get_settings().jwt_secret_key
+    if not key:
+        raise ValueError("JWT_SECRET_KEY environment variable is required")
+    return key
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """
     Validate Firebase ID token and return user information
     """
+    # Extract token from Authorization header
+    token = credentials.credentials
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+
+    user = token_cache.get(cache_key)
+    if user is not None:
+        bind_uid(user["uid"])
+        return user
+
+    auth = firebase_auth()
     try:
-        # Extract token from Authorization header
-        token = credentials.credentials
+        # Verify the Firebase ID token (RSA check, and possibly a cert fetch) off the event loop
+        decoded_token = await run_in_threadpool(auth.verify_id_token, token)
         
-        # Verify the Firebase ID token
-        decoded_token = auth.verify_id_token(token)
-        
-        # Return user information
-        return {
+        user = {
             "uid": decoded_token["uid"],
             "email": decoded_token.get("email"),
             "name": decoded_token.get("name"),
             "picture": decoded_token.get("picture")
         }
+
+        # Never serve a cached token past its own expiry
+        ttl = min(decoded_token["exp"] - time.time(), get_settings().token_cache_max_ttl_seconds)
+        token_cache.set(cache_key, user, ttl)
+        bind_uid(user["uid"])
+
+        # Return user information
+        return user
         
     except auth.InvalidIdTokenError:
-        logger.error("Invalid Firebase ID token")
+        logger.warning("Invalid Firebase ID token")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication token",
             headers={"WWW-Authenticate": "Bearer"},
         )
     except Exception as e:
-        logger.error(f"Authentication error: {str(e)}")
+        logger.error("Authentication error", extra={"error": str(e)})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication failed",
@@ -63,13 +89,13 @@ def generate_reset_token(uid: str) -> str:
         'exp': datetime.now(timezone.utc) + timedelta(minutes=RESET_TOKEN_EXPIRY_MINUTES),
         'iat': datetime.now(timezone.utc)  # Issued at time
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+    return jwt.encode(payload, reset_token_key(), algorithm='HS256')
 
 def verify_reset_token(token: str) -> Dict[str, Any]:
     """Verify and decode a reset token"""
     try:
         # Decode the token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        payload = jwt.decode(token, reset_token_key(), algorithms=['HS256'])
         
         # Check if this is actually a reset token
         if payload.get('purpose') != 'password_reset':
@@ -0,0 +1,134 @@
+import asyncio
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from app.config import get_settings
+from app.log import request_id_var, uid_hash_var
+from app.services.metrics import http_request_duration, http_requests, http_requests_in_flight
+from app.services.profiler import StackSampler, write_folded
+
+logger = logging.getLogger(__name__)
+
+# Client-supplied request ids are kept only if they look like ids
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+class RequestContextMiddleware:
+    """Gives every request an id, logged with everything it does and echoed in X-Request-ID.
+
+    An incoming X-Request-ID (from a proxy or the app) is reused. One
+    "request" line with method, route, status and duration is logged when
+    the response finishes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                request_id = candidate if _REQUEST_ID.match(candidate) else None
+                break
+        request_id = request_id or uuid.uuid4().hex
+        request_token = request_id_var.set(request_id)
+        uid_token = uid_hash_var.set(None)
+
+        status_code = 500
+
+        async def send_with_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-request-id", request_id.encode())]}
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = scope.get("route")
+            logger.info("request", extra={
+                "method": scope["method"],
+                "route": getattr(route, "path", "unmatched"),
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            })
+            request_id_var.reset(request_token)
+            uid_hash_var.reset(uid_token)
+
+class MetricsMiddleware:
+    """Records latency, status code and in-flight count for every HTTP request.
+
+    Requests are labelled with their route template (``/api/transactions/{transaction_id}/``)
+    rather than the raw path, so label cardinality stays bounded.
+    Latency runs until the last body byte is sent, so streamed responses
+    are timed in full.
+
+    With ``Settings.profile_token`` set, a request carrying that token in
+    an X-Profile header is also stack-sampled; the response names the
+    profile file in an X-Profile-File header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.settings = get_settings()
+
+    def _profile_requested(self, scope) -> bool:
+        token = self.settings.profile_token
+        if not token:
+            return False
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return hmac.compare_digest(value, token.encode())
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        profile_path = None
+        sampler = None
+        if self._profile_requested(scope):
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+            name = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+            profile_path = os.path.join(self.settings.profile_dir, f"{stamp}-{scope['method']}-{name}.folded")
+            sampler = StackSampler(threading.get_ident(), self.settings.profile_interval_ms / 1000).start()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if profile_path:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-file", os.path.basename(profile_path).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            http_request_duration.observe(elapsed, scope["method"], path)
+            http_requests.inc(scope["method"], path, str(status_code))
+            if sampler:
+                samples = sampler.stop()
+                await asyncio.to_thread(write_folded, profile_path, samples)
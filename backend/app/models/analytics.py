@@ -0,0 +1,42 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class RollingPoint(BaseModel):
+    date: str  # ISO date string (YYYY-MM-DD)
+    spent: float
+    average: float
+
+class RollingSpend(BaseModel):
+    window: int
+    points: List[RollingPoint]
+
+class BurnRate(BaseModel):
+    month: str  # YYYY-MM
+    budget: float
+    spent: float
+    daily_rate: float
+    projected: float
+    remaining: float
+    days_until_exhausted: Optional[float] = None
+    on_track: bool
+
+class CategoryTrend(BaseModel):
+    category: str
+    totals: List[float]  # One per entry in CategoryTrends.months
+    monthly_change: float  # Least-squares slope, per month
+
+class CategoryTrends(BaseModel):
+    months: List[str]
+    categories: List[CategoryTrend]
+
+class Anomaly(BaseModel):
+    id: str
+    date: str
+    category: str
+    amount: float
+    category_mean: float
+    z_score: float
+
+class Anomalies(BaseModel):
+    threshold: float
+    transactions: List[Anomaly]
@@ -0,0 +1,69 @@
+"""Money as integer minor units (cents) of an ISO 4217 currency.
+
+Transactions store ``amount_minor``, an exact integer, and every total is
+summed from it. ``amount`` in major units (dollars) is kept beside it for
+clients that predate minor units, derived once when the transaction is
+written, never summed.
+
+Rollups and analytics add up minor units without regard to currency, so
+only ``Settings.default_currency`` is accepted until totals are kept per
+currency; see check_currency.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict
+
+from app.config import get_settings
+
+# Largest amount accepted: still exact as a float64, so NumPy sums stay exact too
+MAX_MINOR_UNITS = 2 ** 53
+
+# ISO 4217 currencies whose minor unit isn't a hundredth
+_EXPONENTS = {
+    "BHD": 3, "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "IQD": 3, "ISK": 0, "JOD": 3,
+    "JPY": 0, "KMF": 0, "KRW": 0, "KWD": 3, "LYD": 3, "OMR": 3, "PYG": 0, "RWF": 0,
+    "TND": 3, "UGX": 0, "UYI": 0, "VND": 0, "VUV": 0, "XAF": 0, "XOF": 0, "XPF": 0,
+}
+
+def default_currency() -> str:
+    return get_settings().default_currency
+
+def check_currency(currency: str) -> None:
+    """Raise ValueError unless transactions may be recorded in ``currency``"""
+    if currency != default_currency():
+        raise ValueError(f"currency must be {default_currency()}; totals aren't kept per currency")
+
+def currency_exponent(currency: str) -> int:
+    """Digits after the decimal point in the currency's major unit"""
+    return _EXPONENTS.get(currency, 2)
+
+def to_minor_units(amount: float, currency: str) -> int:
+    """A major-unit amount in minor units, rounded half up to the currency's precision"""
+    # str() gives the shortest repr, so 0.29 becomes 29 cents rather than 28.999...
+    scaled = Decimal(str(amount)).scaleb(currency_exponent(currency))
+    return int(scaled.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def to_major_units(amount_minor: int, currency: str) -> float:
+    return amount_minor / 10 ** currency_exponent(currency)
+
+def amount_fields(transaction_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The stored money fields for incoming transaction data.
+
+    ``amount_minor`` wins when present; otherwise it is converted from
+    ``amount``. The currency defaults to ``Settings.default_currency``.
+    """
+    currency = transaction_data.get("currency") or default_currency()
+    amount_minor = transaction_data.get("amount_minor")
+    if amount_minor is None:
+        amount_minor = to_minor_units(transaction_data["amount"], currency)
+    return {
+        "amount": to_major_units(amount_minor, currency),
+        "amount_minor": amount_minor,
+        "currency": currency,
+    }
+
+def stored_minor_units(doc: Dict[str, Any]) -> int:
+    """A stored transaction's amount in minor units, converting documents from before amount_minor"""
+    amount_minor = doc.get("amount_minor")
+    if amount_minor is not None:
+        return amount_minor
+    return to_minor_units(doc["amount"], doc.get("currency") or default_currency())
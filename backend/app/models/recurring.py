@@ -0,0 +1,49 @@
+from datetime import date as Date
+from pydantic import Field, model_validator
+from typing import Literal, Optional
+from app.models.money import check_currency
+from app.models.transaction import TransactionBase
+
+class RecurringRuleBase(TransactionBase):
+    """A transaction that repeats; ``date`` is the day the schedule starts"""
+    frequency: Literal['weekly', 'monthly']
+    interval: int = Field(default=1, ge=1, le=52)  # Every `interval` weeks or months
+    # weekly: weekday, 0 (Monday) to 6; monthly: day of month 1-31 (the last day in
+    # shorter months), or -1 for the last day. Defaults to the start date's
+    day: Optional[int] = None
+    # monthly: an occurrence on a weekend moves back to the Friday before, or
+    # forward if that's in the previous month; day=-1 makes it the last business day
+    business_day: bool = False
+    end_date: Optional[str] = None  # YYYY-MM-DD, the last day an occurrence may fall on
+
+    @model_validator(mode='after')
+    def check_schedule(self):
+        try:
+            start = Date.fromisoformat(self.date)
+            end = Date.fromisoformat(self.end_date) if self.end_date else None
+        except ValueError:
+            raise ValueError("date and end_date must be YYYY-MM-DD")
+        if end is not None and end < start:
+            raise ValueError("end_date is before date")
+        if self.frequency == 'weekly':
+            if self.day is not None and not 0 <= self.day <= 6:
+                raise ValueError("day must be a weekday from 0 (Monday) to 6 for weekly rules")
+            if self.business_day:
+                raise ValueError("business_day only applies to monthly rules")
+        elif self.day is not None and not (1 <= self.day <= 31 or self.day == -1):
+            raise ValueError("day must be 1-31, or -1 for the last day, for monthly rules")
+        return self
+
+class RecurringRuleCreate(RecurringRuleBase):
+    @model_validator(mode='after')
+    def check_supported_currency(self):
+        check_currency(self.currency)
+        return self
+
+class RecurringRuleResponse(RecurringRuleBase):
+    id: str
+    uid: str
+    next_run: Optional[str] = None  # Date of the next occurrence; None once the rule has ended
+    last_run: Optional[str] = None  # Date of the latest occurrence created
+    created_at: int  # Unix timestamp in milliseconds
+    updated_at: int  # Unix timestamp in milliseconds
@@ -1,20 +1,109 @@
-from pydantic import BaseModel, Field
-from typing import Literal, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List, Literal, Optional
+from app.models.money import MAX_MINOR_UNITS, check_currency, default_currency, to_major_units, to_minor_units
 
 class TransactionBase(BaseModel):
     type: Literal['expense', 'income']
-    amount: float = Field(..., gt=0)
+    # Send either; amount_minor (cents) is what's stored and summed, and wins if both are sent
+    amount: Optional[float] = Field(default=None, gt=0, allow_inf_nan=False)  # Major units, derived from amount_minor
+    amount_minor: Optional[int] = Field(default=None, gt=0, le=MAX_MINOR_UNITS)
+    currency: str = Field(default_factory=default_currency, pattern=r"^[A-Z]{3}$")  # ISO 4217
     category: str = Field(..., min_length=1)
     date: str  # ISO date string (YYYY-MM-DD)
     description: str = Field(default="")
 
+    @model_validator(mode='after')
+    def check_amount(self):
+        if self.amount_minor is None:
+            if self.amount is None:
+                raise ValueError("amount or amount_minor is required")
+            self.amount_minor = to_minor_units(self.amount, self.currency)
+            if not 0 < self.amount_minor <= MAX_MINOR_UNITS:
+                raise ValueError(f"amount is out of range for {self.currency}")
+        self.amount = to_major_units(self.amount_minor, self.currency)
+        return self
+
 class TransactionCreate(TransactionBase):
     uid: str
     id: str
 
+    @model_validator(mode='after')
+    def check_supported_currency(self):
+        check_currency(self.currency)
+        return self
+
 class TransactionResponse(TransactionBase):
     id: str
     uid: str
     created_at: int  # Unix timestamp in milliseconds
     updated_at: int  # Unix timestamp in milliseconds
-    deleted_at: Optional[int] = None  # Unix timestamp in milliseconds
\ No newline at end of file
+    deleted_at: Optional[int] = None  # Unix timestamp in milliseconds
+
+class TransactionPage(BaseModel):
+    items: List[TransactionResponse]
+    next_cursor: Optional[str] = None  # Pass as `after` to fetch the next page
+
+class TransactionChanges(BaseModel):
+    items: List[TransactionResponse]  # Oldest change first; deleted_at set on deletions
+    sync_token: Optional[str] = None  # Pass back as `sync_token` on the next call
+    has_more: bool  # More changes are waiting; call again straight away
+    full_resync_required: bool = False  # The token is too old; sync again without one
+
+class TransactionOperation(BaseModel):
+    op: Literal['create', 'update', 'delete']
+    id: str = Field(..., min_length=1)
+    transaction: Optional[TransactionCreate] = None  # Required for create and update
+
+    @model_validator(mode='after')
+    def check_transaction(self):
+        if self.op != 'delete' and self.transaction is None:
+            raise ValueError(f"transaction is required for {self.op}")
+        if self.transaction is not None and self.transaction.id != self.id:
+            raise ValueError("transaction.id must match id")
+        return self
+
+class TransactionBatchRequest(BaseModel):
+    operations: List[TransactionOperation] = Field(..., min_length=1, max_length=5000)
+
+class TransactionOperationResult(BaseModel):
+    id: str
+    op: Literal['create', 'update', 'delete']
+    success: bool
+    error: Optional[str] = None
+
+class TransactionBatchResponse(BaseModel):
+    results: List[TransactionOperationResult]
+
+class CategoryTotals(BaseModel):
+    # Major units of Settings.default_currency, summed exactly in minor units
+    income: float = 0
+    expense: float = 0
+
+class MonthlySummary(CategoryTotals):
+    month: str  # YYYY-MM
+    categories: Dict[str, CategoryTotals]
+
+class TransactionSummary(CategoryTotals):
+    start: str  # YYYY-MM
+    end: str  # YYYY-MM
+    categories: Dict[str, CategoryTotals]
+    months: List[MonthlySummary]
+
+class ImportRowError(BaseModel):
+    row: int  # CSV line number, or the OFX transaction's position; 0 if the write failed
+    error: str
+
+class TransactionImport(BaseModel):
+    job_id: str
+    status: Literal['running', 'completed', 'failed']
+    format: Literal['csv', 'ofx']
+    bytes_total: int
+    bytes_read: int  # Progress through the file
+    rows: int  # Rows read so far
+    imported: int
+    skipped: int  # Already imported earlier
+    failed: int
+    errors: List[ImportRowError]  # The first 100 row errors
+    error: Optional[str] = None  # Why the whole import failed
+    started_at: int  # Unix timestamp in milliseconds
+    finished_at: Optional[int] = None
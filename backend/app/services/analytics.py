@@ -0,0 +1,190 @@
+"""Columnar analytics over a user's transaction history.
+
+Transactions are loaded once into NumPy arrays (dates as int days since the
+epoch, categories interned to integer codes, amounts as int64 minor units)
+and every report is computed with vectorized group-bys instead of Python
+loops over dicts. Sums of minor units stay exact (they are integers below
+2**53 even when bincount adds them as float64); reports convert to major
+units of ``Settings.default_currency`` only for output.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable
+
+import numpy as np
+
+from app.models.money import currency_exponent, default_currency, stored_minor_units
+from app.services.firestore_service import stream_user_transactions
+
+@dataclass
+class TransactionColumns:
+    ids: np.ndarray  # object, transaction ids
+    days: np.ndarray  # int64, days since 1970-01-01
+    amounts: np.ndarray  # int64, minor units
+    is_expense: np.ndarray  # bool
+    category_codes: np.ndarray  # int64 index into categories
+    categories: np.ndarray  # str, category name for each code
+    scale: int = 100  # Minor units per major unit
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    @property
+    def months(self) -> np.ndarray:
+        """Months since 1970-01 for every row"""
+        return self.days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+def columns_from_records(records: Iterable[Dict[str, Any]]) -> TransactionColumns:
+    """Build columns from transaction dicts, skipping soft-deleted ones"""
+    ids, dates, amounts, is_expense, codes = [], [], [], [], []
+    interned: Dict[str, int] = {}
+    for record in records:
+        if record.get("deleted_at") is not None:
+            continue
+        ids.append(record["id"])
+        dates.append(record["date"][:10])
+        amounts.append(stored_minor_units(record))
+        is_expense.append(record["type"] == "expense")
+        codes.append(interned.setdefault(record["category"], len(interned)))
+
+    return TransactionColumns(
+        ids=np.array(ids, dtype=object),
+        days=np.array(dates, dtype="datetime64[D]").astype(np.int64),
+        amounts=np.array(amounts, dtype=np.int64),
+        is_expense=np.array(is_expense, dtype=bool),
+        category_codes=np.array(codes, dtype=np.int64),
+        categories=np.array(list(interned), dtype=str),
+        scale=10 ** currency_exponent(default_currency()),
+    )
+
+async def load_columns(uid: str) -> TransactionColumns:
+    """Load a user's live transactions into columns"""
+    return columns_from_records([transaction async for transaction in stream_user_transactions(uid)])
+
+def _day(value: int) -> str:
+    return str(np.datetime64(int(value), "D"))
+
+def _month(value: int) -> str:
+    return str(np.datetime64(int(value), "M"))
+
+def _daily_expenses(columns: TransactionColumns, first_day: int, last_day: int) -> np.ndarray:
+    """Total expense per day for every day in [first_day, last_day], in minor units"""
+    mask = columns.is_expense & (columns.days >= first_day) & (columns.days <= last_day)
+    return np.bincount(
+        columns.days[mask] - first_day,
+        weights=columns.amounts[mask],
+        minlength=last_day - first_day + 1,
+    ).astype(np.int64)
+
+def rolling_spend(columns: TransactionColumns, window: int, end: date, days: int) -> Dict[str, Any]:
+    """Trailing ``window``-day average of daily spending for the ``days`` days up to ``end``"""
+    last_day = (end - date(1970, 1, 1)).days
+    first_day = last_day - days + 1
+    # Pad the front so the first reported day still averages over a full window
+    daily = _daily_expenses(columns, first_day - window + 1, last_day)
+    # Integer prefix sums, so every window total is exact
+    cumulative = np.concatenate(([0], np.cumsum(daily)))
+    averages = (cumulative[window:] - cumulative[:-window]) / window / columns.scale
+
+    return {
+        "window": window,
+        "points": [
+            {"date": _day(first_day + offset), "spent": int(spent) / columns.scale, "average": round(float(average), 2)}
+            for offset, (spent, average) in enumerate(zip(daily[window - 1:], averages))
+        ],
+    }
+
+def burn_rate(columns: TransactionColumns, budget: float, today: date) -> Dict[str, Any]:
+    """Month-to-date spending against a monthly budget, projected to month end"""
+    month_start = today.replace(day=1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    days_in_month = (next_month - month_start).days
+    elapsed = today.day
+
+    epoch = date(1970, 1, 1)
+    spent = int(_daily_expenses(columns, (month_start - epoch).days, (today - epoch).days).sum()) / columns.scale
+    daily_rate = spent / elapsed
+    projected = daily_rate * days_in_month
+
+    days_left = None
+    if daily_rate > 0:
+        days_left = max(0.0, (budget - spent) / daily_rate)
+
+    return {
+        "month": month_start.strftime("%Y-%m"),
+        "budget": budget,
+        "spent": spent,
+        "daily_rate": round(daily_rate, 2),
+        "projected": round(projected, 2),
+        "remaining": round(budget - spent, 2),
+        "days_until_exhausted": None if days_left is None else round(days_left, 1),
+        "on_track": projected <= budget,
+    }
+
+def category_trends(columns: TransactionColumns, months: int, today: date) -> Dict[str, Any]:
+    """Monthly expense per category over the last ``months`` months, with a linear trend"""
+    last_month = np.datetime64(today, "M").astype(np.int64)
+    first_month = last_month - months + 1
+    row_months = columns.months
+    mask = columns.is_expense & (row_months >= first_month) & (row_months <= last_month)
+
+    n_categories = len(columns.categories)
+    # One bincount over a combined (category, month) index gives the whole matrix
+    flat = columns.category_codes[mask] * months + (row_months[mask] - first_month)
+    totals_minor = np.bincount(flat, weights=columns.amounts[mask], minlength=n_categories * months).astype(np.int64)
+    totals_minor = totals_minor.reshape(n_categories, months)
+    totals = totals_minor / columns.scale
+
+    # Least-squares slope per category, all rows at once
+    x = np.arange(months, dtype=np.float64) - (months - 1) / 2
+    slopes = np.zeros(n_categories)
+    if months > 1:
+        slopes = (totals - totals.mean(axis=1, keepdims=True)) @ x / (x @ x)
+
+    active = np.flatnonzero(totals_minor.sum(axis=1) > 0)
+    return {
+        "months": [_month(first_month + offset) for offset in range(months)],
+        "categories": [
+            {
+                "category": str(columns.categories[code]),
+                "totals": [int(value) / columns.scale for value in totals_minor[code]],
+                "monthly_change": round(float(slopes[code]), 2),
+            }
+            for code in active
+        ],
+    }
+
+def anomalies(columns: TransactionColumns, threshold: float, min_count: int = 5) -> Dict[str, Any]:
+    """Expenses whose amount is more than ``threshold`` standard deviations above their category's mean"""
+    mask = columns.is_expense
+    codes = columns.category_codes[mask]
+    amounts = columns.amounts[mask] / columns.scale
+    n_categories = len(columns.categories)
+
+    counts = np.bincount(codes, minlength=n_categories)
+    sums = np.bincount(codes, weights=amounts, minlength=n_categories)
+    squares = np.bincount(codes, weights=amounts * amounts, minlength=n_categories)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = sums / counts
+        stds = np.sqrt(np.maximum(squares / counts - means * means, 0))
+        scores = (amounts - means[codes]) / stds[codes]
+
+    flagged = (counts[codes] >= min_count) & (stds[codes] > 0) & (scores > threshold)
+    order = np.flatnonzero(flagged)[np.argsort(-scores[flagged])]
+    ids = columns.ids[mask]
+    days = columns.days[mask]
+
+    return {
+        "threshold": threshold,
+        "transactions": [
+            {
+                "id": ids[index],
+                "date": _day(days[index]),
+                "category": str(columns.categories[codes[index]]),
+                "amount": float(amounts[index]),
+                "category_mean": round(float(means[codes[index]]), 2),
+                "z_score": round(float(scores[index]), 2),
+            }
+            for index in order
+        ],
+    }
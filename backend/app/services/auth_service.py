@@ -1,15 +1,43 @@
-from typing import Optional
-from fastapi import HTTPException, status
-from firebase_admin.auth import verify_id_token
+import asyncio
+import logging
+from fastapi.concurrency import run_in_threadpool
+from app.services.firebase import firebase_auth
 
-def verify_firebase_token(token: str) -> dict:
-    """Verify Firebase ID token and return user data"""
+logger = logging.getLogger(__name__)
+
+def refresh_signing_certs() -> bool:
+    """Re-download Google's ID token signing certs into firebase_admin's cert cache.
+
+    verify_id_token fetches these certs through a Cache-Control aware HTTP
+    session and downloads them again whenever the cached copy expires.
+    Fetching them here with ``no-cache`` refreshes that cache ahead of
+    expiry, so no request ever waits on the download.
+
+    The cache is reached through firebase_admin internals. Returns False,
+    having logged why, if this firebase_admin version doesn't have them;
+    verify_id_token then just downloads the certs itself when they expire.
+    """
     try:
-        user = verify_id_token(token)
-        return user
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not logged in or Invalid credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        from firebase_admin._token_gen import ID_TOKEN_CERT_URI
+
+        request = firebase_auth()._get_client(None)._token_verifier.request
+    except (ImportError, AttributeError) as e:
+        logger.warning("Can't refresh ID token signing certs with this firebase_admin", extra={"error": str(e)})
+        return False
+    request(ID_TOKEN_CERT_URI, headers={"Cache-Control": "no-cache"})
+    return True
+
+
+async def keep_signing_certs_fresh(interval_seconds: float, delay_seconds: float = 0) -> None:
+    """Refresh the signing certs after ``delay_seconds`` and then every ``interval_seconds``.
+
+    Returns if firebase_admin turns out not to support the refresh.
+    """
+    await asyncio.sleep(delay_seconds)
+    while True:
+        try:
+            if not await run_in_threadpool(refresh_signing_certs):
+                return
+        except Exception as e:
+            logger.warning("Could not refresh ID token signing certs", extra={"error": str(e)})
+        await asyncio.sleep(interval_seconds)
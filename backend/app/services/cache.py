@@ -0,0 +1,134 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+def deep_sizeof(value: Any) -> int:
+    """Approximate bytes held by a value and the dicts, lists and tuples inside it"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(k) + deep_sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_sizeof(item) for item in value)
+    return size
+
+class TTLCache:
+    """In-process LRU cache where every entry carries its own expiry.
+
+    Entries are evicted least-recently-used first once ``maxsize`` is reached
+    (or, with ``max_bytes``, once the entries weigh more than that by
+    ``sizeof``), and are treated as missing once their TTL has passed. Hit
+    and miss counters are kept for metrics.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        default_ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = deep_sizeof,
+    ):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pop(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._pop(key)
+            return None
+        return value
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or None if missing or expired"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable) -> Any:
+        """Like get, but without counting a hit or miss or refreshing recency"""
+        with self._lock:
+            return self._lookup(key)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value for ``ttl`` seconds (``default_ttl`` if not given)"""
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl is None or ttl <= 0:
+            return
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            self._store(key, value, ttl, size)
+
+    def _store(self, key: Hashable, value: Any, ttl: float, size: int) -> None:
+        self._pop(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._data[key] = (time.monotonic() + ttl, value, size)
+        self.bytes += size
+        while len(self._data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            _, (_, _, evicted) = self._data.popitem(last=False)
+            self.bytes -= evicted
+
+    def set_if(self, key: Hashable, value: Any, guard: "TTLCache", guard_key: Hashable, expected: Any) -> None:
+        """Store a value with the default TTL only while ``guard`` still holds ``expected`` at ``guard_key``.
+
+        In process this is only atomic for callers on one thread, such as
+        the event loop.
+        """
+        if guard.peek(guard_key) == expected:
+            self.set(key, value)
+
+    def replace(self, key: Hashable, fn: Callable[[Any], Any]) -> None:
+        """Replace a cached value with ``fn(value)`` for the default TTL; a missing key stays missing"""
+        if self.default_ttl is None or self.default_ttl <= 0:
+            return
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                return
+            value = fn(value)
+            self._store(key, value, self.default_ttl, self.sizeof(value) if self.max_bytes is not None else 0)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,164 @@
+"""Live transaction changes for /api/transactions/stream/.
+
+Each user with an open stream has one UserFeed in this process, however
+many devices they have connected. Where storage can push (a Firestore
+snapshot listener) the feed watches their transactions; elsewhere it polls
+their transactions version every stream_poll_interval_seconds and reads
+the changes when it moves. Every batch of changed transactions is fanned
+out to the user's connections through a queue per connection. A
+connection that falls stream_queue_size batches behind is marked
+overflowed and should be closed: the client reconnects with its last event
+id and catches up from storage.
+
+Feeds are capped at stream_max_listeners users per process, since each
+Firestore listener is a watch target on the client's stream plus the
+documents it has seen. The last connection of a user to leave stops their
+feed.
+"""
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from app.config import get_settings
+from app.services.firestore_service import SYNC_SETTLE_MS, get_transaction_changes, get_transactions_version, live_sync_token
+from app.services.storage import get_storage
+from app.services.storage.common import now_ms
+
+logger = logging.getLogger(__name__)
+
+# Changes read per query when a polled feed sees the version move
+POLL_PAGE_SIZE = 500
+
+class ListenerLimit(Exception):
+    """The process already holds a feed for as many users as it may"""
+
+class Subscription:
+    """One connection's queue of change batches"""
+
+    def __init__(self, queue_size: int):
+        self._queue: "asyncio.Queue[List[Dict[str, Any]]]" = asyncio.Queue(queue_size)
+        # Set once a batch had to be dropped; the connection can't be trusted past that
+        self.overflowed = False
+
+    def push(self, transactions: List[Dict[str, Any]]) -> None:
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(transactions)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float) -> Optional[List[Dict[str, Any]]]:
+        """The next batch of changed transactions, or None after ``timeout`` seconds without one"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class UserFeed:
+    """One user's change source, shared by all their connections"""
+
+    def __init__(self, uid: str):
+        self.uid = uid
+        self.subscriptions: Set[Subscription] = set()
+        self._unwatch: Optional[Callable[[], None]] = None
+        self._poller: Optional[asyncio.Task] = None
+
+    def start(self, poll_interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        since = now_ms() - SYNC_SETTLE_MS
+        self._unwatch = get_storage().watch_transactions(
+            self.uid, since, lambda transactions: loop.call_soon_threadsafe(self.publish, transactions)
+        )
+        if self._unwatch is None:
+            self._poller = asyncio.create_task(self._poll(poll_interval))
+
+    def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+        if self._unwatch is not None:
+            # Unsubscribing joins the listener's thread, so keep it off the event loop
+            asyncio.get_running_loop().run_in_executor(None, self._unwatch)
+
+    def publish(self, transactions: List[Dict[str, Any]]) -> None:
+        for subscription in self.subscriptions:
+            subscription.push(transactions)
+
+    async def _poll(self, interval: float) -> None:
+        version = await get_transactions_version(self.uid)
+        sync_token = live_sync_token()
+        # id -> updated_at published last round; the settle window reads them again
+        published: Dict[str, int] = {}
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                current = await get_transactions_version(self.uid)
+                if current == version:
+                    continue
+                version = current
+                seen: Dict[str, int] = {}
+                while True:
+                    changes = await get_transaction_changes(self.uid, POLL_PAGE_SIZE, sync_token)
+                    sync_token = changes["sync_token"]
+                    fresh = [transaction for transaction in changes["items"] if published.get(transaction["id"]) != transaction["updated_at"]]
+                    seen.update((transaction["id"], transaction["updated_at"]) for transaction in changes["items"])
+                    if fresh:
+                        self.publish(fresh)
+                    if not changes["has_more"]:
+                        break
+                published = seen
+            except Exception:
+                logger.exception("Polling transaction changes failed")
+
+class ChangeFeed:
+    """The feeds of every user with a stream open in this process"""
+
+    def __init__(self, max_listeners: int, queue_size: int, poll_interval: float):
+        self.max_listeners = max_listeners
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.feeds: Dict[str, UserFeed] = {}
+        self.rejected = 0
+
+    @property
+    def connections(self) -> int:
+        return sum(len(feed.subscriptions) for feed in self.feeds.values())
+
+    def has_room(self, uid: str) -> bool:
+        """Whether a connection for ``uid`` would get a feed; a no counts as rejected"""
+        if uid in self.feeds or len(self.feeds) < self.max_listeners:
+            return True
+        self.rejected += 1
+        return False
+
+    def subscribe(self, uid: str) -> Subscription:
+        """Start receiving the user's changes; raises ListenerLimit if their feed can't be started"""
+        feed = self.feeds.get(uid)
+        if feed is None:
+            if len(self.feeds) >= self.max_listeners:
+                self.rejected += 1
+                raise ListenerLimit(f"This server is already streaming changes for {self.max_listeners} users")
+            feed = UserFeed(uid)
+            feed.start(self.poll_interval)
+            self.feeds[uid] = feed
+        subscription = Subscription(self.queue_size)
+        feed.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, uid: str, subscription: Subscription) -> None:
+        feed = self.feeds.get(uid)
+        if feed is None:
+            return
+        feed.subscriptions.discard(subscription)
+        if not feed.subscriptions:
+            del self.feeds[uid]
+            feed.stop()
+
+    def close(self) -> None:
+        """Stop every feed"""
+        for feed in self.feeds.values():
+            feed.stop()
+        self.feeds.clear()
+
+_settings = get_settings()
+change_feed = ChangeFeed(_settings.stream_max_listeners, _settings.stream_queue_size, _settings.stream_poll_interval_seconds)
@@ -0,0 +1,27 @@
+"""The process's default Firebase app, created on first use.
+
+Importing firebase_admin (google-auth, requests, httpx) is a good share of
+the API's import time, and none of it is needed until a token is verified
+or Firebase Auth is called, so it is imported here rather than at module
+level. The lifespan warm-up calls these ahead of the first request.
+"""
+import threading
+
+_lock = threading.Lock()
+
+def get_firebase_app():
+    """The default firebase_admin App, initialized with application default credentials if needed"""
+    import firebase_admin
+
+    with _lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:
+            return firebase_admin.initialize_app()
+
+def firebase_auth():
+    """The firebase_admin.auth module, with the default app initialized for it"""
+    get_firebase_app()
+    from firebase_admin import auth
+
+    return auth
@@ -1,220 +1,647 @@
-import firebase_admin
-from firebase_admin import firestore
-from typing import List, Dict, Any
+import asyncio
+from fastapi.concurrency import run_in_threadpool
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta, timezone
-import bcrypt
+import base64
+import heapq
+import json
+import logging
 import random
-from google.cloud.firestore_v1 import DELETE_FIELD
-from firebase_admin import auth
+import secrets
+from app.config import get_settings
+from app.models.money import amount_fields, default_currency, stored_minor_units, to_major_units, to_minor_units
+from app.services.firebase import firebase_auth
+from app.services.hashing import hashing_pool
+from app.services.outbox import mail_outbox
+from app.services.search_index import TransactionIndex, index_transaction, search_indexes, words
+from app.services.shared_cache import make_cache
+from app.services.storage import TransactionConflict, TransactionNotFound, get_storage
+from app.services.storage.common import RollupDeltas, group_rollups, merge_rollup_deltas, new_transaction_doc, now_ms, rollup_deltas, transaction_update_data
 
-if not firebase_admin._apps:
-    firebase_admin.initialize_app()
+logger = logging.getLogger(__name__)
 
-db = firestore.client()
+# Longest range the summary endpoint will read rollups for
+SUMMARY_MAX_MONTHS = 120
+
+# A write's updated_at is taken just before it commits, so changes this recent
+# may still become visible behind a sync position; the last page of a sync
+# leaves its token this far back and the client sees them again next time
+SYNC_SETTLE_MS = 5000
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Transactions read per query while a search without text filters on amount
+SEARCH_SCAN_PAGE = 200
+
+transactions_versions = make_cache(
+    "transactions_versions",
+    maxsize=get_settings().transactions_version_cache_size,
+    default_ttl=get_settings().transactions_version_cache_ttl_seconds,
+)
+
+# users/{uid} documents (codes, PIN hash, flags), kept current by this process's
+# own writes (every worker's, with a shared cache); another process's writes show
+# up once the entry expires
+user_docs = make_cache(
+    "user_docs",
+    maxsize=get_settings().user_doc_cache_size,
+    default_ttl=get_settings().user_doc_cache_ttl_seconds,
+    max_bytes=get_settings().user_doc_cache_max_bytes,
+)
+# uid -> a token replaced before and after every write to users/{uid}; a read
+# that overlapped a write, on any worker, sees it change and isn't cached
+user_doc_writes = make_cache(
+    "user_doc_writes",
+    maxsize=get_settings().user_doc_cache_size,
+    default_ttl=get_settings().user_doc_cache_ttl_seconds,
+)
+# Firebase Auth email (lowercased) -> uid; an address with no user is cached as
+# _NO_USER, for less time so a new sign-up can soon reset its password
+email_uids = make_cache(
+    "email_uids",
+    maxsize=get_settings().email_lookup_cache_size,
+    default_ttl=get_settings().email_lookup_ttl_seconds,
+    local=True,
+)
+_NO_USER = ""
+# Lookups in flight, shared by every caller asking for the same address
+_email_lookups: Dict[str, "asyncio.Future[str | None]"] = {}
+
+# Search indexes being built or caught up, shared by every search of the same user
+_search_index_loads: Dict[str, "asyncio.Future[TransactionIndex]"] = {}
+
+def encode_cursor(date: str, transaction_id: str) -> str:
+    """Encode a (date, id) keyset position as an opaque cursor string"""
+    raw = json.dumps([date, transaction_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        date, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(date, str) or not isinstance(transaction_id, str):
+        raise ValueError("Invalid cursor")
+    return date, transaction_id
+
+def encode_sync_token(updated_at: int, transaction_id: str, synced_at: int) -> str:
+    """Encode a sync position as an opaque token.
+
+    (updated_at, id) is the last change the client has received and
+    ``synced_at`` the server time its sync started from.
+    """
+    raw = json.dumps([updated_at, transaction_id, synced_at]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_sync_token(token: str) -> Tuple[int, str, int]:
+    """Decode a token produced by encode_sync_token"""
+    try:
+        updated_at, transaction_id, synced_at = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise ValueError("Invalid sync token")
+    if not isinstance(updated_at, int) or not isinstance(transaction_id, str) or not isinstance(synced_at, int):
+        raise ValueError("Invalid sync token")
+    return updated_at, transaction_id, synced_at
+
+def live_sync_token() -> str:
+    """A sync token for a client that has just been sent changes as they happened.
+
+    Changes pushed live carry no position of their own, so the token goes
+    back SYNC_SETTLE_MS from now: resuming from it repeats the last few
+    seconds rather than missing a change still on its way.
+    """
+    now = now_ms()
+    return encode_sync_token(now - SYNC_SETTLE_MS, "", now)
+
+async def get_transactions_version(uid: str) -> int:
+    """The user's transactions version, cached briefly"""
+    version = transactions_versions.get(uid)
+    if version is None:
+        version = await get_storage().get_transactions_version(uid)
+        transactions_versions.set(uid, version)
+    return version
 
 async def get_user_transactions(uid: str) -> List[Dict[str, Any]]:
     """Get all transactions for a user"""
-    transactions_ref = db.collection("transactions").where("uid", "==", uid)
-    docs = transactions_ref.stream()
-    
-    transactions = []
-    for doc in docs:
-        transaction_data = doc.to_dict()
-        transaction_data["id"] = doc.id
-        
-        # Ensure timestamps are integers (in case Firestore stored them as different types)
-        if isinstance(transaction_data.get("created_at"), datetime):
-            transaction_data["created_at"] = int(transaction_data["created_at"].timestamp() * 1000)
-        if isinstance(transaction_data.get("updated_at"), datetime):
-            transaction_data["updated_at"] = int(transaction_data["updated_at"].timestamp() * 1000)
-            
-        transactions.append(transaction_data)
-    
-    return transactions
+    return [transaction async for transaction in stream_user_transactions(uid)]
+
+async def stream_user_transactions(uid: str) -> AsyncIterator[Dict[str, Any]]:
+    """Yield a user's transactions one at a time as storage streams them"""
+    async for transaction in get_storage().stream_transactions(uid):
+        yield transaction
+
+async def get_transactions_page(uid: str, limit: int, after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get one page of a user's transactions, newest date first.
+
+    Keyset pagination on (date, document id): ``after`` is the cursor returned
+    with the previous page. Returns the page and the cursor for the next one,
+    or None when there are no more transactions.
+    """
+    position = decode_cursor(after) if after else None
+
+    # Fetch one extra document to learn whether another page exists
+    transactions = await get_storage().get_transactions_page(uid, limit + 1, position)
+
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        next_cursor = encode_cursor(last["date"], last["id"])
+
+    return transactions, next_cursor
+
+def _amount_filter(min_amount: Optional[float], max_amount: Optional[float]) -> Optional[Callable[[Dict[str, Any]], bool]]:
+    """A check that a transaction's amount is within the bounds, in major units of its own currency"""
+    if min_amount is None and max_amount is None:
+        return None
+    bounds: Dict[str, Tuple[Optional[int], Optional[int]]] = {}
+
+    def matches(transaction: Dict[str, Any]) -> bool:
+        currency = transaction.get("currency") or default_currency()
+        if currency not in bounds:
+            bounds[currency] = tuple(None if bound is None else to_minor_units(bound, currency) for bound in (min_amount, max_amount))
+        low, high = bounds[currency]
+        amount = stored_minor_units(transaction)
+        return (low is None or amount >= low) and (high is None or amount <= high)
+    return matches
+
+def _matches_filters(transaction: Dict[str, Any], filters: Dict[str, str]) -> bool:
+    """Whether a transaction passes the structured filters of search_transactions"""
+    return (
+        filters.get("type", transaction["type"]) == transaction["type"]
+        and filters.get("category", transaction["category"]) == transaction["category"]
+        and filters.get("date_from", transaction["date"]) <= transaction["date"] <= filters.get("date_to", transaction["date"])
+    )
+
+async def _load_search_index(uid: str) -> TransactionIndex:
+    # The version is read first, so writes made while reading leave it behind
+    # and are caught up on the next search
+    version = await get_transactions_version(uid)
+    index = search_indexes.get(uid)
+    if index is None:
+        index = TransactionIndex(version)
+        async for transaction in get_storage().stream_transactions(uid):
+            index.read(transaction)
+        logger.debug("Built search index", extra={"transactions": len(index)})
+    elif index.version != version:
+        for transaction in await get_storage().get_updated_transactions(uid, index.synced_to - SYNC_SETTLE_MS):
+            index.read(transaction)
+        index.version = version
+    search_indexes.set(uid, index)
+    return index
+
+async def _get_search_index(uid: str) -> TransactionIndex:
+    """The user's search index, built or caught up with their transactions version"""
+    load = _search_index_loads.get(uid)
+    if load is None:
+        load = asyncio.ensure_future(_load_search_index(uid))
+        _search_index_loads[uid] = load
+        load.add_done_callback(lambda _: _search_index_loads.pop(uid, None))
+    # Shielded so one search going away doesn't cancel the others' load
+    return await asyncio.shield(load)
+
+async def search_transactions(
+    uid: str,
+    limit: int,
+    after: Optional[str] = None,
+    text: Optional[str] = None,
+    filters: Optional[Dict[str, Optional[str]]] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Find a user's live transactions, newest date first, a page at a time.
+
+    ``filters`` may hold ``type``, ``category``, ``date_from`` and
+    ``date_to`` (inclusive YYYY-MM-DD). Amount bounds are inclusive, in
+    major units of each transaction's currency. Every word of ``text``
+    must start a word of the description.
+
+    With ``text``, the search runs against the user's in-memory index.
+    Without, storage runs the structured filters and amounts are checked
+    here; a page that read search_max_scan transactions without filling up
+    is returned short, with a cursor to carry on from. Pages and cursors
+    work as in get_transactions_page.
+    """
+    position = decode_cursor(after) if after else None
+    filters = {name: value for name, value in (filters or {}).items() if value is not None}
+    amount_matches = _amount_filter(min_amount, max_amount)
+
+    if text:
+        index = await _get_search_index(uid)
+        matches = [
+            transaction for transaction in index.match(words(text))
+            if _matches_filters(transaction, filters)
+            and (amount_matches is None or amount_matches(transaction))
+            and (position is None or (transaction["date"], transaction["id"]) < position)
+        ]
+        matches = heapq.nlargest(limit + 1, matches, key=lambda transaction: (transaction["date"], transaction["id"]))
+    else:
+        storage = get_storage()
+        max_scan = get_settings().search_max_scan
+        # Without an amount filter only tombstones are skipped, so one extra row usually does
+        page_size = limit + 1 if amount_matches is None else max(limit + 1, SEARCH_SCAN_PAGE)
+        matches, scanned = [], 0
+        while len(matches) <= limit:
+            if scanned >= max_scan:
+                return matches, encode_cursor(*position)
+            transactions = await storage.search_transactions(uid, filters, page_size, position)
+            for transaction in transactions:
+                scanned += 1
+                position = (transaction["date"], transaction["id"])
+                if transaction.get("deleted_at") is None and (amount_matches is None or amount_matches(transaction)):
+                    matches.append(transaction)
+                    if len(matches) > limit:
+                        break
+            if len(transactions) < page_size:
+                break
+
+    next_cursor = None
+    if len(matches) > limit:
+        matches = matches[:limit]
+        next_cursor = encode_cursor(matches[-1]["date"], matches[-1]["id"])
+    return matches, next_cursor
 
 async def get_updated_transactions(uid: str, last_sync_timestamp: int) -> List[Dict[str, Any]]:
     """Get transactions with updated_at timestamp greater than last_sync_timestamp"""
-    print(f"Querying Firestore for uid: {uid}, timestamp > {last_sync_timestamp}")
-    
-    try:
-        transactions_ref = db.collection("transactions").where("uid", "==", uid).where("updated_at", ">", last_sync_timestamp)
-        docs = transactions_ref.stream()
-        
-        transactions = []
-        for doc in docs:
-            transaction_data = doc.to_dict()
-            transaction_data["id"] = doc.id
-            
-            # Ensure timestamps are integers
-            if isinstance(transaction_data.get("created_at"), datetime):
-                transaction_data["created_at"] = int(transaction_data["created_at"].timestamp() * 1000)
-            if isinstance(transaction_data.get("updated_at"), datetime):
-                transaction_data["updated_at"] = int(transaction_data["updated_at"].timestamp() * 1000)
-            if isinstance(transaction_data.get("deleted_at"), datetime):
-                transaction_data["deleted_at"] = int(transaction_data["deleted_at"].timestamp() * 1000)
-                
-            transactions.append(transaction_data)
-        
-        print(f"Successfully retrieved {len(transactions)} transactions")
-        return transactions
-        
-    except Exception as e:
-        print(f"Error in get_updated_transactions: {str(e)}")
-        raise e
+    transactions = await get_storage().get_updated_transactions(uid, last_sync_timestamp)
+    logger.debug("Fetched updated transactions", extra={"since": last_sync_timestamp, "count": len(transactions)})
+    return transactions
+
+def _check_existing(uid: str, transaction_id: str, old: Optional[Dict[str, Any]], expected_updated_at: Optional[int]) -> Dict[str, Any]:
+    """Return the stored transaction if ``uid`` owns it, it isn't deleted and it is still the version the client saw"""
+    # Another user's transaction, like a deleted one, is reported as missing rather than forbidden
+    if old is None or old.get("uid") != uid or old.get("deleted_at") is not None:
+        raise TransactionNotFound(f"Transaction with ID {transaction_id} does not exist")
+    if expected_updated_at is not None and old.get("updated_at") != expected_updated_at:
+        raise TransactionConflict(f"Transaction with ID {transaction_id} has been modified")
+    return old
+
+async def get_transaction_changes(uid: str, limit: int, sync_token: Optional[str] = None) -> Dict[str, Any]:
+    """Get one page of changes since ``sync_token``, oldest first, tombstones included.
+
+    Without a token the sync starts from the beginning. Returns the page,
+    the token to send next time and whether more changes are waiting. A
+    token older than the tombstone retention window may have missed
+    purged deletions, so it gets ``full_resync_required`` instead: the
+    client should drop its copy and sync again without a token.
+    """
+    now = now_ms()
+    if sync_token:
+        updated_at, transaction_id, synced_at = decode_sync_token(sync_token)
+        position: Optional[Tuple[int, str]] = (updated_at, transaction_id)
+        if synced_at < now - get_settings().tombstone_retention_days * DAY_MS:
+            return {"items": [], "sync_token": None, "has_more": False, "full_resync_required": True}
+    else:
+        position, synced_at = None, now
+
+    # Fetch one extra document to learn whether more changes are waiting
+    changes = await get_storage().get_changes(uid, limit + 1, position)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        position = (changes[-1]["updated_at"], changes[-1]["id"])
+
+    if has_more:
+        # Mid-sync: keep the time the sync started, so purges during it are noticed
+        next_token = encode_sync_token(*position, synced_at)
+    else:
+        settled = now - SYNC_SETTLE_MS
+        if position is None or position[0] > settled:
+            position = (settled, "")
+        next_token = encode_sync_token(*position, now)
+
+    return {"items": changes, "sync_token": next_token, "has_more": has_more, "full_resync_required": False}
+
+async def compact_tombstones(retention_days: Optional[int] = None) -> int:
+    """Hard-delete transactions soft-deleted more than ``retention_days`` ago.
+
+    Defaults to ``Settings.tombstone_retention_days``. Returns how many were deleted.
+    """
+    if retention_days is None:
+        retention_days = get_settings().tombstone_retention_days
+    purged = await get_storage().purge_deleted_transactions(now_ms() - retention_days * DAY_MS)
+    transactions_versions.clear()
+    return purged
 
 async def create_transaction(uid: str, transaction_data: Dict[str, Any]) -> Dict[str, Any]:
     """Create a new transaction for a user"""
-    now = int(datetime.utcnow().timestamp() * 1000)
+    now = now_ms()
     transaction_id = transaction_data.get("id")
     
     if not transaction_id:
         raise ValueError("Transaction ID is required")
     
-    transaction_doc = {
-        "type": transaction_data["type"],
-        "amount": transaction_data["amount"],
-        "category": transaction_data["category"],
-        "date": transaction_data["date"],
-        "description": transaction_data.get("description", ""),
-        "uid": uid,
-        "created_at": now,
-        "updated_at": now,
-        "deleted_at": None
-    }
+    transaction_doc = new_transaction_doc(uid, transaction_data, now)
+
+    def build_doc(old):
+        if old is not None and old.get("uid") != uid:
+            raise TransactionConflict(f"Transaction ID {transaction_id} is already in use")
+        # A replayed create overwrites the document; the rollup deltas back out what it held
+        return transaction_doc, transaction_doc
     
     # Use custom document ID instead of auto-generated
-    doc_ref = db.collection("transactions").document(transaction_id)
-    doc_ref.set(transaction_doc)
+    await get_storage().write_transaction(uid, transaction_id, build_doc, replace=True)
+    transactions_versions.delete(uid)
     
     # Return with consistent timestamp format
-    return {
+    created = {
         **transaction_doc,
         "id": transaction_id
     }
+    index_transaction(uid, created)
+    return created
+
+async def update_transaction(uid: str, transaction_data: Dict[str, Any], expected_updated_at: Optional[int] = None) -> Dict[str, Any]:
+    """Update an existing transaction for a user.
 
-async def update_transaction(uid: str, transaction_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Update an existing transaction for a user"""
+    Raises TransactionNotFound if the user has no such transaction, and
+    TransactionConflict if ``expected_updated_at`` is given and the stored
+    transaction has a different updated_at.
+    """
     transaction_id = transaction_data.get("id")
     if not transaction_id:
         raise ValueError("Transaction ID is required for update")
 
-    # Query for the document with the custom "id" field using new filter syntax
-    doc_ref = db.collection("transactions").document(transaction_id)
-    doc = doc_ref.get()
-    
-    update_data = {
-        "type": transaction_data["type"],
-        "amount": transaction_data["amount"], 
-        "category": transaction_data["category"],
-        "date": transaction_data["date"],
-        "description": transaction_data.get("description", ""),
-        "updated_at": int(datetime.utcnow().timestamp() * 1000)  # Unix timestamp
-    }
+    update_data = transaction_update_data(transaction_data, now_ms())
+
+    def build_doc(old):
+        old = _check_existing(uid, transaction_id, old, expected_updated_at)
+        return update_data, {**old, **update_data}
     
-    doc_ref.update(update_data)
+    await get_storage().write_transaction(uid, transaction_id, build_doc)
+    transactions_versions.delete(uid)
 
-    return {
+    updated = {
         **update_data,
         "id": transaction_id
     }
+    index_transaction(uid, updated)
+    return updated
+
+async def remove_transaction(transaction_id: str, uid: str, expected_updated_at: Optional[int] = None) -> Dict[str, Any]:
+    """Soft delete a transaction for a user.
 
-async def remove_transaction(transaction_id: str, uid: str) -> Dict[str, Any]:
-    """Soft delete a transaction for a user"""
+    Raises like update_transaction.
+    """
     if not transaction_id:
         raise ValueError("Transaction ID is required")
     
-    # Get document reference directly using the transaction_id
-    doc_ref = db.collection("transactions").document(transaction_id)
-    doc = doc_ref.get()
-    
-    if not doc.exists:
-        raise ValueError(f"Transaction with ID {transaction_id} does not exist")
-    
     # Soft delete with Unix timestamp
-    now = int(datetime.now().timestamp() * 1000)
+    now = now_ms()
     update_data = {
         "deleted_at": now,
         "updated_at": now
     }
+
+    def build_doc(old):
+        old = _check_existing(uid, transaction_id, old, expected_updated_at)
+        return update_data, {**old, **update_data}
     
-    doc_ref.update(update_data)
+    await get_storage().write_transaction(uid, transaction_id, build_doc)
+    transactions_versions.delete(uid)
     
     # Return updated data
-    return {
+    removed = {
         **update_data,
         "id": transaction_id
     }
+    index_transaction(uid, removed)
+    return removed
+
+async def apply_transaction_batch(uid: str, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Apply a list of create/update/delete operations for a user.
+
+    Operations apply in order with as few storage round trips as the
+    backend allows. Operations on missing or foreign transactions fail
+    individually. Returns one result per operation, in the same order.
+    """
+    try:
+        return await get_storage().apply_transaction_batch(uid, operations, now_ms())
+    finally:
+        transactions_versions.delete(uid)
+
+def _summary_months(start: str, end: str) -> List[str]:
+    start_year, start_month = map(int, start.split("-"))
+    end_year, end_month = map(int, end.split("-"))
+    months = []
+    year, month = start_year, start_month
+    while (year, month) <= (end_year, end_month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+async def get_transaction_summary(uid: str, start: str, end: str) -> Dict[str, Any]:
+    """Income/expense totals per month and per category between two YYYY-MM months.
+
+    Reads one rollup document per month in the range rather than the
+    transactions themselves.
+    """
+    months = _summary_months(start, end)
+    if not months:
+        raise ValueError("start must not be after end")
+    if len(months) > SUMMARY_MAX_MONTHS:
+        raise ValueError(f"Range must not span more than {SUMMARY_MAX_MONTHS} months")
+
+    rollups = await get_storage().get_rollups(uid, months)
+
+    # Rollups hold exact minor units; they are summed as integers and only
+    # converted to major units for the response
+    currency = default_currency()
+
+    def amounts(values: Dict[str, int]) -> Dict[str, int]:
+        return {type_: int(values.get(type_, 0)) for type_ in ("income", "expense")}
+
+    def major(values: Dict[str, int]) -> Dict[str, float]:
+        return {type_: to_major_units(amount, currency) for type_, amount in values.items()}
+
+    def add(into: Dict[str, int], values: Dict[str, int]) -> None:
+        for type_, amount in values.items():
+            into[type_] = into.get(type_, 0) + amount
+
+    totals = {"income": 0, "expense": 0}
+    category_totals: Dict[str, Dict[str, int]] = {}
+    summary_months = []
+    for month in months:
+        rollup = rollups.get(month, {})
+        categories = {}
+        for category, values in rollup.get("categories", {}).items():
+            category_amounts = amounts(values)
+            if not any(category_amounts.values()):
+                continue
+            categories[category] = major(category_amounts)
+            add(category_totals.setdefault(category, {}), category_amounts)
+
+        month_totals = amounts(rollup.get("totals", {}))
+        add(totals, month_totals)
+        summary_months.append({"month": month, **major(month_totals), "categories": categories})
+
+    return {
+        "start": start,
+        "end": end,
+        **major(totals),
+        "categories": {category: major(amounts(values)) for category, values in category_totals.items()},
+        "months": summary_months,
+    }
+
+async def rebuild_user_rollups(uid: str) -> int:
+    """Recompute a user's rollup documents from their transactions.
+
+    Used to backfill users whose transactions predate the rollups, or to
+    repair drift. Writes made while it runs can be lost, so run it while
+    the user is idle. Returns the number of months written.
+    """
+    deltas: RollupDeltas = {}
+    async for transaction in stream_user_transactions(uid):
+        merge_rollup_deltas(deltas, rollup_deltas(None, transaction))
+
+    rollups = group_rollups(deltas)
+    # Rollups are overwritten with absolute values rather than incremented
+    await get_storage().replace_rollups(uid, rollups)
+    return len(rollups)
+
+async def migrate_user_amounts(uid: str) -> int:
+    """Convert a user's transactions from before minor units, then rebuild their rollups.
+
+    Transactions without ``amount_minor`` get it and ``currency``, and the
+    rollups are recomputed in minor units. Safe to run again; like
+    rebuild_user_rollups, run it while the user is idle. Returns the
+    number of transactions converted.
+    """
+    fields = {}
+    async for transaction in stream_user_transactions(uid):
+        if transaction.get("amount_minor") is None:
+            fields[transaction["id"]] = amount_fields(transaction)
+    if fields:
+        await get_storage().backfill_transactions(uid, fields)
+        transactions_versions.delete(uid)
+    await rebuild_user_rollups(uid)
+    return len(fields)
+
+async def _get_user_doc(uid: str) -> Optional[Dict[str, Any]]:
+    doc = user_docs.get(uid)
+    if doc is not None:
+        return doc
+    writes = user_doc_writes.peek(uid)
+    doc = await get_storage().get_user(uid)
+    if doc is not None:
+        user_docs.set_if(uid, doc, user_doc_writes, uid, writes)
+    return doc
+
+async def _write_user_doc(uid: str, fields: Optional[Dict[str, Any]] = None, delete: Optional[List[str]] = None) -> None:
+    """Set or remove top-level fields, applying the same change to the cached document"""
+    user_doc_writes.set(uid, secrets.token_hex(8))
+    try:
+        if fields:
+            await get_storage().update_user(uid, fields)
+        if delete:
+            await get_storage().delete_user_fields(uid, delete)
+    except Exception:
+        user_docs.delete(uid)
+        raise
+    finally:
+        user_doc_writes.set(uid, secrets.token_hex(8))
+
+    def apply(cached: Dict[str, Any]) -> Dict[str, Any]:
+        # Cached documents are shared with callers, so replace rather than mutate
+        doc = {**cached, **(fields or {})}
+        for name in delete or []:
+            doc.pop(name, None)
+        return doc
+    user_docs.replace(uid, apply)
 
 async def store_code(uid: str, code: str, mode: str = "verification"):
-    hashed_code = bcrypt.hashpw(code.encode(), bcrypt.gensalt()).decode()
+    hashed_code = await hashing_pool.hash(code)
     expiry_time = datetime.now(timezone.utc) + timedelta(minutes=10)
 
     field_name = "verification" if mode == "verification" else "resetPassword"
 
-    db.collection("users").document(uid).update({
+    await _write_user_doc(uid, {
         field_name: {
             "code": hashed_code,
             "expiresAt": expiry_time
         }
     })
 
-def get_code_data(uid: str, mode: str = "verification"):
-    doc = db.collection("users").document(uid).get()
-    if not doc.exists:
+async def get_code_data(uid: str, mode: str = "verification"):
+    doc_data = await _get_user_doc(uid)
+    if doc_data is None:
         return None
-    doc_data = doc.to_dict() or {}
 
     field_name = "verification" if mode == "verification" else "resetPassword"
     return doc_data.get(field_name, None)
 
 async def delete_code_field(uid: str, mode: str = "verification"):
     field_name = "verification" if mode == "verification" else "resetPassword"
-    db.collection("users").document(uid).update({
-        field_name: DELETE_FIELD
-    })
+    await _write_user_doc(uid, delete=[field_name])
 
 async def set_new_password(uid: str, newPassword: str):
-    auth.update_user(uid, password=newPassword)
+    # firebase_admin.auth has no async API; keep its blocking HTTP call off the loop
+    await run_in_threadpool(firebase_auth().update_user, uid, password=newPassword)
 
-async def send_email(email: str, code: str):
-    db.collection("verificationMail").add({
+def send_email(email: str, code: str, reserved: bool = False):
+    """Queue the code's mail; it is written by the outbox's background task.
+
+    Pass ``reserved`` from inside a ``mail_outbox.reserve()`` block.
+    """
+    mail_outbox.enqueue({
         "to": email,
         "message": {
         "subject": "Thank you for signing up for Fiscus.",
         "text": "Hi there, below is your verification code. ",
         "html": code,
         },
-    })
+    }, reserved=reserved)
 
 async def mark_email_verified(uid: str):
-    db.collection("users").document(uid).update({
+    await _write_user_doc(uid, {
         "emailVerified": True,
     })
 
 async def store_user_pin(uid: str, pin: str):
-    hashed_pin = bcrypt.hashpw(pin.encode(), bcrypt.gensalt()).decode()
-    db.collection("users").document(uid).update({
+    hashed_pin = await hashing_pool.hash(pin)
+    await _write_user_doc(uid, {
         "securityMethod": 'pin',
         "pin": hashed_pin
     })
 
-def get_user_pin_hash(uid: str) -> str | None:
-    doc = db.collection("users").document(uid).get()
-    if not doc.exists:
+async def get_user_pin_hash(uid: str) -> str | None:
+    doc_data = await _get_user_doc(uid)
+    if doc_data is None:
         return None
-    doc_data = doc.to_dict() or {}
     return doc_data.get("pin")
 
-def get_user_by_email(email: str) -> str | None:
-    """Get user data by email address"""
+async def _lookup_uid_by_email(email: str, key: str) -> str | None:
+    auth = firebase_auth()
+    # firebase_admin.auth has no async API; keep its blocking HTTP call off the loop
     try:
-        # First try to get user from Firebase Auth
-        try:
-            user_record = auth.get_user_by_email(email)
-            return user_record.uid
-        except auth.UserNotFoundError:
-            return None
-            
-    except Exception as e:
-        print(f"Error getting user by email: {str(e)}")
-        return None
\ No newline at end of file
+        user_record = await run_in_threadpool(auth.get_user_by_email, email)
+    except auth.UserNotFoundError:
+        email_uids.set(key, _NO_USER, get_settings().email_lookup_negative_ttl_seconds)
+        return None
+    email_uids.set(key, user_record.uid)
+    return user_record.uid
+
+async def get_user_by_email(email: str) -> str | None:
+    """uid of the Firebase Auth user with this email address, or None.
+
+    Answers, including "no such user", are cached, and concurrent lookups
+    of the same address share a single call to Firebase.
+    """
+    email = email.strip()
+    key = email.lower()
+    cached = email_uids.get(key)
+    if cached is not None:
+        return cached or None
+
+    lookup = _email_lookups.get(key)
+    if lookup is None:
+        lookup = asyncio.ensure_future(_lookup_uid_by_email(email, key))
+        _email_lookups[key] = lookup
+        lookup.add_done_callback(lambda _: _email_lookups.pop(key, None))
+    try:
+        # Shielded so one caller going away doesn't cancel the others' lookup
+        return await asyncio.shield(lookup)
+    except Exception:
+        logger.exception("Error getting user by email")
+        return None
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import bcrypt
+
+from app.config import get_settings
+from app.services.metrics import hashing_duration
+
+class HashingPoolBusy(Exception):
+    """Raised when the bcrypt pool's queue is full and the caller should back off"""
+
+def _hash(secret: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(secret, bcrypt.gensalt(rounds=rounds))
+
+def _check(secret: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(secret, hashed)
+
+class HashingPool:
+    """Runs bcrypt hashing and checks on a dedicated worker pool.
+
+    Each bcrypt call burns 100-300 ms of CPU, so running them on the event
+    loop stalls every other request on the worker. Work is submitted to a
+    thread or process pool instead; once ``workers + max_queue`` jobs are
+    outstanding new jobs are rejected with HashingPoolBusy rather than
+    queueing without bound.
+    """
+
+    def __init__(self, workers: int, max_queue: int, rounds: int, kind: str = "thread"):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self.kind = kind
+        self.outstanding = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, operation: str, fn, *args):
+        if self.outstanding >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HashingPoolBusy("Too many pending hashing jobs")
+
+        self.outstanding += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.outstanding -= 1
+            self.completed += 1
+            hashing_duration.observe(time.perf_counter() - start, operation)
+
+    async def hash(self, secret: str) -> str:
+        """Hash a secret with the configured bcrypt work factor"""
+        return (await self._run("hash", _hash, secret.encode(), self.rounds)).decode()
+
+    async def check(self, secret: str, hashed: str) -> bool:
+        """Check a secret against a stored bcrypt hash"""
+        return await self._run("check", _check, secret.encode(), hashed.encode())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_depth": max(0, self.outstanding - self.workers),
+            "outstanding": self.outstanding,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+_settings = get_settings()
+hashing_pool = HashingPool(
+    workers=_settings.bcrypt_workers,
+    max_queue=_settings.bcrypt_max_queue,
+    rounds=_settings.bcrypt_rounds,
+    kind=_settings.bcrypt_executor,
+)
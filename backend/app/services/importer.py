@@ -0,0 +1,342 @@
+"""Bulk import of bank history from CSV or OFX files.
+
+An upload is copied to a temporary file and imported by a background task,
+so the request returns straight away with a job to poll. The file is parsed
+incrementally, validated against TransactionCreate a chunk of rows at a
+time in a worker thread, and each chunk is written with one
+apply_transaction_batch call.
+
+Every row gets an id derived from its content (for OFX, from the bank's
+FITID) and is only created if that id doesn't exist yet, so importing the
+same file again adds nothing. Identical rows in one file are told apart
+by how many times the row has appeared before.
+
+Jobs run in the process that accepted the upload, which also enforces the
+one-import-per-user limit; their progress is kept in the import_jobs cache
+(shared by every worker with ``Settings.shared_cache_path``) and forgotten
+an hour after they finish.
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+
+from app.config import get_settings
+from app.models.money import default_currency, to_minor_units
+from app.models.transaction import TransactionCreate
+from app.services.firestore_service import apply_transaction_batch
+from app.services.shared_cache import make_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORY = "uncategorized"
+# Row errors kept per job; later ones are only counted
+MAX_REPORTED_ERRORS = 100
+
+CSV_COLUMNS = {"date", "amount", "type", "category", "description", "currency"}
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+class ImportFileError(ValueError):
+    """The upload can't be imported at all"""
+
+class ImportTooLarge(ImportFileError):
+    """The upload is larger than Settings.import_max_bytes"""
+
+class ImportBusy(Exception):
+    """The user already has an import running, or the process is at its limit"""
+
+class ImportJob:
+    def __init__(self, uid: str, format: str, path: str, size: int):
+        self.id = uuid.uuid4().hex
+        self.uid = uid
+        self.format = format
+        self.path = path
+        self.status = "running"
+        self.bytes_total = size
+        self.bytes_read = 0
+        self.rows = 0
+        self.imported = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self.started_at = int(time.time() * 1000)
+        self.finished_at: Optional[int] = None
+
+    def row_failed(self, row: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": error})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "format": self.format,
+            "bytes_total": self.bytes_total,
+            "bytes_read": self.bytes_read,
+            "rows": self.rows,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "errors": self.errors,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+# Snapshots of every job, pollable from any worker when caches are shared
+import_jobs = make_cache("import_jobs", maxsize=10_000, default_ttl=get_settings().import_job_ttl_seconds)
+# uid -> its running import; also keeps a reference to the task so it isn't collected
+_running: Dict[str, Optional[asyncio.Task]] = {}
+
+# Parsing
+
+def _iso_date(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 8 and value[:8].isdigit():
+        # OFX dates: YYYYMMDD[HHMMSS[.XXX]][[tz]]
+        value = f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise ValueError("date must be YYYY-MM-DD")
+
+def _amount(value: str) -> Decimal:
+    try:
+        amount = Decimal(value.strip().replace(",", ""))
+    except InvalidOperation:
+        raise ValueError("amount is not a number")
+    if not amount.is_finite():
+        raise ValueError("amount is not a number")
+    return amount
+
+def csv_rows(stream: TextIO) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """(line number, fields) for every CSV record, with lowercased column names.
+
+    A header row naming at least ``date`` and ``amount`` is required; a
+    negative amount is an expense unless a ``type`` column says otherwise.
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    columns = [name.strip().lower() for name in header or []]
+    if not {"date", "amount"} <= set(columns):
+        raise ImportFileError("CSV needs a header row with at least date and amount columns")
+    for record in reader:
+        if not any(value.strip() for value in record):
+            continue
+        yield reader.line_num, {
+            column: value.strip()
+            for column, value in zip(columns, record)
+            if column in CSV_COLUMNS
+        }
+
+def ofx_rows(stream: TextIO, chunk_size: int = 64 * 1024) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """(position, fields) for every <STMTTRN> in an OFX 1.x (SGML) or 2.x (XML) file"""
+    seen_ofx = False
+    currency = None
+    transaction: Optional[Dict[str, str]] = None
+    position = 0
+    buffer = ""
+
+    def tokens(text):
+        nonlocal seen_ofx, currency, transaction, position
+        for closing, name, value in _OFX_TAG.findall(text):
+            name = name.upper()
+            value = value.strip()
+            if closing:
+                if name == "STMTTRN" and transaction is not None:
+                    position += 1
+                    yield position, {
+                        "date": transaction.get("DTPOSTED", ""),
+                        "amount": transaction.get("TRNAMT", ""),
+                        "description": " - ".join(filter(None, (transaction.get("NAME"), transaction.get("MEMO")))),
+                        "currency": currency or "",
+                        "fitid": transaction.get("FITID", ""),
+                    }
+                    transaction = None
+            elif name == "OFX":
+                seen_ofx = True
+            elif name == "CURDEF":
+                currency = value
+            elif name == "STMTTRN":
+                transaction = {}
+            elif transaction is not None and value:
+                transaction[name] = value
+
+    for chunk in iter(lambda: stream.read(chunk_size), ""):
+        buffer += chunk
+        # Everything before the last "<" is whole tags with their whole values
+        cut = buffer.rfind("<")
+        if cut > 0:
+            yield from tokens(buffer[:cut])
+            buffer = buffer[cut:]
+    yield from tokens(buffer)
+    if not seen_ofx:
+        raise ImportFileError("Not an OFX file")
+
+class _ChunkReader:
+    """Turns parsed rows into validated create operations, a chunk at a time"""
+
+    def __init__(self, job: ImportJob, raw: BinaryIO):
+        self.job = job
+        self.raw = raw
+        # Held here: once the generator finishes, a collected wrapper would close ``raw``
+        self.text = io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline="")
+        self.rows = csv_rows(self.text) if job.format == "csv" else ofx_rows(self.text)
+        self.occurrences: Dict[bytes, int] = {}
+        self.done = False
+
+    def _transaction(self, fields: Dict[str, str]) -> Dict[str, Any]:
+        amount = _amount(fields.get("amount", ""))
+        type_ = fields.get("type", "").lower()
+        if not type_:
+            type_ = "expense" if amount < 0 else "income"
+        currency = (fields.get("currency") or default_currency()).upper()
+        return {
+            "uid": self.job.uid,
+            "type": type_,
+            "amount_minor": to_minor_units(abs(amount), currency),
+            "currency": currency,
+            "category": fields.get("category") or DEFAULT_CATEGORY,
+            "date": _iso_date(fields.get("date", "")),
+            "description": fields.get("description", ""),
+        }
+
+    def _transaction_id(self, data: Dict[str, Any], fitid: str) -> str:
+        if fitid:
+            key = f"{self.job.uid}\x1fofx\x1f{fitid}"
+        else:
+            content = "\x1f".join(str(data[name]) for name in ("uid", "date", "type", "amount_minor", "currency", "category", "description"))
+            digest = hashlib.sha256(content.encode()).digest()
+            occurrence = self.occurrences.get(digest, 0)
+            self.occurrences[digest] = occurrence + 1
+            key = f"{content}\x1f{occurrence}"
+        return "imp_" + hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def next_chunk(self, size: int) -> List[Dict[str, Any]]:
+        """Up to ``size`` create operations; sets ``done`` once the file is exhausted"""
+        operations = []
+        while len(operations) < size:
+            item = next(self.rows, None)
+            if item is None:
+                self.done = True
+                break
+            row, fields = item
+            self.job.rows += 1
+            try:
+                data = self._transaction(fields)
+                data["id"] = self._transaction_id(data, fields.get("fitid", ""))
+                transaction = TransactionCreate.model_validate(data).model_dump()
+            except ValidationError as e:
+                error = e.errors()[0]
+                self.job.row_failed(row, f"{'.'.join(map(str, error['loc'])) or 'row'}: {error['msg']}")
+                continue
+            except ValueError as e:
+                self.job.row_failed(row, str(e))
+                continue
+            operations.append({"op": "create", "id": transaction["id"], "transaction": transaction, "if_absent": True})
+        self.job.bytes_read = self.raw.tell()
+        return operations
+
+# Jobs
+
+def _spool(upload: BinaryIO, max_bytes: int) -> Tuple[str, int]:
+    handle, path = tempfile.mkstemp(prefix="fiscus-import-")
+    size = 0
+    try:
+        with os.fdopen(handle, "wb") as out:
+            while True:
+                block = upload.read(1024 * 1024)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise ImportTooLarge(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+                out.write(block)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, size
+
+async def _run(job: ImportJob) -> None:
+    settings = get_settings()
+    try:
+        with open(job.path, "rb") as raw:
+            reader = _ChunkReader(job, raw)
+            while not reader.done:
+                # Parsing and validation run off the event loop
+                operations = await run_in_threadpool(reader.next_chunk, settings.import_chunk_rows)
+                # Keep the job pollable however long the import takes
+                import_jobs.set(job.id, job)
+                if not operations:
+                    continue
+                for result in await apply_transaction_batch(job.uid, operations):
+                    if result.get("skipped"):
+                        job.skipped += 1
+                    elif result["success"]:
+                        job.imported += 1
+                    else:
+                        job.row_failed(0, result["error"])
+        job.status = "completed"
+    except ImportFileError as e:
+        job.status = "failed"
+        job.error = str(e)
+    except Exception:
+        logger.exception("Import failed", extra={"job_id": job.id})
+        job.status = "failed"
+        job.error = "Import failed"
+    finally:
+        job.finished_at = int(time.time() * 1000)
+        import_jobs.set(job.id, job)
+        os.unlink(job.path)
+        logger.info("Import finished", extra={
+            "job_id": job.id, "status": job.status, "rows": job.rows,
+            "imported": job.imported, "skipped": job.skipped, "failed": job.failed,
+        })
+
+async def start_import(uid: str, format: str, upload: BinaryIO) -> ImportJob:
+    """Copy the upload aside and start importing it in the background.
+
+    Raises ImportBusy if the user already has an import running or too many
+    are running in this process, and ImportTooLarge for oversized files.
+    """
+    settings = get_settings()
+    if uid in _running:
+        raise ImportBusy("An import is already running for this user")
+    if len(_running) >= settings.import_max_running:
+        raise ImportBusy("Too many imports are running, please try again shortly")
+
+    # Hold the user's slot while the upload is copied
+    _running[uid] = None
+    try:
+        path, size = await run_in_threadpool(_spool, upload, settings.import_max_bytes)
+    except BaseException:
+        del _running[uid]
+        raise
+    job = ImportJob(uid, format, path, size)
+    import_jobs.set(job.id, job)
+
+    task = asyncio.create_task(_run(job))
+    _running[uid] = task
+    task.add_done_callback(lambda _: _running.pop(uid, None))
+    return job
+
+def get_import_job(uid: str, job_id: str) -> Optional[ImportJob]:
+    """The user's import job, or None if unknown, expired or someone else's"""
+    job = import_jobs.get(job_id)
+    if job is None or job.uid != uid:
+        return None
+    return job
@@ -0,0 +1,135 @@
+"""In-process mail outbox.
+
+Requests only put mail on a queue; a background task drains it and writes
+up to ``batch_size`` documents per storage call, so sending a code costs
+the request no I/O and a burst of codes costs a handful of writes.
+
+Mail still queued when the process dies is lost; the user asks for a new
+code. The queue is bounded and a full queue is reported with OutboxFull.
+A caller with work to do before it has the mail (storing the code it
+carries) reserves its place first, so it never does that work and then
+finds the queue full.
+"""
+import asyncio
+import contextlib
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.config import get_settings
+from app.services.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Attempts per batch before its mail is dropped, with exponential backoff between them
+WRITE_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 0.5
+
+class OutboxFull(Exception):
+    """Raised when more mail is queued than the outbox holds"""
+
+class MailOutbox:
+    """Queue of mail documents flushed to storage in batches by a background task.
+
+    The task starts with the first mail queued on a running loop and is
+    stopped, after writing whatever is still queued, by ``close()``.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        # Places held by reserve() blocks that haven't queued their mail yet
+        self._reserved = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._writing: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __len__(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A queue is tied to the loop it was first used on
+            self._queue = asyncio.Queue()
+            self._task = None
+            self._loop = loop
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    def _check_room(self) -> None:
+        if self._queue.qsize() + self._reserved >= self.max_queue:
+            self.rejected += 1
+            raise OutboxFull("Mail outbox is full")
+
+    @contextlib.contextmanager
+    def reserve(self) -> Iterator[None]:
+        """Hold a place in the queue for one mail queued inside the block; raises OutboxFull if there is none"""
+        self._ensure_running()
+        self._check_room()
+        self._reserved += 1
+        try:
+            yield
+        finally:
+            self._reserved -= 1
+
+    def enqueue(self, mail: Dict[str, Any], reserved: bool = False) -> None:
+        """Queue one mail document; must be called from the event loop.
+
+        Pass ``reserved`` from inside a ``reserve()`` block to use its place.
+        """
+        self._ensure_running()
+        if not reserved:
+            self._check_room()
+        self._queue.put_nowait(mail)
+
+    async def _fill_batch(self) -> None:
+        self._writing.append(await self._queue.get())
+        # Give a burst time to arrive so it goes out in one write
+        await asyncio.sleep(self.flush_interval)
+        while len(self._writing) < self.batch_size and not self._queue.empty():
+            self._writing.append(self._queue.get_nowait())
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                await get_storage().add_mails(batch)
+                self.written += len(batch)
+                return
+            except Exception:
+                if attempt == WRITE_ATTEMPTS - 1:
+                    self.failed += len(batch)
+                    logger.exception("Dropping mail batch", extra={"mails": len(batch)})
+                    return
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+    async def _run(self) -> None:
+        while True:
+            await self._fill_batch()
+            await self._write(self._writing)
+            self._writing = []
+
+    async def close(self) -> None:
+        """Stop the background task and write the mail still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        # A batch interrupted mid-write is written again; at worst a mail goes out twice
+        remaining, self._writing = self._writing, []
+        while self._queue is not None and not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        for start in range(0, len(remaining), self.batch_size):
+            await self._write(remaining[start:start + self.batch_size])
+
+_settings = get_settings()
+mail_outbox = MailOutbox(
+    max_queue=_settings.mail_queue_size,
+    batch_size=_settings.mail_batch_size,
+    flush_interval=_settings.mail_flush_interval_ms / 1000,
+)
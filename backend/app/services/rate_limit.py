@@ -0,0 +1,103 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from app.config import get_settings
+from app.services.shared_cache import SharedStore, SharedStoreBusy, shared_store
+
+class RateLimited(Exception):
+    """Raised when a key has used up its tokens; ``retry_after`` is in seconds"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class TokenBucketLimiter:
+    """Token bucket per key, held in process.
+
+    Every key starts with ``burst`` tokens and regains ``rate`` tokens per
+    second up to ``burst``; each ``acquire`` takes one. Buckets are kept
+    least-recently-used up to ``maxsize`` keys, so an evicted key starts
+    afresh. With several workers each enforces its own limit; see
+    SharedTokenBucketLimiter.
+    """
+
+    def __init__(self, burst: int, rate: float, maxsize: int):
+        self.burst = burst
+        self.rate = rate
+        self.maxsize = maxsize
+        self.limited = 0
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _take(self, bucket: Optional[Tuple[float, float]], now: float) -> Tuple[Tuple[float, float], Optional[int]]:
+        """The (tokens, updated) bucket after taking a token at ``now``, and the retry delay if none was left"""
+        tokens, updated = bucket or (self.burst, now)
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            return (tokens, now), math.ceil((1 - tokens) / self.rate)
+        return (tokens - 1, now), None
+
+    def acquire(self, key: Hashable) -> None:
+        """Take a token for ``key`` or raise RateLimited"""
+        now = time.monotonic()
+        with self._lock:
+            bucket, retry_after = self._take(self._buckets.get(key), now)
+            self._buckets[key] = bucket
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            if retry_after is not None:
+                self.limited += 1
+                raise RateLimited(retry_after)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+class SharedTokenBucketLimiter(TokenBucketLimiter):
+    """TokenBucketLimiter whose buckets live in a SharedStore, so the limit holds across workers.
+
+    A bucket is dropped once it would have refilled completely, which is
+    the same as starting afresh. ``limited`` is counted per process. While
+    another worker holds the store's lock, keys fall back to this process's
+    own buckets rather than wait.
+    """
+
+    def __init__(self, store: SharedStore, namespace: str, burst: int, rate: float, maxsize: int):
+        super().__init__(burst, rate, maxsize)
+        self.store = store
+        self.namespace = namespace
+
+    def acquire(self, key: Hashable) -> None:
+        try:
+            retry_after = self.store.update(
+                self.namespace, key, lambda bucket: self._take(bucket, time.time()),
+                ttl=self.burst / self.rate, maxsize=self.maxsize,
+            )
+        except SharedStoreBusy:
+            super().acquire(key)
+            return
+        if retry_after is not None:
+            with self._lock:
+                self.limited += 1
+            raise RateLimited(retry_after)
+
+    def __len__(self) -> int:
+        try:
+            return self.store.count(self.namespace)
+        except SharedStoreBusy:
+            return super().__len__()
+
+def make_limiter(namespace: str, burst: int, rate: float, maxsize: int) -> TokenBucketLimiter:
+    """A limiter shared by every worker when ``Settings.shared_cache_path`` is set, else in process"""
+    store = shared_store()
+    if store is None:
+        return TokenBucketLimiter(burst, rate, maxsize)
+    return SharedTokenBucketLimiter(store, namespace, burst, rate, maxsize)
+
+# Sending a verification or reset code; one bucket per email address and one per uid
+_settings = get_settings()
+code_email_limiter = make_limiter("code_email", _settings.code_rate_burst, _settings.code_rate_per_hour / 3600, _settings.code_rate_max_keys)
+code_uid_limiter = make_limiter("code_uid", _settings.code_rate_burst, _settings.code_rate_per_hour / 3600, _settings.code_rate_max_keys)
@@ -0,0 +1,243 @@
+"""Recurring rules and the scheduler that turns their occurrences into transactions.
+
+A rule is a transaction template plus a schedule (weekly or monthly,
+every ``interval`` periods, optionally moved off weekends). Each rule
+stores ``next_run``, the date of its next occurrence not yet created. The
+scheduler asks storage for rules with next_run on or before today, through
+an index on next_run, so a pass costs one query when nothing is due
+however many rules exist.
+
+Every occurrence becomes transaction ``rec_<rule id>_<date>``, written by
+apply_transaction_batch as a create that is skipped if the transaction
+already exists. A pass that dies between creating transactions and
+advancing next_run just repeats harmlessly, several workers can run the
+scheduler at once, and a scheduler that was down catches up on every missed
+occurrence the next time it runs.
+
+Dates are UTC.
+"""
+import asyncio
+import calendar
+import logging
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.config import get_settings
+from app.models.money import amount_fields
+from app.services.firestore_service import apply_transaction_batch
+from app.services.storage import get_storage
+from app.services.storage.common import now_ms
+
+logger = logging.getLogger(__name__)
+
+# Create operations per apply_transaction_batch call
+BATCH_SIZE = 500
+
+TEMPLATE_FIELDS = ("type", "amount", "amount_minor", "currency", "category", "description")
+SCHEDULE_FIELDS = ("date", "frequency", "interval", "day", "business_day", "end_date")
+
+class RuleNotFound(Exception):
+    """The rule does not exist or belongs to another user"""
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+# Schedules
+
+def _month_day(year: int, month: int, day: int, business_day: bool) -> date:
+    last = calendar.monthrange(year, month)[1]
+    result = date(year, month, last if day == -1 else min(day, last))
+    if business_day and result.weekday() >= 5:
+        friday = result - timedelta(days=result.weekday() - 4)
+        result = friday if friday.month == month else result + timedelta(days=7 - result.weekday())
+    return result
+
+def occurrences(rule: Dict[str, Any], since: date) -> Iterator[date]:
+    """The rule's occurrences on or after ``since``, in order, until its end_date"""
+    start = date.fromisoformat(rule["date"])
+    end = date.fromisoformat(rule["end_date"]) if rule.get("end_date") else None
+    since = max(since, start)
+    interval = rule.get("interval") or 1
+    day = rule.get("day")
+
+    if rule["frequency"] == "weekly":
+        weekday = start.weekday() if day is None else day
+        first = start + timedelta(days=(weekday - start.weekday()) % 7)
+        step = timedelta(weeks=interval)
+        # Jump straight to the period containing ``since``
+        current = first + step * max(0, (since - first) // step)
+        while end is None or current <= end:
+            if current >= since:
+                yield current
+            current += step
+    else:
+        day = start.day if day is None else day
+        first_month = start.year * 12 + start.month - 1
+        # Start from the last period beginning no later than the month of ``since``
+        period = max(0, (since.year * 12 + since.month - 1 - first_month) // interval)
+        while True:
+            month = first_month + period * interval
+            current = _month_day(month // 12, month % 12 + 1, day, rule.get("business_day", False))
+            if end is not None and current > end:
+                return
+            if current >= since:
+                yield current
+            period += 1
+
+def next_run(rule: Dict[str, Any], since: date) -> Optional[str]:
+    """The first occurrence on or after ``since`` as YYYY-MM-DD, or None if the rule has ended"""
+    occurrence = next(occurrences(rule, since), None)
+    return occurrence.isoformat() if occurrence else None
+
+def due_occurrences(rule: Dict[str, Any], today: date, limit: int) -> Tuple[List[date], Optional[str]]:
+    """Occurrences from next_run through ``today`` (at most ``limit``), and the next_run after them"""
+    due = []
+    for occurrence in occurrences(rule, date.fromisoformat(rule["next_run"])):
+        if occurrence > today or len(due) == limit:
+            return due, occurrence.isoformat()
+        due.append(occurrence)
+    return due, None
+
+def occurrence_id(rule_id: str, occurrence: date) -> str:
+    return f"rec_{rule_id}_{occurrence.isoformat()}"
+
+def _create_operation(rule: Dict[str, Any], occurrence: date) -> Dict[str, Any]:
+    transaction_id = occurrence_id(rule["id"], occurrence)
+    transaction = {field: rule.get(field) for field in TEMPLATE_FIELDS}
+    transaction.update(id=transaction_id, uid=rule["uid"], date=occurrence.isoformat())
+    return {"op": "create", "id": transaction_id, "transaction": transaction, "if_absent": True}
+
+# Scheduler
+
+class RecurringScheduler:
+    """Creates the transactions of every due rule, for all users, in batches"""
+
+    def __init__(self, page_size: int, max_catch_up: int):
+        self.page_size = page_size
+        self.max_catch_up = max_catch_up
+        self.created = 0
+        self.failed = 0
+
+    async def materialize(self, rules: List[Dict[str, Any]], today: date) -> int:
+        """Create the rules' due occurrences and advance them; returns how many rules advanced"""
+        plans = []
+        operations: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for rule in rules:
+            due, following = due_occurrences(rule, today, self.max_catch_up)
+            plans.append((rule, due, following))
+            operations[rule["uid"]].extend(_create_operation(rule, occurrence) for occurrence in due)
+
+        failed_uids = set()
+        for uid, user_operations in operations.items():
+            try:
+                for start in range(0, len(user_operations), BATCH_SIZE):
+                    for result in await apply_transaction_batch(uid, user_operations[start:start + BATCH_SIZE]):
+                        if not result["success"]:
+                            self.failed += 1
+                            logger.warning("Recurring transaction not created", extra={"transaction_id": result["id"], "error": result["error"]})
+                        elif not result.get("skipped"):
+                            self.created += 1
+            except Exception:
+                # Leave this user's rules due so the next pass retries them
+                logger.exception("Recurring transactions failed", extra={"rules": sum(rule["uid"] == uid for rule in rules)})
+                failed_uids.add(uid)
+
+        advanced = 0
+        storage = get_storage()
+        for rule, due, following in plans:
+            if rule["uid"] in failed_uids:
+                continue
+            fields = {"next_run": following}
+            if due:
+                fields["last_run"] = due[-1].isoformat()
+            # A rule edited meanwhile keeps the next_run its edit set
+            if await storage.update_recurring_rule(rule["id"], fields, rule["next_run"]):
+                advanced += 1
+        return advanced
+
+    async def run_due(self, today: Optional[date] = None) -> int:
+        """Create every occurrence due by ``today`` (default: today UTC); returns how many were created"""
+        today = today or _today()
+        created = self.created
+        while True:
+            rules = await get_storage().get_due_recurring_rules(today.isoformat(), self.page_size)
+            if not rules:
+                break
+            advanced = await self.materialize(rules, today)
+            # A short page was the last; no progress means every rule left is failing
+            if len(rules) < self.page_size or not advanced:
+                break
+        return self.created - created
+
+    async def run_forever(self, interval_seconds: float) -> None:
+        """Run a pass now and then every ``interval_seconds``"""
+        while True:
+            try:
+                created = await self.run_due()
+                if created:
+                    logger.info("Recurring transactions created", extra={"created": created})
+            except Exception:
+                logger.exception("Recurring rules pass failed")
+            await asyncio.sleep(interval_seconds)
+
+_settings = get_settings()
+recurring_scheduler = RecurringScheduler(_settings.recurring_page_size, _settings.recurring_max_catch_up)
+
+# Rules
+
+def _rule_fields(rule_data: Dict[str, Any]) -> Dict[str, Any]:
+    fields = {field: rule_data.get(field) for field in SCHEDULE_FIELDS}
+    fields.update(
+        type=rule_data["type"],
+        category=rule_data["category"],
+        description=rule_data.get("description", ""),
+        **amount_fields(rule_data),
+    )
+    return fields
+
+async def get_rules(uid: str) -> List[Dict[str, Any]]:
+    """The user's rules, the next to run first and ended ones last"""
+    rules = await get_storage().get_recurring_rules(uid)
+    return sorted(rules, key=lambda rule: (rule.get("next_run") is None, rule.get("next_run") or "", rule["id"]))
+
+async def _get_own_rule(uid: str, rule_id: str) -> Dict[str, Any]:
+    rule = await get_storage().get_recurring_rule(rule_id)
+    if rule is None or rule.get("uid") != uid:
+        raise RuleNotFound(f"Recurring rule {rule_id} not found")
+    return rule
+
+async def _save_and_catch_up(rule: Dict[str, Any]) -> Dict[str, Any]:
+    """Store the rule and create its occurrences up to today straight away"""
+    await get_storage().put_recurring_rule(rule)
+    if rule["next_run"] is not None and rule["next_run"] <= _today().isoformat():
+        await recurring_scheduler.materialize([rule], _today())
+        rule = await get_storage().get_recurring_rule(rule["id"]) or rule
+    return rule
+
+async def create_rule(uid: str, rule_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Create a rule; occurrences from its start date through today are created at once"""
+    now = now_ms()
+    rule = {"id": uuid.uuid4().hex, "uid": uid, **_rule_fields(rule_data), "last_run": None, "created_at": now, "updated_at": now}
+    rule["next_run"] = next_run(rule, date.fromisoformat(rule["date"]))
+    return await _save_and_catch_up(rule)
+
+async def update_rule(uid: str, rule_id: str, rule_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace a rule's template and schedule.
+
+    Transactions already created are left as they are; the new schedule
+    picks up after the latest of them.
+    """
+    old = await _get_own_rule(uid, rule_id)
+    rule = {**old, **_rule_fields(rule_data), "updated_at": now_ms()}
+    since = date.fromisoformat(rule["date"])
+    if old.get("last_run"):
+        since = max(since, date.fromisoformat(old["last_run"]) + timedelta(days=1))
+    rule["next_run"] = next_run(rule, since)
+    return await _save_and_catch_up(rule)
+
+async def delete_rule(uid: str, rule_id: str) -> None:
+    """Stop a rule; the transactions it created stay"""
+    await _get_own_rule(uid, rule_id)
+    await get_storage().delete_recurring_rule(rule_id)
@@ -0,0 +1,118 @@
+"""In-memory inverted index over a user's transaction descriptions.
+
+Firestore can't match words inside a string, so text search runs against
+a per-user index held in process: every live transaction keyed by id, and
+for each lowercased word in the descriptions the ids that contain it. A
+sorted vocabulary beside the postings turns a prefix into a range found by
+bisection, so "gro" finds "groceries" without scanning every word.
+
+Indexes are built on a user's first search (see
+firestore_service.search_transactions) and kept in an LRU cache. This
+process's create/update/delete calls apply their changes to a cached
+index straight away; anything else (batches, imports, other workers) is
+picked up from the updated_at feed when the user's transactions version
+moves.
+"""
+import re
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Set
+
+from app.config import get_settings
+from app.services.cache import TTLCache
+
+_WORD = re.compile(r"\w+")
+
+def words(text: Optional[str]) -> List[str]:
+    """The distinct lowercased words of ``text``, in order"""
+    return list(dict.fromkeys(_WORD.findall((text or "").lower())))
+
+class TransactionIndex:
+    """One user's live transactions and the words of their descriptions"""
+
+    def __init__(self, version: int):
+        # The transactions version the index is known to be current with
+        self.version = version
+        # Greatest updated_at read from storage; catching up reads changes after it
+        self.synced_to = 0
+        self.transactions: Dict[str, Dict[str, Any]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._vocabulary: List[str] = []  # sorted keys of _postings
+        self._vocabulary_stale = False
+
+    def __len__(self) -> int:
+        return len(self.transactions)
+
+    def _unindex(self, transaction_id: str) -> None:
+        old = self.transactions.pop(transaction_id, None)
+        if old is None:
+            return
+        for word in words(old.get("description")):
+            ids = self._postings.get(word)
+            if ids is not None:
+                ids.discard(transaction_id)
+                if not ids:
+                    del self._postings[word]
+                    self._vocabulary_stale = True
+
+    def apply(self, transaction: Dict[str, Any]) -> None:
+        """Index a transaction, or drop it if soft-deleted.
+
+        ``transaction`` may hold only the fields a write changed; they are
+        merged into the indexed copy. A partial change to a transaction the
+        index doesn't hold is ignored, to be read in full on catch-up.
+        """
+        transaction_id = transaction["id"]
+        merged = {**self.transactions.get(transaction_id, {}), **transaction}
+        self._unindex(transaction_id)
+        if merged.get("deleted_at") is not None or "date" not in merged:
+            return
+        self.transactions[transaction_id] = merged
+        for word in words(merged.get("description")):
+            ids = self._postings.get(word)
+            if ids is None:
+                self._postings[word] = ids = set()
+                self._vocabulary_stale = True
+            ids.add(transaction_id)
+
+    def read(self, transaction: Dict[str, Any]) -> None:
+        """Apply a transaction read from storage, moving ``synced_to`` past it"""
+        self.apply(transaction)
+        self.synced_to = max(self.synced_to, transaction.get("updated_at") or 0)
+
+    def _prefix_ids(self, prefix: str) -> Set[str]:
+        if self._vocabulary_stale:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_stale = False
+        ids: Set[str] = set()
+        for position in range(bisect_left(self._vocabulary, prefix), len(self._vocabulary)):
+            word = self._vocabulary[position]
+            if not word.startswith(prefix):
+                break
+            ids |= self._postings[word]
+        return ids
+
+    def match(self, prefixes: List[str]) -> List[Dict[str, Any]]:
+        """Transactions whose description has a word starting with every one of ``prefixes``"""
+        if not prefixes:
+            return []
+        ids: Optional[Set[str]] = None
+        # Narrowest first, so the intersections stay small
+        for candidates in sorted((self._prefix_ids(prefix) for prefix in prefixes), key=len):
+            ids = candidates if ids is None else ids & candidates
+            if not ids:
+                return []
+        return [self.transactions[transaction_id] for transaction_id in ids or ()]
+
+# uid -> TransactionIndex. Entries aren't weighed (an index is mutated in
+# place after it is cached), so the bound is on users; each search re-sets
+# its entry, so an index lasts search_index_ttl_seconds past its last search
+search_indexes = TTLCache(
+    maxsize=get_settings().search_index_cache_size,
+    default_ttl=get_settings().search_index_ttl_seconds,
+)
+
+def index_transaction(uid: str, transaction: Dict[str, Any]) -> None:
+    """Apply a write this process made to the user's index, if one is cached"""
+    index = search_indexes.peek(uid)
+    if index is not None:
+        index.apply(transaction)
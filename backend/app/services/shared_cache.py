@@ -0,0 +1,386 @@
+"""Cache and rate limit state shared by every worker process on a host.
+
+With ``Settings.shared_cache_path`` set, caches made by ``make_cache`` keep
+their entries in one SQLite file that all workers open, so a token
+verified, a user document read or a code requested on one worker counts on
+all of them. Put the file on tmpfs (``/dev/shm``) and it never touches a
+disk; a lookup is a primary key read of a few microseconds.
+
+Calls run on the caller's thread, usually the event loop, so none may wait
+long for another worker's write lock: SQLite gives up after
+``Settings.shared_cache_busy_timeout_ms`` and the store raises
+SharedStoreBusy. A lookup then counts as a miss and reads storage, a set
+is skipped, and a delete is retried on a background thread while this
+process treats the key as missing.
+
+Unset, ``make_cache`` returns a plain in-process TTLCache, as for a single
+worker.
+"""
+import os
+import pickle
+import sqlite3
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Hashable, Optional, Set, Tuple
+
+from app.config import get_settings
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+"""
+
+# Every this many writes to a namespace, a process drops its expired entries and trims it to maxsize
+TRIM_EVERY = 1000
+
+# How long the background thread waits for the lock when retrying a delete
+RETRY_BUSY_TIMEOUT_SECONDS = 5.0
+
+class SharedStoreBusy(Exception):
+    """Another worker held the store's write lock for longer than the busy timeout"""
+
+class SharedStore:
+    """Pickled values with a wall-clock expiry, in an SQLite file opened by every worker.
+
+    Each thread of each process has its own connection; WAL lets reads run
+    alongside the one writer. When a namespace holds more than its maxsize,
+    or its pickled values more than its max_bytes, the entries closest to
+    expiry are dropped first. Any call may raise SharedStoreBusy instead of
+    waiting out another worker's write.
+    """
+
+    def __init__(self, path: str, busy_timeout: float):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._writes: dict = {}
+        # Deletes that hit a busy lock: retried on one thread, and until then
+        # the keys read as missing in this process
+        self._retries = ThreadPoolExecutor(1, thread_name_prefix="shared-cache")
+        self._pending: Set[Tuple[str, str]] = set()
+        self._pending_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Keyed by pid too: a connection must not be used across a fork
+        conn, pid = getattr(self._local, "conn", (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=self.busy_timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.executescript(SCHEMA)
+            self._local.conn = (conn, os.getpid())
+        return conn
+
+    def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Call ``fn`` with this thread's connection, turning a lock timeout into SharedStoreBusy"""
+        try:
+            return fn(self._conn())
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) or "busy" in str(e):
+                raise SharedStoreBusy(str(e)) from e
+            raise
+
+    def _is_pending(self, namespace: str, key: Hashable) -> bool:
+        if not self._pending:
+            return False
+        with self._pending_lock:
+            return (namespace, str(key)) in self._pending
+
+    @staticmethod
+    def _transaction(conn: sqlite3.Connection, fn: Callable[[], Any]) -> Any:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, namespace: str, key: Hashable) -> Any:
+        row = conn.execute(
+            "SELECT value FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, str(key), time.time()),
+        ).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """(value, expires_at) for a live entry, or None"""
+        if self._is_pending(namespace, key):
+            return None
+        row = self._run(lambda conn: conn.execute(
+            "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, str(key), time.time()),
+        ).fetchone())
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0]), row[1]
+        except Exception:
+            # Written by another version of the code; treat as missing
+            return None
+
+    @staticmethod
+    def _put(conn: sqlite3.Connection, namespace: str, key: Hashable, value: Any, ttl: float, max_bytes: Optional[int]) -> None:
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if max_bytes is not None and len(blob) > max_bytes:
+            # Too big to keep, and the value it replaces is out of date
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, str(key)))
+            return
+        conn.execute(
+            "INSERT INTO entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (namespace, str(key), blob, time.time() + ttl),
+        )
+
+    def set(
+        self,
+        namespace: str,
+        key: Hashable,
+        value: Any,
+        ttl: float,
+        maxsize: int,
+        max_bytes: Optional[int] = None,
+        guard: Optional[Tuple[str, Hashable, Any]] = None,
+    ) -> None:
+        """Store an entry; with ``guard`` (namespace, key, expected), only while that entry holds ``expected``"""
+        if self._is_pending(namespace, key):
+            # The delete still to land would remove it again
+            return
+        if guard is None:
+            self._run(lambda conn: self._put(conn, namespace, key, value, ttl, max_bytes))
+        else:
+            guard_namespace, guard_key, expected = guard
+
+            def put_if(conn):
+                if self._read(conn, guard_namespace, guard_key) == expected:
+                    self._put(conn, namespace, key, value, ttl, max_bytes)
+            self._run(lambda conn: self._transaction(conn, lambda: put_if(conn)))
+        self._wrote(namespace, maxsize, max_bytes)
+
+    def replace(self, namespace: str, key: Hashable, fn: Callable[[Any], Any], ttl: float, maxsize: int, max_bytes: Optional[int] = None) -> None:
+        """Atomically replace a live entry with ``fn(value)``; a missing entry stays missing"""
+        def replace(conn):
+            value = self._read(conn, namespace, key)
+            if value is not None:
+                self._put(conn, namespace, key, fn(value), ttl, max_bytes)
+
+        self._run(lambda conn: self._transaction(conn, lambda: replace(conn)))
+        self._wrote(namespace, maxsize, max_bytes)
+
+    def update(self, namespace: str, key: Hashable, fn: Callable[[Any], Tuple[Any, Any]], ttl: float, maxsize: int) -> Any:
+        """Atomically replace an entry with ``fn(current value or None)[0]``, returning ``[1]``"""
+        def update(conn):
+            value, result = fn(self._read(conn, namespace, key))
+            self._put(conn, namespace, key, value, ttl, None)
+            return result
+
+        result = self._run(lambda conn: self._transaction(conn, lambda: update(conn)))
+        self._wrote(namespace, maxsize)
+        return result
+
+    def delete(self, namespace: str, key: Hashable) -> None:
+        self._delete(namespace, "key = ?", (str(key),), (namespace, str(key)))
+
+    def clear(self, namespace: str) -> None:
+        self._delete(namespace, "1", (), None)
+
+    def _delete(self, namespace: str, condition: str, params: Tuple, pending: Optional[Tuple[str, str]]) -> None:
+        sql = f"DELETE FROM entries WHERE namespace = ? AND {condition}"
+        try:
+            self._run(lambda conn: conn.execute(sql, (namespace, *params)))
+            return
+        except SharedStoreBusy:
+            pass
+        if pending is not None:
+            with self._pending_lock:
+                self._pending.add(pending)
+
+        def retry():
+            try:
+                conn = self._conn()
+                conn.execute(f"PRAGMA busy_timeout = {int(RETRY_BUSY_TIMEOUT_SECONDS * 1000)}")
+                conn.execute(sql, (namespace, *params))
+            except Exception:
+                logger.exception("Shared cache delete failed", extra={"namespace": namespace})
+            finally:
+                if pending is not None:
+                    with self._pending_lock:
+                        self._pending.discard(pending)
+        self._retries.submit(retry)
+
+    def count(self, namespace: str) -> int:
+        return self._run(lambda conn: conn.execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ? AND expires_at > ?", (namespace, time.time())
+        ).fetchone()[0])
+
+    def _wrote(self, namespace: str, maxsize: int, max_bytes: Optional[int] = None) -> None:
+        writes = self._writes.get(namespace, 0) + 1
+        self._writes[namespace] = writes
+        if writes % TRIM_EVERY == 0:
+            try:
+                self.trim(namespace, maxsize, max_bytes)
+            except SharedStoreBusy:
+                # Another write will try again before the namespace grows much
+                self._writes[namespace] = writes - TRIM_EVERY // 10
+
+    def trim(self, namespace: str, maxsize: int, max_bytes: Optional[int] = None) -> None:
+        def trim(conn):
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND expires_at <= ?", (namespace, time.time()))
+            conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM entries WHERE namespace = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (namespace, namespace, maxsize),
+            )
+            if max_bytes is not None:
+                conn.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND key IN ("
+                    "SELECT key FROM (SELECT key, SUM(length(value)) OVER (ORDER BY expires_at DESC, key) AS total "
+                    "FROM entries WHERE namespace = ?) WHERE total > ?)",
+                    (namespace, namespace, max_bytes),
+                )
+        self._run(trim)
+
+class SharedTTLCache(TTLCache):
+    """TTLCache whose entries live in a SharedStore.
+
+    Every lookup reads the store, so a change made by one worker is seen by
+    the next request on any other. With ``local`` an entry found there is
+    also kept in this process until it expires and served from memory;
+    only for values that never change once cached, since another worker
+    can't invalidate that copy. ``max_bytes`` bounds the pickled values in
+    the store as well as the local copy. Hit and miss counters are per
+    process.
+    """
+
+    def __init__(
+        self,
+        store: SharedStore,
+        namespace: str,
+        maxsize: int,
+        default_ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        local: bool = False,
+    ):
+        super().__init__(maxsize, default_ttl, max_bytes)
+        self.store = store
+        self.namespace = namespace
+        self.local = local
+
+    def _get(self, key: Hashable) -> Any:
+        if self.local:
+            value = super().peek(key)
+            if value is not None:
+                return value
+        try:
+            entry = self.store.get(self.namespace, key)
+        except SharedStoreBusy:
+            return None
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if self.local:
+            super().set(key, value, expires_at - time.time())
+        return value
+
+    def get(self, key: Hashable) -> Any:
+        value = self._get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def peek(self, key: Hashable) -> Any:
+        return self._get(key)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl is None or ttl <= 0:
+            return
+        if self.local:
+            super().set(key, value, ttl)
+        try:
+            self.store.set(self.namespace, key, value, ttl, self.maxsize, self.max_bytes)
+        except SharedStoreBusy:
+            pass
+
+    def set_if(self, key: Hashable, value: Any, guard: TTLCache, guard_key: Hashable, expected: Any) -> None:
+        """Like TTLCache.set_if, checked and stored in one store transaction when ``guard`` shares the store"""
+        if not isinstance(guard, SharedTTLCache) or guard.store is not self.store:
+            super().set_if(key, value, guard, guard_key, expected)
+            return
+        if self.default_ttl is None or self.default_ttl <= 0:
+            return
+        if self.local:
+            super().delete(key)
+        try:
+            self.store.set(
+                self.namespace, key, value, self.default_ttl, self.maxsize, self.max_bytes,
+                guard=(guard.namespace, guard_key, expected),
+            )
+        except SharedStoreBusy:
+            pass
+
+    def replace(self, key: Hashable, fn: Callable[[Any], Any]) -> None:
+        if self.default_ttl is None or self.default_ttl <= 0:
+            return
+        if self.local:
+            super().replace(key, fn)
+        try:
+            self.store.replace(self.namespace, key, fn, self.default_ttl, self.maxsize, self.max_bytes)
+        except SharedStoreBusy:
+            # Can't bring it up to date, so don't leave it to be read
+            self.store.delete(self.namespace, key)
+
+    def delete(self, key: Hashable) -> None:
+        super().delete(key)
+        self.store.delete(self.namespace, key)
+
+    def clear(self) -> None:
+        super().clear()
+        self.store.clear(self.namespace)
+
+    def __len__(self) -> int:
+        try:
+            return self.store.count(self.namespace)
+        except SharedStoreBusy:
+            return super().__len__()
+
+@lru_cache
+def shared_store() -> Optional[SharedStore]:
+    """The host's SharedStore, or None when caches are per process"""
+    settings = get_settings()
+    if not settings.shared_cache_path:
+        return None
+    return SharedStore(settings.shared_cache_path, settings.shared_cache_busy_timeout_ms / 1000)
+
+def make_cache(
+    namespace: str,
+    maxsize: int,
+    default_ttl: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+    local: bool = False,
+) -> TTLCache:
+    """A cache shared by every worker when ``Settings.shared_cache_path`` is set, else in process.
+
+    ``local`` is passed to SharedTTLCache: set it for values that never
+    change once cached.
+    """
+    store = shared_store()
+    if store is None:
+        return TTLCache(maxsize, default_ttl, max_bytes)
+    return SharedTTLCache(store, namespace, maxsize, default_ttl, max_bytes, local)
@@ -0,0 +1,19 @@
+from functools import lru_cache
+
+from app.config import get_settings
+from app.services.storage.base import StorageBackend, TransactionConflict, TransactionNotFound
+from app.services.storage.instrumented import InstrumentedStorage
+
+@lru_cache
+def get_storage() -> StorageBackend:
+    """The storage backend selected by ``Settings.storage_backend``, with call metrics"""
+    settings = get_settings()
+    if settings.storage_backend == "sqlite":
+        from app.services.storage.sqlite import SQLiteStorage
+        backend: StorageBackend = SQLiteStorage(settings.sqlite_path)
+    else:
+        from app.services.storage.firestore import FirestoreStorage
+        backend = FirestoreStorage()
+    return InstrumentedStorage(backend)
+
+__all__ = ["StorageBackend", "TransactionConflict", "TransactionNotFound", "get_storage"]
@@ -0,0 +1,160 @@
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+# Receives the stored document (or None) and returns (fields to write, resulting document)
+BuildDoc = Callable[[Optional[Dict[str, Any]]], Tuple[Dict[str, Any], Dict[str, Any]]]
+
+class TransactionNotFound(Exception):
+    """The transaction does not exist or belongs to another user"""
+
+class TransactionConflict(Exception):
+    """The transaction changed between the read and the write, or no longer matches what the client saw"""
+
+class StorageBackend(ABC):
+    """Persistence used by the service layer.
+
+    Transaction documents are plain dicts in the API shape (``id`` included,
+    timestamps as Unix milliseconds). Every transaction write also keeps the
+    user's monthly rollups current, and bumps the user's transactions
+    version, in the same atomic unit.
+    """
+
+    # Transactions
+
+    @abstractmethod
+    def stream_transactions(self, uid: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every transaction of a user, soft-deleted ones included"""
+
+    @abstractmethod
+    async def get_transactions_page(self, uid: str, limit: int, after: Optional[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Up to ``limit`` transactions ordered by (date, id) descending, strictly after ``after``"""
+
+    @abstractmethod
+    async def search_transactions(self, uid: str, filters: Dict[str, str], limit: int, after: Optional[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Like get_transactions_page, but only transactions matching ``filters``.
+
+        ``filters`` may hold ``type`` and ``category`` (equal to) and
+        ``date_from`` and ``date_to`` (inclusive YYYY-MM-DD bounds).
+        """
+
+    @abstractmethod
+    async def get_updated_transactions(self, uid: str, since: int) -> List[Dict[str, Any]]:
+        """Transactions with updated_at greater than ``since``"""
+
+    @abstractmethod
+    async def get_changes(self, uid: str, limit: int, after: Optional[Tuple[int, str]]) -> List[Dict[str, Any]]:
+        """Up to ``limit`` transactions ordered by (updated_at, id), strictly after ``after``, tombstones included"""
+
+    @abstractmethod
+    async def purge_deleted_transactions(self, deleted_before: int) -> int:
+        """Hard-delete every transaction soft-deleted before ``deleted_before``, returning how many"""
+
+    @abstractmethod
+    async def write_transaction(self, uid: str, transaction_id: str, build_doc: BuildDoc, replace: bool = False) -> Dict[str, Any]:
+        """Atomically read a transaction, write what ``build_doc`` returns and apply the rollup delta.
+
+        With ``replace`` the fields overwrite the whole document, otherwise
+        they are merged into it. The write is conditional on the document
+        being unchanged since the read; if it changed, or ``build_doc``
+        raises TransactionConflict, TransactionConflict is raised.
+        Returns the fields written.
+        """
+
+    @abstractmethod
+    async def apply_transaction_batch(self, uid: str, operations: List[Dict[str, Any]], now: int) -> List[Dict[str, Any]]:
+        """Apply create/update/delete operations in order, returning one result per operation"""
+
+    @abstractmethod
+    async def get_transactions_version(self, uid: str) -> int:
+        """A counter that changes whenever any of the user's transactions is written or purged (0 if never)"""
+
+    @abstractmethod
+    async def backfill_transactions(self, uid: str, fields: Dict[str, Dict[str, Any]]) -> None:
+        """Merge ``fields[id]`` into each of the user's transactions, for data migrations.
+
+        updated_at and the rollups are left alone; the transactions version
+        is bumped so cached responses are refreshed.
+        """
+
+    @abstractmethod
+    async def list_transaction_uids(self) -> List[str]:
+        """Every uid that owns at least one transaction"""
+
+    # Monthly rollups
+
+    @abstractmethod
+    async def get_rollups(self, uid: str, months: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Rollups for the given YYYY-MM months that exist, as {month: {"totals", "categories"}}"""
+
+    @abstractmethod
+    async def replace_rollups(self, uid: str, rollups: Dict[str, Dict[str, Any]]) -> None:
+        """Overwrite all of a user's rollups with absolute values"""
+
+    # User documents (verification codes, PIN)
+
+    @abstractmethod
+    async def get_user(self, uid: str) -> Optional[Dict[str, Any]]:
+        """The user's document, or None"""
+
+    @abstractmethod
+    async def update_user(self, uid: str, fields: Dict[str, Any]) -> None:
+        """Set top-level fields on the user's document, creating it if needed"""
+
+    @abstractmethod
+    async def delete_user_fields(self, uid: str, names: List[str]) -> None:
+        """Remove top-level fields from the user's document"""
+
+    # Recurring rules (documents in the API shape, ``id`` included)
+
+    @abstractmethod
+    async def get_recurring_rules(self, uid: str) -> List[Dict[str, Any]]:
+        """The user's recurring rules"""
+
+    @abstractmethod
+    async def get_recurring_rule(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        """The rule, whoever it belongs to, or None"""
+
+    @abstractmethod
+    async def put_recurring_rule(self, rule: Dict[str, Any]) -> None:
+        """Create or replace the rule stored under ``rule["id"]``"""
+
+    @abstractmethod
+    async def delete_recurring_rule(self, rule_id: str) -> None:
+        """Remove the rule if it exists"""
+
+    @abstractmethod
+    async def get_due_recurring_rules(self, today: str, limit: int) -> List[Dict[str, Any]]:
+        """Up to ``limit`` rules of any user with next_run on or before ``today``, earliest first.
+
+        Served by an index on next_run, so it costs the same however many
+        rules aren't due.
+        """
+
+    @abstractmethod
+    async def update_recurring_rule(self, rule_id: str, fields: Dict[str, Any], expected_next_run: str) -> bool:
+        """Set top-level fields on the rule if its next_run is still ``expected_next_run``.
+
+        Returns False, writing nothing, if the rule is gone or was changed.
+        """
+
+    # Mail outbox
+
+    @abstractmethod
+    async def add_mails(self, mails: List[Dict[str, Any]]) -> None:
+        """Queue mail documents for delivery, in as few writes as the backend allows"""
+
+    def watch_transactions(self, uid: str, since: int, on_changes: Callable[[List[Dict[str, Any]]], None]) -> Optional[Callable[[], None]]:
+        """Push a user's transactions as they change, if the backend can.
+
+        ``on_changes`` is called, possibly from another thread, with
+        transactions updated after ``since`` as they are written. Returns a
+        function that stops the watch, or None when the backend has no
+        change notifications and callers have to poll.
+        """
+        return None
+
+    async def warm_up(self) -> None:
+        """Open connections ahead of the first request"""
+
+    async def close(self) -> None:
+        """Release connections held by the backend"""
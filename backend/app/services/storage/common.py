@@ -0,0 +1,123 @@
+"""Document shapes, rollup deltas and batch planning shared by every backend."""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models.money import amount_fields, stored_minor_units
+
+# (month, type, category) -> signed amount in minor units
+RollupDeltas = Dict[Tuple[str, str, str], int]
+
+def now_ms() -> int:
+    return int(datetime.now(timezone.utc).timestamp() * 1000)
+
+def new_transaction_doc(uid: str, transaction_data: Dict[str, Any], now: int) -> Dict[str, Any]:
+    return {
+        "type": transaction_data["type"],
+        **amount_fields(transaction_data),
+        "category": transaction_data["category"],
+        "date": transaction_data["date"],
+        "description": transaction_data.get("description", ""),
+        "uid": uid,
+        "created_at": now,
+        "updated_at": now,
+        "deleted_at": None
+    }
+
+def transaction_update_data(transaction_data: Dict[str, Any], now: int) -> Dict[str, Any]:
+    return {
+        "type": transaction_data["type"],
+        **amount_fields(transaction_data),
+        "category": transaction_data["category"],
+        "date": transaction_data["date"],
+        "description": transaction_data.get("description", ""),
+        "updated_at": now  # Unix timestamp
+    }
+
+def _rollup_contribution(doc: Optional[Dict[str, Any]]) -> Optional[Tuple[str, str, str, int]]:
+    """The (month, type, category, minor units) a transaction adds to the rollups, if any"""
+    if not doc or doc.get("deleted_at") is not None:
+        return None
+    return doc["date"][:7], doc["type"], doc["category"], stored_minor_units(doc)
+
+def rollup_deltas(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> RollupDeltas:
+    """Rollup changes caused by a transaction going from ``old`` to ``new``"""
+    deltas: RollupDeltas = {}
+    for contribution, sign in ((_rollup_contribution(old), -1), (_rollup_contribution(new), 1)):
+        if contribution:
+            month, type_, category, amount = contribution
+            key = (month, type_, category)
+            deltas[key] = deltas.get(key, 0) + sign * amount
+    return {key: amount for key, amount in deltas.items() if amount != 0}
+
+def merge_rollup_deltas(into: RollupDeltas, deltas: RollupDeltas) -> None:
+    for key, amount in deltas.items():
+        into[key] = into.get(key, 0) + amount
+
+def group_rollups(deltas: RollupDeltas) -> Dict[str, Dict[str, Any]]:
+    """Group (month, type, category) amounts into one totals/categories dict per month"""
+    months: Dict[str, Dict[str, Any]] = {}
+    for (month, type_, category), amount in deltas.items():
+        rollup = months.setdefault(month, {"totals": {}, "categories": {}})
+        rollup["totals"][type_] = rollup["totals"].get(type_, 0) + amount
+        rollup["categories"].setdefault(category, {})[type_] = amount
+    return months
+
+def plan_transaction_batch(
+    uid: str,
+    operations: List[Dict[str, Any]],
+    current: Dict[str, Optional[Dict[str, Any]]],
+    now: int,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Validate a batch of operations against the documents they touch.
+
+    ``current`` maps every transaction id in the batch to its stored
+    document, or None if it does not exist. A create carrying ``if_absent``
+    is skipped, and reported as a success with ``skipped`` set, when the
+    document already exists (even soft-deleted); updates and deletes of a
+    soft-deleted document fail as if it were missing. Returns one result per
+    operation, and the writes to make for the valid ones, in order. Each
+    write carries its kind ("set" or "update"), document id, fields, rollup
+    deltas and the result to mark once committed.
+    """
+    current = dict(current)
+    results: List[Dict[str, Any]] = []
+    writes: List[Dict[str, Any]] = []
+    for op in operations:
+        result = {"id": op["id"], "op": op["op"], "success": False, "error": None}
+        results.append(result)
+
+        old = current.get(op["id"])
+        if op["op"] == "create" and op.get("if_absent") and old is not None and old.get("uid") == uid:
+            result["success"] = True
+            result["skipped"] = True
+            continue
+        # Documents owned by another user are reported as missing, as are deleted ones to updates and deletes
+        if (old is not None and old.get("uid") != uid) or (
+            op["op"] != "create" and (old is None or old.get("deleted_at") is not None)
+        ):
+            result["error"] = f"Transaction with ID {op['id']} does not exist"
+            continue
+
+        if op["op"] == "create":
+            kind = "set"
+            data = new_transaction_doc(uid, op["transaction"], now)
+            new = data
+        elif op["op"] == "update":
+            kind = "update"
+            data = transaction_update_data(op["transaction"], now)
+            new = {**old, **data}
+        else:
+            kind = "update"
+            data = {"deleted_at": now, "updated_at": now}
+            new = {**old, **data}
+        current[op["id"]] = new
+
+        writes.append({
+            "kind": kind,
+            "id": op["id"],
+            "data": data,
+            "deltas": rollup_deltas(old, new),
+            "result": result,
+        })
+
+    return results, writes
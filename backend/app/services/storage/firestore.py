@@ -0,0 +1,403 @@
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import firebase_admin
+from firebase_admin import firestore_async
+from google.api_core import exceptions as gcp_exceptions
+from google.cloud.firestore_v1 import DELETE_FIELD
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from app.services.firebase import get_firebase_app
+from app.services.storage.base import BuildDoc, StorageBackend, TransactionConflict
+from app.services.storage.common import RollupDeltas, group_rollups, merge_rollup_deltas, plan_transaction_batch, rollup_deltas
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects write batches with more than 500 writes
+BATCH_WRITE_LIMIT = 500
+# Times apply_transaction_batch re-reads and re-plans after losing a race to another write
+BATCH_ATTEMPTS = 3
+
+def _doc_to_transaction(doc) -> Dict[str, Any]:
+    """Convert a transaction snapshot into the API dict shape"""
+    transaction_data = doc.to_dict()
+    transaction_data["id"] = doc.id
+
+    # Ensure timestamps are integers (in case Firestore stored them as different types)
+    for field in ("created_at", "updated_at", "deleted_at"):
+        if isinstance(transaction_data.get(field), datetime):
+            transaction_data[field] = int(transaction_data[field].timestamp() * 1000)
+
+    return transaction_data
+
+def _bump_version(writer, db, uid: str) -> None:
+    """Queue an increment of transactionVersions/{uid} on a write batch or transaction"""
+    writer.set(db.collection("transactionVersions").document(uid), {"version": firestore_async.Increment(1)}, merge=True)
+
+@firestore_async.async_transactional
+async def _write_transaction(transaction, db, doc_ref, uid: str, build_doc: BuildDoc, replace: bool) -> Dict[str, Any]:
+    snapshot = await doc_ref.get(transaction=transaction)
+    old = snapshot.to_dict() if snapshot.exists else None
+    write_data, new = build_doc(old)
+
+    # Writes to a document carry a precondition on what was read, so the
+    # commit fails rather than overwriting a document changed in between
+    if not snapshot.exists:
+        transaction.create(doc_ref, write_data)
+    elif replace:
+        transaction.set(doc_ref, write_data)
+    else:
+        option = db.write_option(last_update_time=snapshot.update_time)
+        transaction.update(doc_ref, write_data, option=option)
+    _Rollups(db).write_deltas(transaction, uid, rollup_deltas(old, new))
+    _bump_version(transaction, db, uid)
+    return write_data
+
+class _Rollups:
+    """transactionRollups/{uid}_{YYYY-MM}: one running-totals document per user and month"""
+
+    def __init__(self, db):
+        self.collection = db.collection("transactionRollups")
+
+    def ref(self, uid: str, month: str):
+        return self.collection.document(f"{uid}_{month}")
+
+    def write_deltas(self, writer, uid: str, deltas: RollupDeltas) -> None:
+        """Queue Increment writes for ``deltas`` on a write batch or transaction.
+
+        Keeping the rollups current this way never needs a read.
+        """
+        for month, rollup in group_rollups(deltas).items():
+            writer.set(self.ref(uid, month), {
+                "uid": uid,
+                "month": month,
+                "totals": {type_: firestore_async.Increment(amount) for type_, amount in rollup["totals"].items()},
+                "categories": {
+                    category: {type_: firestore_async.Increment(amount) for type_, amount in amounts.items()}
+                    for category, amounts in rollup["categories"].items()
+                },
+            }, merge=True)
+
+@firestore_async.async_transactional
+async def _update_rule_if(transaction, doc_ref, fields: Dict[str, Any], expected_next_run: str) -> bool:
+    snapshot = await doc_ref.get(transaction=transaction)
+    if not snapshot.exists or snapshot.get("next_run") != expected_next_run:
+        return False
+    transaction.update(doc_ref, fields)
+    return True
+
+def _doc_to_rule(doc) -> Dict[str, Any]:
+    return {**doc.to_dict(), "id": doc.id}
+
+class FirestoreStorage(StorageBackend):
+    """Cloud Firestore through the async client, so no call blocks the event loop"""
+
+    def __init__(self, app: Optional[firebase_admin.App] = None):
+        self._app = app
+        self._db = None
+        self._watch_db = None
+
+    @property
+    def db(self):
+        # Created on first use: building the client loads credentials and opens gRPC channels
+        if self._db is None:
+            self._db = firestore_async.client(self._app or get_firebase_app())
+        return self._db
+
+    def watch_transactions(self, uid: str, since: int, on_changes: Callable[[List[Dict[str, Any]]], None]) -> Optional[Callable[[], None]]:
+        # Snapshot listeners only exist on the synchronous client, which runs
+        # them on a thread of its own. Listening to updated_at > since, on the
+        # (uid, updated_at) index, keeps the first snapshot down to recent
+        # changes rather than the user's whole history
+        if self._watch_db is None:
+            from firebase_admin import firestore
+            self._watch_db = firestore.client(self._app or get_firebase_app())
+        query = self._watch_db.collection("transactions").where("uid", "==", uid).where("updated_at", ">", since)
+
+        def on_snapshot(_docs, changes, _read_time):
+            # Documents leave the result only when purged; tombstones arrive as changes
+            transactions = [_doc_to_transaction(change.document) for change in changes if change.type.name != "REMOVED"]
+            if transactions:
+                on_changes(transactions)
+
+        return query.on_snapshot(on_snapshot).unsubscribe
+
+    async def warm_up(self) -> None:
+        # The first call opens the gRPC channel; a point read of a document that needn't exist is the cheapest
+        await self.db.collection("transactionVersions").document("_warm_up").get()
+
+    @property
+    def rollups(self) -> _Rollups:
+        return _Rollups(self.db)
+
+    def _transactions(self):
+        return self.db.collection("transactions")
+
+    async def stream_transactions(self, uid: str) -> AsyncIterator[Dict[str, Any]]:
+        async for doc in self._transactions().where("uid", "==", uid).stream():
+            yield _doc_to_transaction(doc)
+
+    async def get_transactions_page(self, uid: str, limit: int, after: Optional[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        query = (
+            self._transactions()
+            .where("uid", "==", uid)
+            .order_by("date", direction=firestore_async.Query.DESCENDING)
+            .order_by(FieldPath.document_id(), direction=firestore_async.Query.DESCENDING)
+        )
+        if after:
+            date, transaction_id = after
+            query = query.start_after({"date": date, FieldPath.document_id(): transaction_id})
+        return [_doc_to_transaction(doc) async for doc in query.limit(limit).stream()]
+
+    async def search_transactions(self, uid: str, filters: Dict[str, str], limit: int, after: Optional[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        # Served by the (uid, [type,] [category,] date desc, __name__ desc)
+        # composite indexes in firestore.indexes.json
+        query = self._transactions().where("uid", "==", uid)
+        for field in ("type", "category"):
+            if filters.get(field) is not None:
+                query = query.where(field, "==", filters[field])
+        if filters.get("date_from") is not None:
+            query = query.where("date", ">=", filters["date_from"])
+        if filters.get("date_to") is not None:
+            query = query.where("date", "<=", filters["date_to"])
+        query = (
+            query
+            .order_by("date", direction=firestore_async.Query.DESCENDING)
+            .order_by(FieldPath.document_id(), direction=firestore_async.Query.DESCENDING)
+        )
+        if after:
+            date, transaction_id = after
+            query = query.start_after({"date": date, FieldPath.document_id(): transaction_id})
+        return [_doc_to_transaction(doc) async for doc in query.limit(limit).stream()]
+
+    async def get_updated_transactions(self, uid: str, since: int) -> List[Dict[str, Any]]:
+        query = self._transactions().where("uid", "==", uid).where("updated_at", ">", since)
+        return [_doc_to_transaction(doc) async for doc in query.stream()]
+
+    async def get_changes(self, uid: str, limit: int, after: Optional[Tuple[int, str]]) -> List[Dict[str, Any]]:
+        query = (
+            self._transactions()
+            .where("uid", "==", uid)
+            .order_by("updated_at")
+            .order_by(FieldPath.document_id())
+        )
+        if after:
+            updated_at, transaction_id = after
+            query = query.start_after({"updated_at": updated_at, FieldPath.document_id(): transaction_id})
+        return [_doc_to_transaction(doc) async for doc in query.limit(limit).stream()]
+
+    async def purge_deleted_transactions(self, deleted_before: int) -> int:
+        # Tombstones add nothing to the rollups, so deleting them needs no rollup
+        # write; half a batch leaves room for one version bump per user
+        query = self._transactions().where("deleted_at", "<", deleted_before).select(["uid"]).limit(BATCH_WRITE_LIMIT // 2)
+        purged = 0
+        while True:
+            snapshots = [snapshot async for snapshot in query.stream()]
+            if not snapshots:
+                return purged
+            batch = self.db.batch()
+            for snapshot in snapshots:
+                batch.delete(snapshot.reference)
+            for uid in {snapshot.get("uid") for snapshot in snapshots}:
+                _bump_version(batch, self.db, uid)
+            await batch.commit()
+            purged += len(snapshots)
+
+    async def write_transaction(self, uid: str, transaction_id: str, build_doc: BuildDoc, replace: bool = False) -> Dict[str, Any]:
+        doc_ref = self._transactions().document(transaction_id)
+        try:
+            return await _write_transaction(self.db.transaction(), self.db, doc_ref, uid, build_doc, replace)
+        except (gcp_exceptions.FailedPrecondition, gcp_exceptions.AlreadyExists) as e:
+            raise TransactionConflict(f"Transaction with ID {transaction_id} was modified concurrently") from e
+        except ValueError as e:
+            # async_transactional gives up on contention with a ValueError wrapping Aborted
+            if isinstance(e.__cause__, gcp_exceptions.Aborted):
+                raise TransactionConflict(f"Transaction with ID {transaction_id} was modified concurrently") from e
+            raise
+
+    async def apply_transaction_batch(self, uid: str, operations: List[Dict[str, Any]], now: int) -> List[Dict[str, Any]]:
+        """Read every document touched with one get_all, then commit in write batches.
+
+        Each batch holds at most BATCH_WRITE_LIMIT writes, counting one
+        rollup write per month it touches and the version bump. The first
+        write to each document in a batch is conditional on the document
+        being as it was read (creates on it not existing), so a concurrent
+        write can't slip in under the rollup deltas. A batch that loses
+        such a race is re-read and re-planned, with the operations after
+        it, up to BATCH_ATTEMPTS times. If a batch fails to commit
+        otherwise, it and every later operation are reported as failed.
+        """
+        collection = self._transactions()
+        results: List[Dict[str, Any]] = []
+        pending = operations
+        for attempt in range(BATCH_ATTEMPTS):
+            refs = {op["id"]: collection.document(op["id"]) for op in pending}
+            current, update_times = {}, {}
+            async for snapshot in self.db.get_all(list(refs.values())):
+                current[snapshot.id] = snapshot.to_dict() if snapshot.exists else None
+                if snapshot.exists:
+                    update_times[snapshot.id] = snapshot.update_time
+
+            planned, writes = plan_transaction_batch(uid, pending, current, now)
+            positions = {id(result): position for position, result in enumerate(planned)}
+            conflict = None
+            for index, chunk in enumerate(self._chunk_writes(writes)):
+                try:
+                    await self._commit_chunk(uid, chunk, refs, update_times)
+                except (gcp_exceptions.FailedPrecondition, gcp_exceptions.AlreadyExists) as e:
+                    conflict = e
+                except Exception as e:
+                    for write in writes[chunk["start"]:]:
+                        write["result"]["error"] = str(e)
+                    return results + planned
+                else:
+                    for write in chunk["writes"]:
+                        write["result"]["success"] = True
+                    continue
+                # Everything from this batch's first operation on is planned again
+                retry_from = positions[id(chunk["writes"][0]["result"])]
+                results.extend(planned[:retry_from])
+                pending = pending[retry_from:]
+                break
+            if conflict is None:
+                return results + planned
+            logger.info("Transaction batch lost a race, retrying", extra={"attempt": attempt + 1, "pending": len(pending)})
+
+        error = f"Transactions were modified concurrently: {conflict}"
+        for op in pending:
+            results.append({"id": op["id"], "op": op["op"], "success": False, "error": error})
+        return results
+
+    @staticmethod
+    def _chunk_writes(writes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Split planned writes into commits of at most BATCH_WRITE_LIMIT writes"""
+        chunks: List[Dict[str, Any]] = []
+        chunk: Dict[str, Any] = {}
+        for position, write in enumerate(writes):
+            months = {month for month, _, _ in write["deltas"]}
+            if chunk and len(chunk["writes"]) + 2 + len(chunk["months"] | months) > BATCH_WRITE_LIMIT:
+                chunk = {}
+            if not chunk:
+                chunk = {"start": position, "writes": [], "months": set(), "deltas": {}}
+                chunks.append(chunk)
+            chunk["writes"].append(write)
+            chunk["months"] |= months
+            merge_rollup_deltas(chunk["deltas"], write["deltas"])
+        return chunks
+
+    async def _commit_chunk(self, uid: str, chunk: Dict[str, Any], refs: Dict[str, Any], update_times: Dict[str, Any]) -> None:
+        """Commit one chunk, recording the update_time of every document it wrote"""
+        batch = self.db.batch()
+        guarded = set()
+        for write in chunk["writes"]:
+            ref = refs[write["id"]]
+            if write["id"] in guarded:
+                # Later writes in the same commit ride on the first one's precondition
+                if write["kind"] == "set":
+                    batch.set(ref, write["data"])
+                else:
+                    batch.update(ref, write["data"])
+            elif write["id"] in update_times:
+                # A create over an existing document carries every field, so an update replaces it
+                batch.update(ref, write["data"], option=self.db.write_option(last_update_time=update_times[write["id"]]))
+            else:
+                batch.create(ref, write["data"])
+            guarded.add(write["id"])
+        self.rollups.write_deltas(batch, uid, chunk["deltas"])
+        _bump_version(batch, self.db, uid)
+        write_results = await batch.commit()
+        for write, write_result in zip(chunk["writes"], write_results):
+            update_times[write["id"]] = write_result.update_time
+
+    async def get_transactions_version(self, uid: str) -> int:
+        snapshot = await self.db.collection("transactionVersions").document(uid).get()
+        return (snapshot.to_dict() or {}).get("version", 0) if snapshot.exists else 0
+
+    async def backfill_transactions(self, uid: str, fields: Dict[str, Dict[str, Any]]) -> None:
+        items = list(fields.items())
+        # One slot per batch is left for the version bump
+        for start in range(0, len(items), BATCH_WRITE_LIMIT - 1):
+            batch = self.db.batch()
+            for transaction_id, data in items[start:start + BATCH_WRITE_LIMIT - 1]:
+                batch.update(self._transactions().document(transaction_id), data)
+            _bump_version(batch, self.db, uid)
+            await batch.commit()
+
+    async def list_transaction_uids(self) -> List[str]:
+        uids = set()
+        async for snapshot in self._transactions().select(["uid"]).stream():
+            uids.add(snapshot.get("uid"))
+        return sorted(uids)
+
+    async def get_rollups(self, uid: str, months: List[str]) -> Dict[str, Dict[str, Any]]:
+        rollups = {}
+        refs = [self.rollups.ref(uid, month) for month in months]
+        async for snapshot in self.db.get_all(refs):
+            if snapshot.exists:
+                rollups[snapshot.get("month")] = snapshot.to_dict()
+        return rollups
+
+    async def replace_rollups(self, uid: str, rollups: Dict[str, Dict[str, Any]]) -> None:
+        stale = [
+            snapshot.reference
+            async for snapshot in self.rollups.collection.where("uid", "==", uid).stream()
+            if snapshot.get("month") not in rollups
+        ]
+        writes = [(ref, None) for ref in stale] + [
+            (self.rollups.ref(uid, month), {"uid": uid, "month": month, **rollup})
+            for month, rollup in rollups.items()
+        ]
+        for start in range(0, len(writes), BATCH_WRITE_LIMIT):
+            batch = self.db.batch()
+            for ref, data in writes[start:start + BATCH_WRITE_LIMIT]:
+                if data is None:
+                    batch.delete(ref)
+                else:
+                    batch.set(ref, data)
+            await batch.commit()
+
+    async def get_user(self, uid: str) -> Optional[Dict[str, Any]]:
+        doc = await self.db.collection("users").document(uid).get()
+        if not doc.exists:
+            return None
+        return doc.to_dict() or {}
+
+    async def update_user(self, uid: str, fields: Dict[str, Any]) -> None:
+        # Merge only the named fields so map values are replaced, not deep-merged
+        await self.db.collection("users").document(uid).set(fields, merge=list(fields))
+
+    async def delete_user_fields(self, uid: str, names: List[str]) -> None:
+        await self.db.collection("users").document(uid).update({name: DELETE_FIELD for name in names})
+
+    def _rules(self):
+        return self.db.collection("recurringRules")
+
+    async def get_recurring_rules(self, uid: str) -> List[Dict[str, Any]]:
+        return [_doc_to_rule(doc) async for doc in self._rules().where("uid", "==", uid).stream()]
+
+    async def get_recurring_rule(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self._rules().document(rule_id).get()
+        return _doc_to_rule(doc) if doc.exists else None
+
+    async def put_recurring_rule(self, rule: Dict[str, Any]) -> None:
+        await self._rules().document(rule["id"]).set({key: value for key, value in rule.items() if key != "id"})
+
+    async def delete_recurring_rule(self, rule_id: str) -> None:
+        await self._rules().document(rule_id).delete()
+
+    async def get_due_recurring_rules(self, today: str, limit: int) -> List[Dict[str, Any]]:
+        # Rules that have ended hold next_run None, which a range filter never matches
+        query = self._rules().where("next_run", "<=", today).order_by("next_run").limit(limit)
+        return [_doc_to_rule(doc) async for doc in query.stream()]
+
+    async def update_recurring_rule(self, rule_id: str, fields: Dict[str, Any], expected_next_run: str) -> bool:
+        return await _update_rule_if(self.db.transaction(), self._rules().document(rule_id), fields, expected_next_run)
+
+    async def add_mails(self, mails: List[Dict[str, Any]]) -> None:
+        collection = self.db.collection("verificationMail")
+        for start in range(0, len(mails), BATCH_WRITE_LIMIT):
+            batch = self.db.batch()
+            for mail in mails[start:start + BATCH_WRITE_LIMIT]:
+                batch.set(collection.document(), mail)
+            await batch.commit()
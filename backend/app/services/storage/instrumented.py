@@ -0,0 +1,72 @@
+import functools
+import inspect
+import time
+from typing import Any
+
+from app.services.metrics import storage_call_duration, storage_call_errors, storage_documents
+from app.services.storage.base import StorageBackend
+
+def _documents(result: Any) -> int:
+    if isinstance(result, (list, dict)):
+        return len(result)
+    return 0 if result is None else 1
+
+class InstrumentedStorage:
+    """Wraps a StorageBackend, timing every call and counting the documents it returns.
+
+    Coroutine methods are timed until they return; async generators
+    (``stream_transactions``) until exhausted, counting every document
+    yielded. Other attributes are passed through untouched.
+    """
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.backend, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        if inspect.isasyncgenfunction(attr):
+            wrapped = self._wrap_stream(name, attr)
+        elif inspect.iscoroutinefunction(attr):
+            wrapped = self._wrap_call(name, attr)
+        else:
+            return attr
+        # Cache on the instance so __getattr__ only runs once per method
+        setattr(self, name, wrapped)
+        return wrapped
+
+    @staticmethod
+    def _wrap_call(name, method):
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await method(*args, **kwargs)
+            except Exception:
+                storage_call_errors.inc(name)
+                raise
+            finally:
+                storage_call_duration.observe(time.perf_counter() - start, name)
+            storage_documents.inc(name, amount=_documents(result))
+            return result
+        return call
+
+    @staticmethod
+    def _wrap_stream(name, method):
+        @functools.wraps(method)
+        async def stream(*args, **kwargs):
+            start = time.perf_counter()
+            count = 0
+            try:
+                async for item in method(*args, **kwargs):
+                    count += 1
+                    yield item
+            except Exception:
+                storage_call_errors.inc(name)
+                raise
+            finally:
+                # Includes time the consumer spent between documents
+                storage_call_duration.observe(time.perf_counter() - start, name)
+                storage_documents.inc(name, amount=count)
+        return stream
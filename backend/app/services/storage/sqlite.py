@@ -0,0 +1,374 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.services.storage.base import BuildDoc, StorageBackend
+from app.services.storage.common import RollupDeltas, group_rollups, plan_transaction_batch, rollup_deltas
+
+# Rows fetched per round trip to the database thread while streaming
+STREAM_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    uid TEXT NOT NULL,
+    date TEXT NOT NULL,
+    updated_at INTEGER NOT NULL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_uid_updated_at ON transactions (uid, updated_at);
+CREATE INDEX IF NOT EXISTS transactions_uid_date ON transactions (uid, date, id);
+CREATE INDEX IF NOT EXISTS transactions_deleted_at ON transactions (json_extract(doc, '$.deleted_at'))
+    WHERE json_extract(doc, '$.deleted_at') IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS rollups (
+    uid TEXT NOT NULL,
+    month TEXT NOT NULL,
+    type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    PRIMARY KEY (uid, month, type, category)
+);
+
+CREATE TABLE IF NOT EXISTS transaction_versions (
+    uid TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS recurring_rules (
+    id TEXT PRIMARY KEY,
+    uid TEXT NOT NULL,
+    next_run TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recurring_rules_uid ON recurring_rules (uid);
+CREATE INDEX IF NOT EXISTS recurring_rules_next_run ON recurring_rules (next_run) WHERE next_run IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS mail_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc TEXT NOT NULL
+);
+"""
+
+def _encode(value: Any) -> str:
+    def default(obj):
+        # User documents hold code expiry times as datetimes
+        if isinstance(obj, datetime):
+            return {"$datetime": obj.isoformat()}
+        raise TypeError(f"Cannot store {type(obj).__name__}")
+    return json.dumps(value, default=default)
+
+# search_transactions filters and the SQL each adds
+_SEARCH_CONDITIONS = {
+    "type": "json_extract(doc, '$.type') = ?",
+    "category": "json_extract(doc, '$.category') = ?",
+    "date_from": "date >= ?",
+    "date_to": "date <= ?",
+}
+
+def _decode(raw: str) -> Any:
+    def object_hook(obj):
+        if len(obj) == 1 and "$datetime" in obj:
+            return datetime.fromisoformat(obj["$datetime"])
+        return obj
+    return json.loads(raw, object_hook=object_hook)
+
+class SQLiteStorage(StorageBackend):
+    """Local SQLite storage for self-hosting, load tests and benchmarks.
+
+    Transactions are stored as JSON documents next to the columns they are
+    queried by. All statements run on one dedicated thread holding one
+    connection, so the event loop never blocks on disk and no locking is
+    needed between connections. ``path`` may be ":memory:".
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: fn(self._connect()))
+
+    async def _run_in_transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        def run(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        return await self._run(run)
+
+    # Transactions
+
+    @staticmethod
+    def _read_transaction(conn: sqlite3.Connection, transaction_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT doc FROM transactions WHERE id = ?", (transaction_id,)).fetchone()
+        return _decode(row[0]) if row else None
+
+    @staticmethod
+    def _store_transaction(conn: sqlite3.Connection, transaction_id: str, doc: Dict[str, Any]) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO transactions (id, uid, date, updated_at, doc) VALUES (?, ?, ?, ?, ?)",
+            (transaction_id, doc["uid"], doc["date"], doc["updated_at"], _encode(doc)),
+        )
+
+    @staticmethod
+    def _apply_rollup_deltas(conn: sqlite3.Connection, uid: str, deltas: RollupDeltas) -> None:
+        conn.executemany(
+            "INSERT INTO rollups (uid, month, type, category, amount) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (uid, month, type, category) DO UPDATE SET amount = amount + excluded.amount",
+            [(uid, month, type_, category, amount) for (month, type_, category), amount in deltas.items()],
+        )
+
+    @staticmethod
+    def _bump_versions(conn: sqlite3.Connection, uids: List[str]) -> None:
+        conn.executemany(
+            "INSERT INTO transaction_versions (uid, version) VALUES (?, 1) "
+            "ON CONFLICT (uid) DO UPDATE SET version = version + 1",
+            [(uid,) for uid in uids],
+        )
+
+    @staticmethod
+    def _with_id(transaction_id: str, raw: str) -> Dict[str, Any]:
+        doc = _decode(raw)
+        doc["id"] = transaction_id
+        return doc
+
+    async def stream_transactions(self, uid: str) -> AsyncIterator[Dict[str, Any]]:
+        # Walk the (uid, date, id) index a page at a time, so memory stays bounded
+        position = ("", "")
+        while True:
+            rows = await self._run(lambda conn: conn.execute(
+                "SELECT id, date, doc FROM transactions WHERE uid = ? AND (date, id) > (?, ?) "
+                "ORDER BY date, id LIMIT ?",
+                (uid, *position, STREAM_PAGE_SIZE),
+            ).fetchall())
+            for transaction_id, _, raw in rows:
+                yield self._with_id(transaction_id, raw)
+            if len(rows) < STREAM_PAGE_SIZE:
+                return
+            position = (rows[-1][1], rows[-1][0])
+
+    async def get_transactions_page(self, uid: str, limit: int, after: Optional[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        if after:
+            sql = ("SELECT id, doc FROM transactions WHERE uid = ? AND (date, id) < (?, ?) "
+                   "ORDER BY date DESC, id DESC LIMIT ?")
+            params: Tuple[Any, ...] = (uid, after[0], after[1], limit)
+        else:
+            sql = "SELECT id, doc FROM transactions WHERE uid = ? ORDER BY date DESC, id DESC LIMIT ?"
+            params = (uid, limit)
+        rows = await self._run(lambda conn: conn.execute(sql, params).fetchall())
+        return [self._with_id(transaction_id, raw) for transaction_id, raw in rows]
+
+    async def search_transactions(self, uid: str, filters: Dict[str, str], limit: int, after: Optional[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        # Ranges on the (uid, date, id) index; type and category are checked per row
+        conditions, params = ["uid = ?"], [uid]
+        for name, condition in _SEARCH_CONDITIONS.items():
+            if filters.get(name) is not None:
+                conditions.append(condition)
+                params.append(filters[name])
+        if after:
+            conditions.append("(date, id) < (?, ?)")
+            params.extend(after)
+        sql = f"SELECT id, doc FROM transactions WHERE {' AND '.join(conditions)} ORDER BY date DESC, id DESC LIMIT ?"
+        rows = await self._run(lambda conn: conn.execute(sql, (*params, limit)).fetchall())
+        return [self._with_id(transaction_id, raw) for transaction_id, raw in rows]
+
+    async def get_updated_transactions(self, uid: str, since: int) -> List[Dict[str, Any]]:
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT id, doc FROM transactions WHERE uid = ? AND updated_at > ?", (uid, since)
+        ).fetchall())
+        return [self._with_id(transaction_id, raw) for transaction_id, raw in rows]
+
+    async def get_changes(self, uid: str, limit: int, after: Optional[Tuple[int, str]]) -> List[Dict[str, Any]]:
+        position = after or (-1, "")
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT id, doc FROM transactions WHERE uid = ? AND (updated_at, id) > (?, ?) "
+            "ORDER BY updated_at, id LIMIT ?",
+            (uid, *position, limit),
+        ).fetchall())
+        return [self._with_id(transaction_id, raw) for transaction_id, raw in rows]
+
+    async def purge_deleted_transactions(self, deleted_before: int) -> int:
+        def purge(conn):
+            rows = conn.execute(
+                "DELETE FROM transactions WHERE json_extract(doc, '$.deleted_at') IS NOT NULL "
+                "AND json_extract(doc, '$.deleted_at') < ? RETURNING uid",
+                (deleted_before,),
+            ).fetchall()
+            self._bump_versions(conn, sorted({uid for (uid,) in rows}))
+            return len(rows)
+        return await self._run_in_transaction(purge)
+
+    async def write_transaction(self, uid: str, transaction_id: str, build_doc: BuildDoc, replace: bool = False) -> Dict[str, Any]:
+        def write(conn):
+            old = self._read_transaction(conn, transaction_id)
+            write_data, new = build_doc(old)
+            self._store_transaction(conn, transaction_id, write_data if replace else {**(old or {}), **write_data})
+            self._apply_rollup_deltas(conn, uid, rollup_deltas(old, new))
+            self._bump_versions(conn, [uid])
+            return write_data
+        return await self._run_in_transaction(write)
+
+    async def apply_transaction_batch(self, uid: str, operations: List[Dict[str, Any]], now: int) -> List[Dict[str, Any]]:
+        """Apply the whole batch in one SQLite transaction"""
+        def apply(conn):
+            current = {op["id"]: self._read_transaction(conn, op["id"]) for op in operations}
+            results, writes = plan_transaction_batch(uid, operations, current, now)
+            for write in writes:
+                doc = write["data"] if write["kind"] == "set" else {**current[write["id"]], **write["data"]}
+                current[write["id"]] = doc
+                self._store_transaction(conn, write["id"], doc)
+                self._apply_rollup_deltas(conn, uid, write["deltas"])
+            if writes:
+                self._bump_versions(conn, [uid])
+            for write in writes:
+                write["result"]["success"] = True
+            return results
+        return await self._run_in_transaction(apply)
+
+    async def get_transactions_version(self, uid: str) -> int:
+        row = await self._run(lambda conn: conn.execute(
+            "SELECT version FROM transaction_versions WHERE uid = ?", (uid,)
+        ).fetchone())
+        return row[0] if row else 0
+
+    async def backfill_transactions(self, uid: str, fields: Dict[str, Dict[str, Any]]) -> None:
+        def backfill(conn):
+            for transaction_id, data in fields.items():
+                doc = self._read_transaction(conn, transaction_id)
+                if doc is not None and doc["uid"] == uid:
+                    self._store_transaction(conn, transaction_id, {**doc, **data})
+            self._bump_versions(conn, [uid])
+        await self._run_in_transaction(backfill)
+
+    async def list_transaction_uids(self) -> List[str]:
+        rows = await self._run(lambda conn: conn.execute("SELECT DISTINCT uid FROM transactions ORDER BY uid").fetchall())
+        return [uid for (uid,) in rows]
+
+    # Monthly rollups
+
+    async def get_rollups(self, uid: str, months: List[str]) -> Dict[str, Dict[str, Any]]:
+        placeholders = ",".join("?" * len(months))
+        rows = await self._run(lambda conn: conn.execute(
+            f"SELECT month, type, category, amount FROM rollups WHERE uid = ? AND month IN ({placeholders})",
+            (uid, *months),
+        ).fetchall())
+        # int(): databases created before minor units declared the column REAL
+        return group_rollups({(month, type_, category): int(amount) for month, type_, category, amount in rows})
+
+    async def replace_rollups(self, uid: str, rollups: Dict[str, Dict[str, Any]]) -> None:
+        def replace(conn):
+            conn.execute("DELETE FROM rollups WHERE uid = ?", (uid,))
+            conn.executemany(
+                "INSERT INTO rollups (uid, month, type, category, amount) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (uid, month, type_, category, amount)
+                    for month, rollup in rollups.items()
+                    for category, amounts in rollup["categories"].items()
+                    for type_, amount in amounts.items()
+                ],
+            )
+        await self._run_in_transaction(replace)
+
+    # User documents
+
+    async def get_user(self, uid: str) -> Optional[Dict[str, Any]]:
+        row = await self._run(lambda conn: conn.execute("SELECT doc FROM users WHERE uid = ?", (uid,)).fetchone())
+        return _decode(row[0]) if row else None
+
+    async def _modify_user(self, uid: str, modify: Callable[[Dict[str, Any]], None]) -> None:
+        def write(conn):
+            row = conn.execute("SELECT doc FROM users WHERE uid = ?", (uid,)).fetchone()
+            doc = _decode(row[0]) if row else {}
+            modify(doc)
+            conn.execute("INSERT OR REPLACE INTO users (uid, doc) VALUES (?, ?)", (uid, _encode(doc)))
+        await self._run_in_transaction(write)
+
+    async def update_user(self, uid: str, fields: Dict[str, Any]) -> None:
+        await self._modify_user(uid, lambda doc: doc.update(fields))
+
+    async def delete_user_fields(self, uid: str, names: List[str]) -> None:
+        def delete(doc):
+            for name in names:
+                doc.pop(name, None)
+        await self._modify_user(uid, delete)
+
+    # Recurring rules
+
+    async def get_recurring_rules(self, uid: str) -> List[Dict[str, Any]]:
+        rows = await self._run(lambda conn: conn.execute("SELECT doc FROM recurring_rules WHERE uid = ?", (uid,)).fetchall())
+        return [_decode(doc) for doc, in rows]
+
+    async def get_recurring_rule(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        row = await self._run(lambda conn: conn.execute("SELECT doc FROM recurring_rules WHERE id = ?", (rule_id,)).fetchone())
+        return _decode(row[0]) if row else None
+
+    @staticmethod
+    def _store_rule(conn: sqlite3.Connection, rule: Dict[str, Any]) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO recurring_rules (id, uid, next_run, doc) VALUES (?, ?, ?, ?)",
+            (rule["id"], rule["uid"], rule.get("next_run"), _encode(rule)),
+        )
+
+    async def put_recurring_rule(self, rule: Dict[str, Any]) -> None:
+        await self._run(lambda conn: self._store_rule(conn, rule))
+
+    async def delete_recurring_rule(self, rule_id: str) -> None:
+        await self._run(lambda conn: conn.execute("DELETE FROM recurring_rules WHERE id = ?", (rule_id,)))
+
+    async def get_due_recurring_rules(self, today: str, limit: int) -> List[Dict[str, Any]]:
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT doc FROM recurring_rules WHERE next_run <= ? ORDER BY next_run LIMIT ?", (today, limit)
+        ).fetchall())
+        return [_decode(doc) for doc, in rows]
+
+    async def update_recurring_rule(self, rule_id: str, fields: Dict[str, Any], expected_next_run: str) -> bool:
+        def update(conn):
+            row = conn.execute("SELECT doc FROM recurring_rules WHERE id = ?", (rule_id,)).fetchone()
+            if row is None:
+                return False
+            rule = _decode(row[0])
+            if rule.get("next_run") != expected_next_run:
+                return False
+            self._store_rule(conn, {**rule, **fields})
+            return True
+        return await self._run_in_transaction(update)
+
+    # Mail outbox
+
+    async def add_mails(self, mails: List[Dict[str, Any]]) -> None:
+        await self._run_in_transaction(lambda conn: conn.executemany("INSERT INTO mail_outbox (doc) VALUES (?)", [(_encode(mail),) for mail in mails]))
+
+    async def warm_up(self) -> None:
+        # Opens the connection and creates the schema
+        await self._run(lambda conn: None)
+
+    async def close(self) -> None:
+        def close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, close)
+        self._executor.shutdown(wait=False)
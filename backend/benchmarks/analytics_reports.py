@@ -0,0 +1,78 @@
+"""Benchmark the columnar analytics reports on a synthetic history.
+
+Builds a synthetic transaction history (100k rows by default), loads it
+into columns and times every report. The target is well under 100 ms per
+report.
+
+    python benchmarks/analytics_reports.py --rows 100000 --repeat 20
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.money import amount_fields  # noqa: E402
+from app.services import analytics  # noqa: E402
+
+CATEGORIES = ["food", "rent", "transport", "coffee", "shopping", "health", "travel", "utilities", "salary", "gifts"]
+
+
+def synthetic_history(rows: int, years: int, seed: int):
+    rng = random.Random(seed)
+    today = date.today()
+    span = years * 365
+    for index in range(rows):
+        category = rng.choice(CATEGORIES)
+        yield {
+            "id": f"txn-{index}",
+            "type": "income" if category == "salary" else "expense",
+            **amount_fields({"amount": round(rng.lognormvariate(3, 1), 2), "currency": "USD"}),
+            "category": category,
+            "date": (today - timedelta(days=rng.randrange(span))).isoformat(),
+            "deleted_at": None,
+        }
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    records = list(synthetic_history(args.rows, args.years, args.seed))
+    today = date.today()
+
+    columns = None
+
+    def load():
+        nonlocal columns
+        columns = analytics.columns_from_records(records)
+
+    results = {"columns_from_records": timed(load, args.repeat)}
+    results["rolling_spend"] = timed(lambda: analytics.rolling_spend(columns, 30, today, 365), args.repeat)
+    results["burn_rate"] = timed(lambda: analytics.burn_rate(columns, 2000, today), args.repeat)
+    results["category_trends"] = timed(lambda: analytics.category_trends(columns, 24, today), args.repeat)
+    results["anomalies"] = timed(lambda: analytics.anomalies(columns, 3.0), args.repeat)
+
+    print(f"{len(columns)} rows, best of {args.repeat}")
+    for name, ms in results.items():
+        print(f"{name:<22} {ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
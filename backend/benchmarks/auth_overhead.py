@@ -0,0 +1,91 @@
+"""Microbenchmark of per-request auth overhead in get_current_user.
+
+Compares full RS256 ID token verification (what auth.verify_id_token does
+on every request once certs are cached) with a token cache hit. Runs
+offline: tokens are signed with a throwaway key and verified against its
+self-signed cert, so no Google certs are downloaded.
+
+    python benchmarks/auth_overhead.py --iterations 5000
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from fastapi.security import HTTPAuthorizationCredentials
+from google.auth import crypt, jwt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+
+from app import dependencies  # noqa: E402
+from app.services.firebase import firebase_auth  # noqa: E402
+
+
+def make_signing_material():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "benchmark")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(1)
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    cert_pem = cert.public_bytes(serialization.Encoding.PEM)
+    return crypt.RSASigner.from_string(key_pem, key_id="bench"), {"bench": cert_pem}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    signer, certs = make_signing_material()
+    now = int(time.time())
+    token = jwt.encode(signer, {
+        "uid": "bench-user", "sub": "bench-user", "email": "bench@example.com",
+        "iat": now, "exp": now + 3600, "aud": "bench", "iss": "bench",
+    }).decode()
+
+    def verify(id_token):
+        return jwt.decode(id_token, certs=certs, audience="bench")
+
+    firebase_auth().verify_id_token = verify
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        verify(token)
+    uncached_us = (time.perf_counter() - start) / args.iterations * 1e6
+
+    async def cached_run():
+        await dependencies.get_current_user(credentials)
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            await dependencies.get_current_user(credentials)
+        return (time.perf_counter() - start) / args.iterations * 1e6
+
+    cached_us = asyncio.run(cached_run())
+
+    print(f"full verification : {uncached_us:8.1f} us/request")
+    print(f"token cache hit   : {cached_us:8.1f} us/request")
+    print(f"speedup           : {uncached_us / cached_us:8.1f}x")
+    print(f"cache stats       : {dependencies.token_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark encoding transaction lists for the read endpoints.
+
+Compares, for 1k, 10k and 100k rows:
+
+    validated   what FastAPI does with a response_model: validate every row
+                against List[TransactionResponse], dump it back to dicts and
+                encode with the stdlib json module
+    orjson      ORJSONResponse over the stored dicts, no revalidation
+    orjson+gzip the same body gzipped as GZipMiddleware would
+
+and prints throughput in MB/s of uncompressed JSON, so the paths compare
+like for like, plus the bytes actually sent.
+
+    python benchmarks/json_serialization.py --rows 1000 10000 100000
+"""
+import argparse
+import gzip
+import os
+import random
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.config import get_settings  # noqa: E402
+from app.models.money import amount_fields  # noqa: E402
+from app.models.transaction import TransactionResponse  # noqa: E402
+
+CATEGORIES = ["food", "rent", "transport", "coffee", "shopping", "health", "travel", "utilities", "salary", "gifts"]
+
+
+def synthetic_rows(rows: int, seed: int):
+    rng = random.Random(seed)
+    now = int(time.time() * 1000)
+    for index in range(rows):
+        category = rng.choice(CATEGORIES)
+        created = now - rng.randrange(10 * 365 * 86_400_000)
+        yield {
+            "id": f"txn-{index:08d}",
+            "uid": "benchmark-user",
+            "type": "income" if category == "salary" else "expense",
+            **amount_fields({"amount": round(rng.lognormvariate(3, 1), 2), "currency": "USD"}),
+            "category": category,
+            "date": time.strftime("%Y-%m-%d", time.gmtime(created / 1000)),
+            "description": rng.choice(["", "weekly shop", "card payment", "transfer"]),
+            "created_at": created,
+            "updated_at": created,
+            "deleted_at": None,
+        }
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(List[TransactionResponse])
+    compresslevel = get_settings().gzip_compresslevel
+
+    def validated(rows):
+        return JSONResponse(adapter.dump_python(adapter.validate_python(rows), mode="json")).body
+
+    def fast(rows):
+        return ORJSONResponse(rows).body
+
+    def fast_gzip(rows):
+        return gzip.compress(ORJSONResponse(rows).body, compresslevel=compresslevel)
+
+    paths = {"validated": validated, "orjson": fast, "orjson+gzip": fast_gzip}
+
+    print(f"{'rows':>8} {'path':<12} {'ms':>9} {'MB/s':>9} {'bytes sent':>12}")
+    for count in args.rows:
+        rows = list(synthetic_rows(count, args.seed))
+        raw_size = len(fast(rows))
+        for name, encode in paths.items():
+            seconds, body = timed(lambda: encode(rows), args.repeat)
+            print(f"{count:>8} {name:<12} {seconds * 1000:9.2f} {raw_size / seconds / 1e6:9.1f} {len(body):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Load benchmark for GET /api/transactions/.
+
+Fires a fixed number of requests at each concurrency level and reports
+p50/p99 latency, so a blocked event loop shows up as p99 climbing with
+concurrency.
+
+    python benchmarks/list_latency.py --token <firebase id token>
+    python benchmarks/list_latency.py --concurrency 1,8,32,128 --requests 500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_level(client: httpx.AsyncClient, path: str, concurrency: int, total: int):
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/api/transactions/")
+    parser.add_argument("--token", default="", help="Firebase ID token sent as a Bearer header")
+    parser.add_argument("--concurrency", default="1,8,32,128", help="comma separated levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per level")
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    levels = [int(level) for level in args.concurrency.split(",")]
+    limits = httpx.Limits(max_connections=max(levels))
+
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits, timeout=60) as client:
+        print(f"{'conc':>6} {'reqs':>6} {'errs':>6} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        for level in levels:
+            result = await run_level(client, args.path, level, args.requests)
+            print(
+                f"{result['concurrency']:>6} {result['requests']:>6} {result['errors']:>6} "
+                f"{result['rps']:>9.1f} {result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
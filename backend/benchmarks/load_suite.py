@@ -0,0 +1,324 @@
+"""In-process load test of the whole API.
+
+Drives ``main.app`` through httpx's ASGITransport, so no server, network or
+Google project is involved: storage is SQLite (in memory by default),
+Firebase ID token verification is stubbed to accept "bench:<uid>" tokens,
+and verification codes are fixed so the code flow can complete. Everything
+else (routing, auth cache, validation, bcrypt pool, serialization,
+middleware) is the real thing.
+
+Every scenario runs at every concurrency level for a fixed number of
+operations and reports throughput and p50/p95/p99 latency. Scenarios:
+
+    list         GET /api/transactions/ (the user's whole history)
+    page         GET /api/transactions/page/?limit=50
+    sync         GET /api/transactions/updated/ with the user's sync token
+    poll         the same with If-None-Match, answered 304 while nothing changes
+    create       POST /api/transactions/
+    update       PUT /api/transactions/{id}/
+    delete       DELETE /api/transactions/{id}/
+    pin          POST /api/verification/verifyPin/ (one bcrypt check)
+    code         GET sendVerificationCode/ then POST verifyCode/ (two requests)
+
+    python benchmarks/load_suite.py --rows 1000 --concurrency 1 16 64 --output run.json
+    python benchmarks/load_suite.py --scenarios list sync poll --rows 10000
+    python benchmarks/load_suite.py --compare baseline.json run.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ["list", "page", "sync", "poll", "create", "update", "delete", "pin", "code"]
+
+BENCH_CODE = 123456
+BENCH_PIN = "2468"
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def configure_environment(args) -> None:
+    """Settings are read on first import of the app, so this runs before it"""
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = args.sqlite_path
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ["LOG_LEVEL"] = args.log_level
+    # The code scenario asks for far more codes per user than the limit allows
+    os.environ["CODE_RATE_BURST"] = str(10 ** 9)
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret")
+
+def stub_external_services() -> None:
+    from app.api.routes import verification
+    from app.services.firebase import firebase_auth
+
+    auth = firebase_auth()
+
+    def verify_id_token(token: str) -> Dict[str, Any]:
+        prefix, _, uid = token.partition(":")
+        if prefix != "bench" or not uid:
+            raise auth.InvalidIdTokenError("not a benchmark token", None)
+        return {"uid": uid, "email": f"{uid}@bench.invalid", "exp": time.time() + 3600}
+
+    class FixedCodes:
+        @staticmethod
+        def randint(low, high):
+            return BENCH_CODE
+
+    auth.verify_id_token = verify_id_token
+    verification.random = FixedCodes
+
+def transaction(uid: str, transaction_id: str, index: int) -> Dict[str, Any]:
+    return {
+        "id": transaction_id,
+        "uid": uid,
+        "type": "income" if index % 10 == 0 else "expense",
+        "amount": round(5 + (index * 37 % 2000) / 10, 2),
+        "category": ["food", "rent", "transport", "coffee", "salary"][index % 5],
+        "date": f"20{20 + index % 6}-{index % 12 + 1:02d}-{index % 28 + 1:02d}",
+        "description": "",
+    }
+
+class User:
+    def __init__(self, uid: str):
+        self.uid = uid
+        self.headers = {"Authorization": f"Bearer bench:{uid}"}
+        self.sync_token = None
+        self.etag = None
+        self.created = 0
+        self.next_update = 0
+        self.next_delete = 0
+
+async def seed(users: List[User], rows: int) -> None:
+    from app.services.firestore_service import apply_transaction_batch, store_user_pin
+
+    for user in users:
+        for start in range(0, rows, 5000):
+            operations = [
+                {"op": "create", "id": f"{user.uid}-seed-{index}", "transaction": transaction(user.uid, f"{user.uid}-seed-{index}", index)}
+                for index in range(start, min(rows, start + 5000))
+            ]
+            await apply_transaction_batch(user.uid, operations)
+        await store_user_pin(user.uid, BENCH_PIN)
+
+async def prime_sync(client, user: User) -> None:
+    response = await client.get("/api/transactions/updated/", params={"limit": 1000}, headers=user.headers)
+    body = response.json()
+    while body["has_more"]:
+        response = await client.get("/api/transactions/updated/", params={"limit": 1000, "sync_token": body["sync_token"]}, headers=user.headers)
+        body = response.json()
+    user.sync_token = body["sync_token"]
+    user.etag = response.headers.get("etag")
+
+def scenario_operations(rows: int):
+    """One coroutine per scenario, performing one operation; returns whether it succeeded"""
+
+    async def list_all(client, user):
+        return (await client.get("/api/transactions/", headers=user.headers)).status_code == 200
+
+    async def page(client, user):
+        return (await client.get("/api/transactions/page/", params={"limit": 50}, headers=user.headers)).status_code == 200
+
+    async def sync(client, user):
+        response = await client.get("/api/transactions/updated/", params={"sync_token": user.sync_token}, headers=user.headers)
+        if response.status_code != 200:
+            return False
+        user.sync_token = response.json()["sync_token"]
+        return True
+
+    async def poll(client, user):
+        headers = {**user.headers, "If-None-Match": user.etag or ""}
+        response = await client.get("/api/transactions/updated/", params={"sync_token": user.sync_token}, headers=headers)
+        return response.status_code in (200, 304)
+
+    async def create(client, user):
+        user.created += 1
+        transaction_id = f"{user.uid}-new-{user.created}"
+        body = transaction(user.uid, transaction_id, user.created)
+        return (await client.post("/api/transactions/", json=body, headers=user.headers)).status_code == 201
+
+    async def update(client, user):
+        index = user.next_update % rows
+        user.next_update += 1
+        transaction_id = f"{user.uid}-seed-{index}"
+        body = transaction(user.uid, transaction_id, index + 1)
+        return (await client.put(f"/api/transactions/{transaction_id}/", json=body, headers=user.headers)).status_code == 200
+
+    async def delete(client, user):
+        # Walk backwards so update (which walks forwards) keeps hitting live rows
+        index = rows - 1 - user.next_delete % rows
+        user.next_delete += 1
+        return (await client.delete(f"/api/transactions/{user.uid}-seed-{index}/", headers=user.headers)).status_code == 204
+
+    async def pin(client, user):
+        response = await client.post("/api/verification/verifyPin/", json={"pin": BENCH_PIN}, headers=user.headers)
+        return response.status_code == 200
+
+    async def code(client, user):
+        sent = await client.get("/api/verification/sendVerificationCode/", headers=user.headers)
+        if sent.status_code != 200:
+            return False
+        verified = await client.post("/api/verification/verifyCode/", json={"code": str(BENCH_CODE)}, headers=user.headers)
+        return verified.status_code == 200
+
+    return {
+        "list": list_all, "page": page, "sync": sync, "poll": poll, "create": create,
+        "update": update, "delete": delete, "pin": pin, "code": code,
+    }
+
+async def run_level(client, operation, users: List[User], concurrency: int, total: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker(offset: int):
+        nonlocal remaining, errors
+        turn = offset
+        while remaining > 0:
+            remaining -= 1
+            user = users[turn % len(users)]
+            turn += concurrency
+            start = time.perf_counter()
+            try:
+                ok = await operation(client, user)
+            except Exception:
+                ok = False
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "operations": len(latencies),
+        "errors": errors,
+        "throughput_ops": len(latencies) / elapsed,
+        "mean_ms": sum(latencies) / len(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+async def run_suite(args) -> Dict[str, Any]:
+    configure_environment(args)
+    import httpx
+    from main import app
+    from app.services.firestore_service import SYNC_SETTLE_MS
+    from app.services.hashing import hashing_pool
+    from app.services.storage import get_storage
+
+    stub_external_services()
+    users = [User(f"bench-user-{index}") for index in range(args.users)]
+
+    seed_started = time.perf_counter()
+    await seed(users, args.rows)
+    seed_seconds = time.perf_counter() - seed_started
+
+    operations = scenario_operations(args.rows)
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        # Sync tokens keep re-sending changes younger than the settle window;
+        # wait it out so "sync" measures a quiet delta, not the whole seed
+        await asyncio.sleep(SYNC_SETTLE_MS / 1000)
+        for user in users:
+            await prime_sync(client, user)
+
+        print(f"{'scenario':<8} {'conc':>5} {'ops':>6} {'errs':>5} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                result = {"scenario": name, **await run_level(client, operations[name], users, concurrency, args.operations)}
+                results.append(result)
+                print(f"{name:<8} {concurrency:>5} {result['operations']:>6} {result['errors']:>5} {result['throughput_ops']:>9.1f} "
+                      f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+
+    hashing_pool.shutdown()
+    await get_storage().close()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "users": args.users,
+            "rows_per_user": args.rows,
+            "operations_per_level": args.operations,
+            "bcrypt_rounds": args.bcrypt_rounds,
+            "sqlite_path": args.sqlite_path,
+            "seed_seconds": round(seed_seconds, 3),
+        },
+        "results": results,
+    }
+
+def compare(baseline_path: str, candidate_path: str, threshold: float) -> int:
+    """Print candidate vs baseline per scenario and level; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    with open(candidate_path) as f:
+        candidate = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"{'scenario':<8} {'conc':>5} {'ops/s':>18} {'p50 ms':>18} {'p99 ms':>18}")
+    for key in sorted(baseline.keys() & candidate.keys(), key=lambda k: (SCENARIOS.index(k[0]) if k[0] in SCENARIOS else 99, k[1])):
+        old, new = baseline[key], candidate[key]
+        cells = []
+        flagged = False
+        # Throughput regresses when it drops, latency when it rises
+        for metric, worse_if_higher in (("throughput_ops", False), ("p50_ms", True), ("p99_ms", True)):
+            change = (new[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            regressed = change > threshold if worse_if_higher else change < -threshold
+            flagged |= regressed
+            cells.append(f"{new[metric]:>9.2f} {change:>+6.0%}{'!' if regressed else ' '}")
+        regressions += flagged
+        print(f"{key[0]:<8} {key[1]:>5} " + " ".join(cells))
+
+    missing = baseline.keys() - candidate.keys()
+    if missing:
+        print(f"not in candidate: {sorted(missing)}")
+    print(f"{regressions} regressed (threshold {threshold:.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--operations", type=int, default=300, help="operations per scenario and concurrency level")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=1000, help="transactions seeded per user")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--sqlite-path", default=":memory:")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change flagged as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    report = asyncio.run(run_suite(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
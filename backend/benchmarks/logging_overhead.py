@@ -0,0 +1,95 @@
+"""Compare the caller-side cost of print() with the queued JSON logger.
+
+Each mode logs the same message from a coroutine on a running event loop
+and records how long every call held the loop. The sink can be slowed
+down to mimic a backed-up stdout pipe or log driver: print() then stalls
+the loop for every write, the queued logger only its writer thread.
+
+    python benchmarks/logging_overhead.py --messages 20000
+    python benchmarks/logging_overhead.py --messages 2000 --sink-delay-us 200
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.log import setup_logging, stop_logging  # noqa: E402
+
+
+class SlowSink(io.TextIOBase):
+    """A write-only stream that takes ``delay`` seconds per write"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        self.bytes += len(text)
+        return len(text)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(pct / 100 * len(values)))]
+
+
+async def run(emit, messages):
+    latencies = []
+    for index in range(messages):
+        start = time.perf_counter()
+        emit(index)
+        latencies.append(time.perf_counter() - start)
+        if index % 100 == 0:
+            # Let the loop breathe, as a server would between requests
+            await asyncio.sleep(0)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--sink-delay-us", type=float, default=0.0, help="time every write to the sink takes")
+    args = parser.parse_args()
+    delay = args.sink_delay_us / 1e6
+
+    results = {}
+
+    sink = SlowSink(delay)
+
+    def emit_print(index):
+        print(f"Querying transactions for uid: user-{index % 50}, timestamp > {index}", file=sink)
+
+    results["print"] = asyncio.run(run(emit_print, args.messages))
+
+    sink = SlowSink(delay)
+    setup_logging("INFO", stream=sink)
+    logger = logging.getLogger("benchmark")
+
+    def emit_log(index):
+        logger.info("Fetched updated transactions", extra={"since": index, "count": index % 50})
+
+    start = time.perf_counter()
+    results["queued json"] = asyncio.run(run(emit_log, args.messages))
+    stop_logging()
+    drained = time.perf_counter() - start
+
+    print(f"{args.messages} messages, sink delay {args.sink_delay_us:g} us per write")
+    print(f"{'mode':<12} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'loop blocked ms':>16}")
+    for name, latencies in results.items():
+        print(f"{name:<12} {sum(latencies) / len(latencies) * 1e6:9.2f} {percentile(latencies, 50) * 1e6:9.2f} "
+              f"{percentile(latencies, 99) * 1e6:9.2f} {sum(latencies) * 1000:16.1f}")
+    print(f"queued logger wrote everything in {drained * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
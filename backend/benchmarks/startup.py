@@ -0,0 +1,132 @@
+"""Cold start cost of an API worker.
+
+Every run is a fresh Python process that imports ``main``, runs the
+lifespan startup, then sends two requests through httpx's ASGITransport.
+It reports, as the median over all runs:
+
+    import          time to ``import main``
+    startup         lifespan startup (with WARM_UP, includes the warm-up)
+    first_request   GET /api/transactions/page/ on the fresh worker
+    second_request  the same request again, for comparison
+
+Storage is a new SQLite file per run and the signed-in user is injected
+with a dependency override, so no Google project is needed. The signing
+cert download still goes to Google: with --warm-up it is part of startup,
+without it runs in the background while the first request is served.
+
+    python benchmarks/startup.py --runs 10
+    python benchmarks/startup.py --runs 10 --warm-up
+    python benchmarks/startup.py --importtime 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ["import", "startup", "first_request", "second_request"]
+
+
+def child() -> None:
+    """One cold start; prints its timings in milliseconds as JSON"""
+    import asyncio
+
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    import httpx
+    from app.dependencies import get_current_user
+
+    async def current_user():
+        return {"uid": "startup-bench", "email": "startup-bench@bench.invalid"}
+
+    main.app.dependency_overrides[get_current_user] = current_user
+
+    async def run():
+        timings = {"import": (imported - start) * 1000}
+        started = time.perf_counter()
+        async with main.app.router.lifespan_context(main.app):
+            timings["startup"] = (time.perf_counter() - started) * 1000
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for phase in ("first_request", "second_request"):
+                    sent = time.perf_counter()
+                    response = await client.get("/api/transactions/page/", params={"limit": 50})
+                    response.raise_for_status()
+                    timings[phase] = (time.perf_counter() - sent) * 1000
+        return timings
+
+    print(json.dumps(asyncio.run(run())))
+
+
+def cold_start(warm_up: bool, log_level: str) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            STORAGE_BACKEND="sqlite",
+            SQLITE_PATH=os.path.join(directory, "startup.db"),
+            WARM_UP=str(warm_up).lower(),
+            LOG_LEVEL=log_level,
+        )
+        env.setdefault("JWT_SECRET_KEY", "benchmark-only-secret")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child"],
+            cwd=BACKEND, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_profile(top: int) -> None:
+    """The modules with the largest cumulative import time under ``python -X importtime``"""
+    env = dict(os.environ, STORAGE_BACKEND="sqlite")
+    env.setdefault("JWT_SECRET_KEY", "benchmark-only-secret")
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND, env=env, check=True, capture_output=True, text=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), module.rstrip()))
+    for cumulative, module in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:8.1f} ms  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm-up", action="store_true", help="start workers with WARM_UP=true")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--importtime", type=int, metavar="N", help="print the N slowest imports instead")
+    parser.add_argument("--output", help="write the medians as JSON to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, BACKEND)
+        child()
+        return
+    if args.importtime:
+        import_profile(args.importtime)
+        return
+
+    runs = [cold_start(args.warm_up, args.log_level) for _ in range(args.runs)]
+    medians = {phase: statistics.median(run[phase] for run in runs) for phase in PHASES}
+    print(f"{'phase':<16}{'median':>10}{'min':>10}{'max':>10}   (ms, {args.runs} runs, warm-up {'on' if args.warm_up else 'off'})")
+    for phase in PHASES:
+        samples = [run[phase] for run in runs]
+        print(f"{phase:<16}{medians[phase]:>10.1f}{min(samples):>10.1f}{max(samples):>10.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"warm_up": args.warm_up, "runs": args.runs, "median_ms": medians}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Throughput of a multi-worker deployment as workers are added.
+
+For each worker count, starts uvicorn with that many workers (as serve.py
+does) on a seeded SQLite database, with the shared cache on tmpfs and
+Firebase token verification stubbed to accept "bench:<uid>" tokens as in
+load_suite.py. It then drives the server over HTTP from --clients load
+generator processes for --seconds and reports requests/s and the speed-up
+over the first worker count. Scaling can only be near-linear with at
+least as many cores as workers plus clients.
+
+    python benchmarks/worker_scaling.py --workers 1 2 4 --clients 4
+    python benchmarks/worker_scaling.py --path "/api/transactions/page/?limit=50" --rows 5000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+
+def create_app():
+    """uvicorn app factory run in every worker"""
+    from load_suite import stub_external_services
+    from main import app
+
+    stub_external_services()
+    return app
+
+
+def configure_environment(directory: str) -> None:
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(directory, "bench.db")
+    shm = "/dev/shm" if os.path.isdir("/dev/shm") else directory
+    os.environ["SHARED_CACHE_PATH"] = os.path.join(shm, f"fiscus-bench-{os.getpid()}.db")
+    os.environ["BCRYPT_ROUNDS"] = "4"
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret")
+
+
+async def seed_database(uids, rows: int) -> None:
+    from load_suite import User, seed
+    from app.services.storage import get_storage
+
+    await seed([User(uid) for uid in uids], rows)
+    await get_storage().close()
+
+
+def client(port: int, path: str, uids, concurrency: int, seconds: float):
+    """One load generator process; returns (requests, errors)"""
+    import httpx
+
+    async def run():
+        done = errors = 0
+        deadline = time.perf_counter() + seconds
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as http:
+            async def worker(index):
+                nonlocal done, errors
+                headers = {"Authorization": f"Bearer bench:{uids[index % len(uids)]}"}
+                while time.perf_counter() < deadline:
+                    response = await http.get(path, headers=headers)
+                    done += 1
+                    errors += response.status_code != 200
+            await asyncio.gather(*(worker(index) for index in range(concurrency)))
+        return done, errors
+
+    return asyncio.run(run())
+
+
+def wait_until_up(port: int, timeout: float = 60) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def measure(args, workers: int, uids) -> dict:
+    server = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "worker_scaling:create_app", "--factory",
+        "--app-dir", BENCHMARKS, "--port", str(args.port), "--workers", str(workers),
+        "--no-access-log", "--log-level", "warning",
+    ])
+    try:
+        wait_until_up(args.port)
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            jobs = [(args.port, args.path, uids[index::args.clients] or uids, args.concurrency, args.seconds) for index in range(args.clients)]
+            results = pool.starmap(client, jobs)
+    finally:
+        server.terminate()
+        server.wait()
+    requests = sum(done for done, _ in results)
+    return {"workers": workers, "requests": requests, "errors": sum(errors for _, errors in results), "rps": requests / args.seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="connections per client")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--rows", type=int, default=200, help="transactions seeded per user")
+    parser.add_argument("--path", default="/api/transactions/page/?limit=50")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_environment(directory)
+        uids = [f"bench-user-{index}" for index in range(args.users)]
+        asyncio.run(seed_database(uids, args.rows))
+
+        print(f"{os.cpu_count()} cpus, {args.clients} clients x {args.concurrency} connections, GET {args.path}")
+        print(f"{'workers':>7} {'requests':>9} {'errors':>6} {'req/s':>9} {'speed-up':>8}")
+        baseline = None
+        try:
+            for workers in args.workers:
+                result = measure(args, workers, uids)
+                baseline = baseline or result["rps"]
+                print(f"{workers:>7} {result['requests']:>9} {result['errors']:>6} {result['rps']:>9.1f} {result['rps'] / baseline:>7.2f}x")
+        finally:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(os.environ["SHARED_CACHE_PATH"] + suffix):
+                    os.unlink(os.environ["SHARED_CACHE_PATH"] + suffix)
+
+
+if __name__ == "__main__":
+    main()
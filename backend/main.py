@@ -1,18 +1,91 @@
+import asyncio
+import contextlib
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import firebase_admin
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from app.config import get_settings
+from app.log import setup_logging, stop_logging
 from app.api.routes import transactions
 from app.api.routes import verification
+from app.api.routes import analytics
+from app.api.routes import recurring
+from app.dependencies import reset_token_key, token_cache
+from app.middleware import MetricsMiddleware, RequestContextMiddleware
+from app.services.auth_service import keep_signing_certs_fresh, refresh_signing_certs
+from app.services.change_feed import change_feed
+from app.services.firestore_service import email_uids, transactions_versions, user_docs
+from app.services.hashing import hashing_pool
+from app.services.metrics import registry
+from app.services.outbox import mail_outbox
+from app.services.rate_limit import code_email_limiter, code_uid_limiter
+from app.services.recurring import recurring_scheduler
+from app.services.search_index import search_indexes
+from app.services.storage import get_storage
 
-app = FastAPI(title="Fiscus API")
+setup_logging(get_settings().log_level, get_settings().log_sample_rates)
+
+logger = logging.getLogger(__name__)
+
+async def warm_up(timeout: float) -> bool:
+    """Open storage channels and fetch the token signing certs; True if both succeeded in time"""
+    steps = {"storage": get_storage().warm_up(), "signing_certs": run_in_threadpool(refresh_signing_certs)}
+    try:
+        results = await asyncio.wait_for(asyncio.gather(*steps.values(), return_exceptions=True), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Warm-up timed out", extra={"timeout": timeout})
+        return False
+    for step, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.warning("Warm-up step failed", extra={"step": step, "error": str(result)})
+    return not any(isinstance(result, Exception) for result in results)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+    # A missing secret should stop the worker now, not fail the first password reset
+    reset_token_key()
+    certs_fresh = settings.warm_up and await warm_up(settings.warm_up_timeout_seconds)
+    # Keep Google's token signing certs warm so no request pays for the download
+    cert_refresher = asyncio.create_task(keep_signing_certs_fresh(
+        settings.signing_certs_refresh_seconds,
+        delay_seconds=settings.signing_certs_refresh_seconds if certs_fresh else 0,
+    ))
+    background = [cert_refresher]
+    if settings.recurring_interval_seconds > 0:
+        background.append(asyncio.create_task(recurring_scheduler.run_forever(settings.recurring_interval_seconds)))
+    yield
+    for task in background:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    change_feed.close()
+    hashing_pool.shutdown()
+    await mail_outbox.close()
+    await get_storage().close()
+    stop_logging()
+
+app = FastAPI(title="Fiscus API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Include routers
 app.include_router(transactions.router, prefix="/api/transactions")
 app.include_router(verification.router, prefix="/api/verification")
+app.include_router(analytics.router, prefix="/api/analytics")
+app.include_router(recurring.router, prefix="/api/recurring")
 
-# CORS
 settings = get_settings()
+
+# Compress large bodies (transaction lists) only; small ones aren't worth the CPU
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=settings.gzip_minimum_size,
+    compresslevel=settings.gzip_compresslevel,
+)
+
+# CORS
 origins = [settings.frontend_url]
 
 app.add_middleware(
@@ -30,6 +103,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so they time everything the other middleware does too
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestContextMiddleware)
+
+caches = {
+    "firebase_tokens": token_cache,
+    "transactions_versions": transactions_versions,
+    "user_docs": user_docs,
+    "email_uids": email_uids,
+    "search_indexes": search_indexes,
+}
+registry.callback("fiscus_cache_hits_total", "Cache lookups that hit",
+                  lambda: [((name,), cache.hits) for name, cache in caches.items()], ("cache",), kind="counter")
+registry.callback("fiscus_cache_misses_total", "Cache lookups that missed",
+                  lambda: [((name,), cache.misses) for name, cache in caches.items()], ("cache",), kind="counter")
+registry.callback("fiscus_cache_entries", "Entries held by the cache",
+                  lambda: [((name,), len(cache)) for name, cache in caches.items()], ("cache",))
+registry.callback("fiscus_cache_bytes", "Approximate memory held by caches with a byte limit",
+                  lambda: [((name,), cache.bytes) for name, cache in caches.items() if cache.max_bytes is not None], ("cache",))
+registry.callback("fiscus_hashing_outstanding", "bcrypt jobs running or queued",
+                  lambda: [((), hashing_pool.outstanding)])
+registry.callback("fiscus_hashing_queue_depth", "bcrypt jobs waiting for a free worker",
+                  lambda: [((), hashing_pool.stats()["queue_depth"])])
+registry.callback("fiscus_hashing_rejected_total", "bcrypt jobs rejected because the pool was full",
+                  lambda: [((), hashing_pool.rejected)], kind="counter")
+registry.callback("fiscus_mail_queued", "Mail waiting in the outbox",
+                  lambda: [((), len(mail_outbox))])
+registry.callback("fiscus_mail_written_total", "Mail documents written by the outbox",
+                  lambda: [((), mail_outbox.written)], kind="counter")
+registry.callback("fiscus_mail_dropped_total", "Mail dropped after failed writes or a full outbox",
+                  lambda: [(("write_failed",), mail_outbox.failed), (("outbox_full",), mail_outbox.rejected)],
+                  ("reason",), kind="counter")
+registry.callback("fiscus_recurring_transactions_total", "Transactions created from recurring rules, by outcome",
+                  lambda: [(("created",), recurring_scheduler.created), (("failed",), recurring_scheduler.failed)],
+                  ("outcome",), kind="counter")
+registry.callback("fiscus_stream_listeners", "Users with a change feed (a storage listener) in this process",
+                  lambda: [((), len(change_feed.feeds))])
+registry.callback("fiscus_stream_connections", "Open transaction change streams",
+                  lambda: [((), change_feed.connections)])
+registry.callback("fiscus_stream_rejected_total", "Change streams refused because the listener cap was reached",
+                  lambda: [((), change_feed.rejected)], kind="counter")
+limiters = {"code_email": code_email_limiter, "code_uid": code_uid_limiter}
+registry.callback("fiscus_rate_limited_total", "Requests refused by a rate limiter",
+                  lambda: [((name,), limiter.limited) for name, limiter in limiters.items()], ("limiter",), kind="counter")
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint; keep it off the public network"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"message": "Personal Finance API is running"}
@@ -0,0 +1,35 @@
+"""Hard-delete transactions that were soft-deleted longer ago than the retention window.
+
+Clients whose sync token predates the window are told to resync in full,
+so their copies never keep a transaction whose tombstone was purged.
+Run it daily.
+
+    python scripts/compact_tombstones.py
+    python scripts/compact_tombstones.py --retention-days 90
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import get_settings  # noqa: E402
+from app.services.firestore_service import compact_tombstones  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retention-days", type=int, default=None,
+                        help=f"defaults to TOMBSTONE_RETENTION_DAYS ({get_settings().tombstone_retention_days})")
+    args = parser.parse_args()
+
+    # Sync tokens are only expired after the configured window; purging sooner would lose deletions
+    if args.retention_days is not None and args.retention_days < get_settings().tombstone_retention_days:
+        parser.error("--retention-days cannot be shorter than TOMBSTONE_RETENTION_DAYS")
+    purged = await compact_tombstones(args.retention_days)
+    print(f"purged {purged} tombstones")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""Convert stored transaction amounts to integer minor units.
+
+Gives every transaction written before minor units an exact
+``amount_minor`` and a ``currency`` (Settings.default_currency), in
+batched writes, then rebuilds the user's rollups in minor units. Run it
+once, right after deploying minor units: until a user is converted their
+summary totals are wrong. Safe to re-run; run while the users are idle.
+
+    python scripts/migrate_minor_units.py <uid> [<uid> ...]
+    python scripts/migrate_minor_units.py --all
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.firestore_service import migrate_user_amounts  # noqa: E402
+from app.services.storage import get_storage  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("uids", nargs="*")
+    parser.add_argument("--all", action="store_true", help="convert every user with transactions")
+    args = parser.parse_args()
+
+    uids = await get_storage().list_transaction_uids() if args.all else args.uids
+    if not uids:
+        parser.error("pass at least one uid, or --all")
+
+    for uid in uids:
+        converted = await migrate_user_amounts(uid)
+        print(f"{uid}: {converted} transactions converted")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+"""Rebuild monthly spending rollups from the transactions themselves.
+
+Backfills users whose transactions predate the rollup documents, or
+repairs drift. Run while the affected users are idle.
+
+    python scripts/rebuild_rollups.py <uid> [<uid> ...]
+    python scripts/rebuild_rollups.py --all
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.firestore_service import rebuild_user_rollups  # noqa: E402
+from app.services.storage import get_storage  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("uids", nargs="*")
+    parser.add_argument("--all", action="store_true", help="rebuild every user with transactions")
+    args = parser.parse_args()
+
+    uids = await get_storage().list_transaction_uids() if args.all else args.uids
+    if not uids:
+        parser.error("pass at least one uid, or --all")
+
+    for uid in uids:
+        months = await rebuild_user_rollups(uid)
+        print(f"{uid}: {months} months")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+"""Create the transactions of every recurring rule due by a date.
+
+The API runs the same pass in the background every
+RECURRING_INTERVAL_SECONDS; run this from cron instead where that is
+turned off, or to catch up by hand. Running it again creates nothing new.
+
+    python scripts/run_recurring.py
+    python scripts/run_recurring.py --date 2025-06-30
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.recurring import recurring_scheduler  # noqa: E402
+from app.services.storage import get_storage  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="defaults to today (UTC)")
+    args = parser.parse_args()
+
+    created = await recurring_scheduler.run_due(args.date)
+    await get_storage().close()
+    print(f"created {created} transactions ({recurring_scheduler.failed} failed)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
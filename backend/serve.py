@@ -0,0 +1,74 @@
+"""Run the API on one host with several uvicorn worker processes.
+
+    python serve.py                        # Settings.web_workers, 0 meaning one per CPU core
+    python serve.py --workers 4 --port 8080
+
+Each worker has its own event loop and its own copy of everything in
+process, so requests scale with cores. What must agree between workers
+(verified tokens, user documents, transaction versions, code rate limits,
+import progress) goes through the shared cache: unless SHARED_CACHE_PATH is
+set, a fresh file on tmpfs is used for the run and removed afterwards. The
+bcrypt pool of each worker gets its share of the cores unless
+BCRYPT_WORKERS is set.
+
+/metrics reports on whichever worker answered the scrape.
+"""
+import argparse
+import os
+import tempfile
+
+import uvicorn
+
+from app.config import get_settings
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+
+def worker_count(requested: int) -> int:
+    return requested if requested > 0 else os.cpu_count() or 1
+
+def default_shared_cache_path(port: int) -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"fiscus-cache-{port}.db")
+
+def remove_database(path: str) -> None:
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.unlink(path + suffix)
+        except FileNotFoundError:
+            pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=get_settings().web_workers, help="0 for one per CPU core")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0,
+                        help="seconds open requests, change streams included, get to finish on shutdown")
+    args = parser.parse_args()
+
+    workers = worker_count(args.workers)
+    # Workers are spawned with this environment, so settings made here reach them all
+    os.environ.setdefault("BCRYPT_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+    owned_cache = None
+    if workers > 1 and not os.environ.get("SHARED_CACHE_PATH"):
+        owned_cache = default_shared_cache_path(args.port)
+        remove_database(owned_cache)
+        os.environ["SHARED_CACHE_PATH"] = owned_cache
+
+    try:
+        uvicorn.run(
+            "main:app",
+            app_dir=BACKEND,
+            host=args.host,
+            port=args.port,
+            workers=workers,
+            # RequestContextMiddleware logs every request already
+            access_log=False,
+            timeout_graceful_shutdown=args.graceful_timeout,
+        )
+    finally:
+        if owned_cache:
+            remove_database(owned_cache)
+
+if __name__ == "__main__":
+    main()